@@ -0,0 +1,202 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Dict, List, Optional
+from asgiref.wsgi import WsgiToAsgi
+from app.core import metrics
+from app.core.auth import AuthenticationError, authenticate_headers
+from app.core.config import settings
+from app.core.database import dispose_async_engine, get_async_sessionmaker
+from app.main import app as flask_app
+from app.models.generation import Generation
+from app.services.near_duplicate import describe_match, near_duplicates
+from app.services.generation_service import (
+    validate_generation_request, generation_params, generation_values, wants_async
+)
+from app.services.openai_service import get_openai_service, UNAVAILABLE_ERRORS
+from app.services.quota_service import quota_service
+from app.services.user_cache import user_cache
+from app.services.write_behind import write_behind
+
+logger = logging.getLogger(__name__)
+
+# El resto de rutas se sirven con la app Flask en un pool de hilos
+wsgi_application = WsgiToAsgi(flask_app)
+
+class JSONResponse:
+    """Respuesta JSON mínima para las rutas ASGI nativas"""
+
+    def __init__(self, payload: Dict[str, Any], status: int = 200, headers: Optional[Dict[str, str]] = None):
+        self.body = json.dumps(payload).encode("utf-8")
+        self.status = status
+        self.headers = headers or {}
+
+    async def __call__(self, send, origin: Optional[str] = None):
+        headers = [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(self.body)).encode())
+        ]
+        for name, value in self.headers.items():
+            headers.append((name.lower().encode(), value.encode()))
+        # Mismo comportamiento que Flask-CORS para los orígenes permitidos
+        if origin and (origin in settings.cors_origins or "*" in settings.cors_origins):
+            headers.append((b"access-control-allow-origin", origin.encode()))
+            headers.append((b"vary", b"Origin"))
+        await send({"type": "http.response.start", "status": self.status, "headers": headers})
+        await send({"type": "http.response.body", "body": self.body})
+
+async def application(scope, receive, send):
+    """
+    Punto de entrada ASGI. POST /api/v1/generate se atiende de forma nativa
+    con asyncio (proveedor, cuota y base de datos asíncronos), de modo que un
+    worker mantiene cientos de generaciones concurrentes. Los modos job y
+    streaming de esa ruta y el resto de la API se delegan en la app Flask.
+    """
+    if scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+        return
+
+    if scope["type"] == "http" and scope["method"] == "POST" and scope["path"] == "/api/v1/generate":
+        start = time.perf_counter()
+        body = await _read_body(receive)
+        headers = _headers(scope)
+        data = _parse_json(body)
+        if (isinstance(data, dict) and "text/event-stream" not in headers.get("accept", "")
+                and not wants_async(data, headers.get("prefer", ""))):
+            response = await generate_content(headers, data)
+            await response(send, headers.get("origin"))
+            # La ruta nativa no pasa por los hooks de Flask
+            if settings.metrics_enabled:
+                metrics.observe_http("POST", "/api/v1/generate", response.status, time.perf_counter() - start)
+            return
+        await wsgi_application(scope, _replay(body, receive), send)
+        return
+
+    await wsgi_application(scope, receive, send)
+
+async def generate_content(headers: Dict[str, str], data: Dict[str, Any]) -> JSONResponse:
+    """Generar contenido usando IA (versión asíncrona de la ruta Flask)"""
+    try:
+        user_id, _ = await authenticate_headers(flask_app, headers)
+    except AuthenticationError as e:
+        return JSONResponse(e.payload, e.status)
+
+    try:
+        error = validate_generation_request(data)
+        if error:
+            return JSONResponse({"error": error}, 400)
+
+        # Reservar una unidad de cuota de forma atómica
+        if not await quota_service.areserve(user_id):
+            if not await _user_exists(user_id):
+                return JSONResponse({"error": "Usuario no encontrado"}, 404)
+            return JSONResponse({
+                "error": "Has alcanzado tu límite mensual de generaciones. Actualiza tu plan para continuar."
+            }, 402)
+
+        try:
+            # Mismo flujo de casi duplicados que la ruta Flask (use_cache=false fuerza una generación nueva)
+            start_time = time.time()
+            params = generation_params(data)
+            similar = near_duplicates.find(user_id, data) if params["use_cache"] else None
+            result = None
+            if similar is not None and settings.near_duplicate_mode == "serve":
+                # Lee el contenido de la base de datos: en un hilo
+                result = await asyncio.to_thread(near_duplicates.cached_result, similar, start_time)
+            served = result is not None
+            if result is None:
+                result = await get_openai_service().agenerate_content(**params)
+            generation = Generation(**generation_values(user_id, data, result))
+            async with get_async_sessionmaker()() as db_session:
+                db_session.add(generation)
+                await db_session.commit()
+                await db_session.refresh(generation)
+        except BaseException:
+            await quota_service.arefund(user_id)
+            raise
+
+        if not result["cached"]:
+            near_duplicates.add_generation(generation)
+
+        # Los aciertos de cache pueden no contar contra el plan
+        if result["cached"] and not settings.cache_hits_count_against_quota:
+            await quota_service.arefund(user_id)
+
+        return JSONResponse({
+            "id": generation.id,
+            "content_type": generation.content_type,
+            "topic": generation.topic,
+            "tone": generation.tone,
+            "length": generation.length,
+            "generated_content": generation.generated_content,
+            "tokens_used": generation.tokens_used,
+            "processing_time": generation.processing_time,
+            "cached": result["cached"],
+            "coalesced": result["coalesced"],
+            "similar_generation": describe_match(similar, user_id, served),
+            "created_at": generation.created_at.isoformat() if generation.created_at else None
+        })
+
+    except UNAVAILABLE_ERRORS as e:
+        logger.warning(f"Servicio de IA no disponible: {str(e)}")
+        return JSONResponse({
+            "error": "El servicio de generación no está disponible temporalmente. Intenta de nuevo más tarde.",
+            "retry_after": e.retry_after
+        }, 503, {"Retry-After": str(e.retry_after)})
+    except Exception as e:
+        logger.error(f"Error generando contenido: {str(e)}")
+        return JSONResponse({"error": "Error interno del servidor al generar contenido"}, 500)
+
+async def _user_exists(user_id: int) -> bool:
+    # Un fallo de la cache de usuarios consulta la base de datos: en un hilo
+    return await asyncio.to_thread(user_cache.get, user_id) is not None
+
+async def _lifespan(receive, send):
+    """Arranque y parada del worker ASGI"""
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            try:
+                await asyncio.to_thread(write_behind.flush)
+                await get_openai_service().aclose()
+                await dispose_async_engine()
+            except Exception as e:
+                logger.error(f"Error cerrando el worker ASGI: {str(e)}")
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+async def _read_body(receive) -> bytes:
+    chunks: List[bytes] = []
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            break
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            break
+    return b"".join(chunks)
+
+def _replay(body: bytes, receive):
+    """`receive` que entrega de nuevo el cuerpo ya leído (para delegar en Flask)"""
+    sent = False
+
+    async def replay():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        return await receive()
+
+    return replay
+
+def _headers(scope) -> Dict[str, str]:
+    return {name.decode("latin-1").lower(): value.decode("latin-1") for name, value in scope["headers"]}
+
+def _parse_json(body: bytes) -> Optional[Any]:
+    try:
+        return json.loads(body) if body else None
+    except ValueError:
+        return None
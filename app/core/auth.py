@@ -0,0 +1,113 @@
+import asyncio
+from functools import wraps
+from typing import Mapping, Optional, Tuple
+from flask import g, jsonify, request
+from flask_jwt_extended import decode_token, get_jwt_identity, verify_jwt_in_request
+from flask_jwt_extended import get_current_user as get_jwt_user
+
+API_KEY_HEADER = "X-API-Key"
+
+def auth_required(fn):
+    """
+    Autenticar la petición con el header X-API-Key o, si no está presente,
+    con un token JWT Bearer. Deja el usuario autenticado en `g.current_user_id`.
+    """
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        raw_key = request.headers.get(API_KEY_HEADER)
+        if raw_key:
+            from app.services.api_key_service import api_key_service
+            from app.services.write_behind import write_behind
+
+            identity = api_key_service.authenticate(raw_key)
+            if identity is None:
+                return jsonify({"error": "API key inválida, revocada o expirada"}), 401
+            g.current_user_id = identity.user_id
+            g.api_key_id = identity.key_id
+            write_behind.record_api_key_use(identity.key_id)
+        else:
+            # El user_lookup_loader ya ha cargado el usuario desde la cache
+            verify_jwt_in_request()
+            g.current_user_id = get_jwt_identity()
+            g.current_user = get_jwt_user()
+            g.api_key_id = None
+        return fn(*args, **kwargs)
+
+    return wrapper
+
+def get_current_user_id():
+    """Id del usuario autenticado por `auth_required`"""
+    return g.current_user_id
+
+def get_current_user():
+    """
+    Usuario autenticado por `auth_required` (CachedUser) o None si ya no
+    existe. Se sirve desde la cache de usuarios del worker.
+    """
+    if "current_user" not in g:
+        from app.services.user_cache import user_cache
+
+        g.current_user = user_cache.get(g.current_user_id)
+    return g.current_user
+
+def request_user_id() -> Optional[int]:
+    """
+    Id del usuario de la petición actual (API key o JWT) sin exigir
+    autenticación: None si no hay credenciales o no son válidas.
+    """
+    raw_key = request.headers.get(API_KEY_HEADER)
+    if raw_key:
+        from app.services.api_key_service import api_key_service
+
+        identity = api_key_service.authenticate(raw_key)
+        return identity.user_id if identity else None
+    try:
+        verify_jwt_in_request(optional=True)
+        return get_jwt_identity()
+    except Exception:
+        return None
+
+class AuthenticationError(Exception):
+    """Credenciales ausentes o inválidas en el modo ASGI"""
+
+    def __init__(self, payload: dict, status: int):
+        super().__init__(payload)
+        self.payload = payload
+        self.status = status
+
+async def authenticate_headers(flask_app, headers: Mapping[str, str]) -> Tuple[int, Optional[int]]:
+    """
+    Equivalente asíncrono de `auth_required` para las rutas ASGI: devuelve
+    (user_id, api_key_id) o lanza AuthenticationError con la misma respuesta
+    que daría la ruta Flask. `headers` debe tener las claves en minúsculas.
+    """
+    raw_key = headers.get(API_KEY_HEADER.lower())
+    if raw_key:
+        from app.services.api_key_service import api_key_service
+        from app.services.write_behind import write_behind
+
+        # Un fallo de la cache de API keys consulta la base de datos: en un hilo
+        identity = await asyncio.to_thread(api_key_service.authenticate, raw_key)
+        if identity is None:
+            raise AuthenticationError({"error": "API key inválida, revocada o expirada"}, 401)
+        write_behind.record_api_key_use(identity.key_id)
+        return identity.user_id, identity.key_id
+
+    authorization = headers.get("authorization")
+    if not authorization:
+        raise AuthenticationError({"msg": "Missing Authorization Header"}, 401)
+    scheme, _, token = authorization.partition(" ")
+    if scheme != "Bearer" or not token:
+        raise AuthenticationError({"msg": "Bad Authorization header. Expected 'Authorization: Bearer <JWT>'"}, 422)
+
+    from jwt import ExpiredSignatureError
+    try:
+        with flask_app.app_context():
+            decoded = decode_token(token)
+    except ExpiredSignatureError:
+        raise AuthenticationError({"msg": "Token has expired"}, 401)
+    except Exception as e:
+        raise AuthenticationError({"msg": str(e)}, 422)
+    if decoded.get("type") != "access":
+        raise AuthenticationError({"msg": "Only non-refresh tokens are allowed"}, 422)
+    return decoded[flask_app.config.get("JWT_IDENTITY_CLAIM", "sub")], None
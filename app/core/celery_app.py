@@ -0,0 +1,42 @@
+from celery import Celery
+from app.core.config import settings
+
+# En modo eager las tareas se ejecutan en el mismo proceso y no hace falta Redis
+broker_url = "memory://" if settings.celery_task_always_eager else settings.celery_broker_url
+
+celery_app = Celery(
+    "generador_contenido",
+    broker=broker_url,
+    include=["app.tasks.generation_tasks", "app.tasks.analytics_tasks", "app.tasks.quota_tasks",
+             "app.tasks.search_tasks"]
+)
+
+celery_app.conf.update(
+    task_always_eager=settings.celery_task_always_eager,
+    task_eager_propagates=False,
+    task_ignore_result=True,  # el estado de los jobs se guarda en la tabla generation_jobs
+    task_serializer="json",
+    accept_content=["json"],
+    task_acks_late=True,
+    worker_prefetch_multiplier=1,
+    timezone="UTC",
+    # Tareas periódicas (el worker arranca con --beat)
+    beat_schedule={
+        "generation-reap-stale-jobs": {
+            "task": "generation.reap_stale_jobs",
+            "schedule": float(settings.generation_job_reaper_interval)
+        },
+        "analytics-rollup-usage": {
+            "task": "analytics.rollup_usage",
+            "schedule": float(settings.analytics_rollup_interval)
+        },
+        "quota-reset-monthly-usage": {
+            "task": "quota.reset_monthly_usage",
+            "schedule": float(settings.quota_reset_interval)
+        },
+        "search-index-generations": {
+            "task": "search.index_generations",
+            "schedule": float(settings.search_index_interval)
+        }
+    }
+)
@@ -0,0 +1,108 @@
+import threading
+import time
+from collections import deque
+from typing import Any, Dict
+
+class CircuitOpenError(Exception):
+    """El circuito está abierto: se falla rápido sin llamar al servicio externo"""
+
+    def __init__(self, name: str, retry_after: int):
+        super().__init__(f"Circuito '{name}' abierto, reintentar en {retry_after}s")
+        self.name = name
+        self.retry_after = retry_after
+
+class CircuitBreaker:
+    """
+    Circuit breaker por tasa de error en una ventana deslizante.
+
+    - closed: las llamadas pasan y se registra su resultado.
+    - open: si la tasa de error de la ventana supera el umbral (con un mínimo
+      de llamadas), todas las llamadas fallan con CircuitOpenError durante
+      `open_seconds`.
+    - half_open: pasado ese tiempo se deja pasar una única llamada de prueba;
+      si tiene éxito el circuito se cierra, si falla vuelve a abrirse.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, error_threshold: float, min_requests: int,
+                 window_seconds: int, open_seconds: int):
+        self.name = name
+        self.error_threshold = error_threshold
+        self.min_requests = min_requests
+        self.window_seconds = window_seconds
+        self.open_seconds = open_seconds
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._results: "deque[tuple]" = deque()
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """Comprobar si se permite la llamada. Lanza CircuitOpenError si no"""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return
+            remaining = self._opened_at + self.open_seconds - time.monotonic()
+            if self._state == self.OPEN and remaining <= 0:
+                self._state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self._state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return
+            raise CircuitOpenError(self.name, max(1, int(remaining + 0.999)))
+
+    def record_success(self):
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._close()
+            self._record(True)
+
+    def record_failure(self):
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._open()
+                return
+            self._record(False)
+            total = len(self._results)
+            failures = sum(1 for _, ok in self._results if not ok)
+            if total >= self.min_requests and failures / total >= self.error_threshold:
+                self._open()
+
+    @property
+    def state(self) -> str:
+        return self._state
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._trim(time.monotonic())
+            total = len(self._results)
+            failures = sum(1 for _, ok in self._results if not ok)
+            return {
+                "state": self._state,
+                "window_requests": total,
+                "window_errors": failures,
+                "error_rate": round(failures / total, 4) if total else 0.0
+            }
+
+    def _record(self, ok: bool):
+        now = time.monotonic()
+        self._results.append((now, ok))
+        self._trim(now)
+
+    def _trim(self, now: float):
+        while self._results and self._results[0][0] < now - self.window_seconds:
+            self._results.popleft()
+
+    def _open(self):
+        self._state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._probe_in_flight = False
+        self._results.clear()
+
+    def _close(self):
+        self._state = self.CLOSED
+        self._probe_in_flight = False
+        self._results.clear()
@@ -1,17 +1,43 @@
-from sqlalchemy import create_engine
+import time
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
+from app.core import metrics, query_monitor
 from app.core.config import settings
 
+class TimedQueuePool(QueuePool):
+    """QueuePool que mide cuánto espera cada checkout por una conexión libre"""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            metrics.DB_POOL_WAIT.observe(time.perf_counter() - start)
+
 # Crear engine de base de datos
 engine = create_engine(
     settings.database_url,
+    poolclass=TimedQueuePool,
     pool_pre_ping=True,
     pool_recycle=300,
     pool_size=10,
     max_overflow=20
 )
 
+# Consultas por petición, log de consultas lentas y detección de N+1
+query_monitor.instrument(engine)
+
+# Ocupación del pool para /metrics
+@event.listens_for(engine, "checkout")
+def _pool_checkout(dbapi_connection, connection_record, connection_proxy):
+    metrics.observe_pool(engine.pool)
+
+@event.listens_for(engine, "checkin")
+def _pool_checkin(dbapi_connection, connection_record):
+    metrics.observe_pool(engine.pool)
+
 # Crear sesión
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
@@ -24,4 +50,36 @@ def get_db():
     try:
         yield db
     finally:
-        db.close() 
\ No newline at end of file
+        db.close()
+
+_async_sessionmaker = None
+
+def async_database_url(url: str) -> str:
+    """URL equivalente con driver asíncrono (asyncpg para PostgreSQL, aiosqlite para SQLite)"""
+    if url.startswith(("postgres://", "postgresql://", "postgresql+psycopg2://")):
+        return "postgresql+asyncpg://" + url.split("://", 1)[1]
+    if url.startswith("sqlite://"):
+        return "sqlite+aiosqlite://" + url.split("://", 1)[1]
+    return url
+
+def get_async_sessionmaker():
+    """Fábrica de sesiones asíncronas (se crea al primer uso, solo en el modo ASGI)"""
+    global _async_sessionmaker
+    if _async_sessionmaker is None:
+        from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+        url = async_database_url(settings.database_url)
+        options = {"pool_pre_ping": True, "pool_recycle": 300}
+        if not url.startswith("sqlite"):
+            options.update(pool_size=settings.async_db_pool_size, max_overflow=settings.async_db_max_overflow)
+        async_engine = create_async_engine(url, **options)
+        query_monitor.instrument(async_engine.sync_engine)
+        _async_sessionmaker = async_sessionmaker(async_engine, expire_on_commit=False)
+    return _async_sessionmaker
+
+async def dispose_async_engine():
+    """Cerrar las conexiones del engine asíncrono"""
+    global _async_sessionmaker
+    if _async_sessionmaker is not None:
+        await _async_sessionmaker.kw["bind"].dispose()
+        _async_sessionmaker = None
@@ -0,0 +1,31 @@
+import threading
+from collections import deque
+from typing import Any, Dict, List
+
+def _percentile(sorted_values: List[float], fraction: float) -> float:
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+class LatencyTracker:
+    """Latencias y resultados de las últimas N operaciones"""
+
+    def __init__(self, window: int):
+        self._samples: "deque[tuple]" = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, latency_ms: float, ok: bool):
+        with self._lock:
+            self._samples.append((latency_ms, ok))
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            samples = list(self._samples)
+        latencies = sorted(latency for latency, ok in samples if ok)
+        errors = sum(1 for _, ok in samples if not ok)
+        return {
+            "samples": len(samples),
+            "p50_ms": round(_percentile(latencies, 0.5), 1) if latencies else None,
+            "p95_ms": round(_percentile(latencies, 0.95), 1) if latencies else None,
+            "p99_ms": round(_percentile(latencies, 0.99), 1) if latencies else None,
+            "error_rate": round(errors / len(samples), 4) if samples else 0.0
+        }
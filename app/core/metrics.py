@@ -0,0 +1,166 @@
+import os
+import time
+from typing import Optional, Tuple
+from app.core.config import settings
+
+# prometheus_client elige el almacenamiento de los valores al importarse:
+# el directorio multiproceso tiene que estar en el entorno antes
+if settings.prometheus_multiproc_dir:
+    os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", settings.prometheus_multiproc_dir)
+
+from prometheus_client import (  # noqa: E402
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+)
+
+# Con varios workers de gunicorn cada proceso escribe sus valores en ficheros
+# mmap de PROMETHEUS_MULTIPROC_DIR y /metrics los agrega al servir
+MULTIPROCESS = bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+
+HTTP_REQUESTS = Counter(
+    "gcai_http_requests_total", "Peticiones HTTP por ruta y código de estado",
+    ["method", "route", "status"]
+)
+HTTP_LATENCY = Histogram(
+    "gcai_http_request_duration_seconds", "Latencia de las peticiones HTTP por ruta",
+    ["method", "route"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+)
+
+AI_REQUESTS = Counter(
+    "gcai_ai_requests_total", "Llamadas a proveedores de IA por resultado (success, retryable, error)",
+    ["backend", "model", "content_type", "outcome"]
+)
+AI_LATENCY = Histogram(
+    "gcai_ai_request_duration_seconds", "Latencia de las llamadas a proveedores de IA",
+    ["backend", "model", "content_type"],
+    buckets=(0.25, 0.5, 1, 2, 4, 8, 15, 30, 60)
+)
+AI_TIME_TO_FIRST_TOKEN = Histogram(
+    "gcai_ai_time_to_first_token_seconds", "Tiempo hasta el primer fragmento en las generaciones en streaming",
+    ["backend", "model"],
+    buckets=(0.1, 0.25, 0.5, 0.75, 1, 1.5, 2, 3, 5, 10, 30)
+)
+AI_TOKENS = Counter(
+    "gcai_ai_tokens_total", "Tokens consumidos en proveedores de IA",
+    ["backend", "model", "content_type"]
+)
+
+DB_POOL_WAIT = Histogram(
+    "gcai_db_pool_checkout_wait_seconds", "Espera para obtener una conexión del pool de SQLAlchemy",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30)
+)
+DB_POOL_SIZE = Gauge(
+    "gcai_db_pool_size", "Conexiones permanentes del pool (suma de los workers vivos)",
+    multiprocess_mode="livesum"
+)
+DB_POOL_CHECKED_OUT = Gauge(
+    "gcai_db_pool_checked_out", "Conexiones del pool en uso (suma de los workers vivos)",
+    multiprocess_mode="livesum"
+)
+DB_POOL_OVERFLOW = Gauge(
+    "gcai_db_pool_overflow", "Conexiones abiertas por encima del tamaño del pool (suma de los workers vivos)",
+    multiprocess_mode="livesum"
+)
+
+DB_REQUEST_QUERIES = Histogram(
+    "gcai_db_queries_per_request", "Consultas SQL ejecutadas por petición",
+    ["route"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+)
+DB_REQUEST_TIME = Histogram(
+    "gcai_db_time_per_request_seconds", "Tiempo total en consultas SQL por petición",
+    ["route"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+)
+DB_SLOW_QUERIES = Counter(
+    "gcai_db_slow_queries_total", "Consultas SQL por encima de SQL_SLOW_QUERY_MS"
+)
+DB_N_PLUS_ONE = Counter(
+    "gcai_db_n_plus_one_total", "Formas de consulta repetidas más de SQL_N_PLUS_ONE_THRESHOLD veces en una petición",
+    ["route"]
+)
+
+CACHE_EVENTS = Counter(
+    "gcai_cache_events_total", "Aciertos, fallos y escrituras de las caches",
+    ["cache", "event"]
+)
+
+NEAR_DUPLICATE_LOOKUP = Histogram(
+    "gcai_near_duplicate_lookup_seconds", "Latencia de las búsquedas en el índice MinHash/LSH de casi duplicados",
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05)
+)
+NEAR_DUPLICATE_EVENTS = Counter(
+    "gcai_near_duplicate_events_total", "Búsquedas de casi duplicados por resultado (matches, misses, warming, served)",
+    ["result"]
+)
+
+QUOTA_RESERVATIONS = Counter(
+    "gcai_quota_reservations_total", "Reservas de cuota por resultado (reserved, rejected)",
+    ["result"]
+)
+QUOTA_REFUNDS = Counter(
+    "gcai_quota_refunded_units_total", "Unidades de cuota devueltas (generaciones fallidas o desde cache)"
+)
+
+def observe_http(method: str, route: str, status: int, seconds: float):
+    HTTP_REQUESTS.labels(method, route, str(status)).inc()
+    HTTP_LATENCY.labels(method, route).observe(seconds)
+
+def observe_ai_call(backend, content_type: str, outcome: str, seconds: float):
+    """Una llamada a un backend del router (cada intento cuenta por separado)"""
+    AI_REQUESTS.labels(backend.name, backend.provider.model, content_type, outcome).inc()
+    AI_LATENCY.labels(backend.name, backend.provider.model, content_type).observe(seconds)
+
+def observe_ai_first_token(backend, seconds: float):
+    """Primer fragmento de una respuesta en streaming (desde el inicio de la petición)"""
+    AI_TIME_TO_FIRST_TOKEN.labels(backend.name, backend.provider.model).observe(seconds)
+
+def observe_ai_tokens(backend, content_type: str, tokens: Optional[int]):
+    if tokens:
+        AI_TOKENS.labels(backend.name, backend.provider.model, content_type).inc(tokens)
+
+def observe_pool(pool):
+    """Actualizar los gauges del pool (en cada checkout y checkin)"""
+    DB_POOL_SIZE.set(pool.size())
+    DB_POOL_CHECKED_OUT.set(pool.checkedout())
+    DB_POOL_OVERFLOW.set(max(0, pool.overflow()))
+
+def count_cache(cache: str, event: str):
+    CACHE_EVENTS.labels(cache, event).inc()
+
+def count_quota(reserved: bool):
+    QUOTA_RESERVATIONS.labels("reserved" if reserved else "rejected").inc()
+
+def count_refund(units: int):
+    QUOTA_REFUNDS.inc(units)
+
+def render() -> Tuple[bytes, str]:
+    """Exposición en formato de texto de Prometheus (agregada entre procesos si aplica)"""
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+def mark_process_dead(pid: int):
+    """Descartar los gauges `live*` de un worker que ha terminado (hook child_exit de gunicorn)"""
+    if MULTIPROCESS:
+        multiprocess.mark_process_dead(pid)
+
+def init_app(app):
+    """Registrar latencia y código de estado de cada petición de la app Flask"""
+    from flask import g, request
+
+    @app.before_request
+    def _start_timer():
+        g.metrics_start = time.perf_counter()
+
+    @app.after_request
+    def _record_request(response):
+        start = g.pop("metrics_start", None)
+        if start is not None:
+            # La plantilla de la ruta, no la URL: acota la cardinalidad de las etiquetas
+            route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+            observe_http(request.method, route, response.status_code, time.perf_counter() - start)
+        return response
@@ -0,0 +1,248 @@
+import logging
+import sys
+import threading
+from datetime import datetime, timezone
+from typing import Callable, List, NamedTuple
+from sqlalchemy import (
+    JSON, Boolean, Column, DateTime, Enum, ForeignKey, Index, Integer, MetaData, String, Table, Text,
+    extract, func, insert, inspect, select, text, update
+)
+from sqlalchemy.exc import SQLAlchemyError
+from app.core.config import settings
+from app.core.database import engine
+
+logger = logging.getLogger(__name__)
+
+# Fuera de Base.metadata: create_all de los modelos no la toca
+_metadata = MetaData()
+schema_version = Table(
+    "schema_version", _metadata,
+    Column("version", Integer, primary_key=True),
+    Column("description", String, nullable=False),
+    Column("applied_at", DateTime(timezone=True), server_default=func.now())
+)
+
+# Clave del advisory lock de PostgreSQL que serializa las migraciones entre procesos
+_LOCK_ID = 7305118
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    apply: Callable
+
+# Esquema de la versión 1 tal y como era al introducir las migraciones. Es una
+# copia fija: los cambios posteriores de los modelos van en migraciones nuevas,
+# nunca aquí (una base anterior a ellos no tiene sus columnas)
+_baseline = MetaData()
+Table(
+    "users", _baseline,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("email", String, unique=True, index=True, nullable=False),
+    Column("username", String, unique=True, index=True, nullable=False),
+    Column("hashed_password", String, nullable=False),
+    Column("full_name", String, nullable=True),
+    Column("is_active", Boolean),
+    Column("is_verified", Boolean),
+    Column("role", Enum("FREE", "PRO", "ENTERPRISE", "ADMIN", name="userrole")),
+    Column("wompi_customer_id", String, nullable=True),
+    Column("wompi_subscription_id", String, nullable=True),
+    Column("monthly_generations_used", Integer),
+    Column("monthly_generations_limit", Integer),
+    Column("created_at", DateTime(timezone=True), server_default=func.now()),
+    Column("updated_at", DateTime(timezone=True))
+)
+Table(
+    "generations", _baseline,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("user_id", Integer, ForeignKey("users.id"), nullable=False),
+    Column("content_type", String, nullable=False),
+    Column("topic", String, nullable=False),
+    Column("tone", String, nullable=False),
+    Column("length", String, nullable=False),
+    Column("additional_prompt", Text, nullable=True),
+    Column("generated_content", Text, nullable=False),
+    Column("tokens_used", Integer, nullable=True),
+    Column("processing_time", Integer, nullable=True),
+    Column("model_used", String, nullable=True),
+    Column("settings", JSON, nullable=True),
+    Column("created_at", DateTime(timezone=True), server_default=func.now()),
+    Index("ix_generations_user_created_id", "user_id", "created_at", "id")
+)
+Table(
+    "api_keys", _baseline,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("user_id", Integer, ForeignKey("users.id"), nullable=False),
+    Column("key_hash", String, nullable=False, unique=True, index=True),
+    Column("key_prefix", String, nullable=False),
+    Column("name", String, nullable=False),
+    Column("is_active", Boolean),
+    Column("last_used", DateTime(timezone=True), nullable=True),
+    Column("created_at", DateTime(timezone=True), server_default=func.now()),
+    Column("expires_at", DateTime(timezone=True), nullable=True)
+)
+Table(
+    "generation_jobs", _baseline,
+    Column("id", String(36), primary_key=True),
+    Column("user_id", Integer, ForeignKey("users.id"), nullable=False, index=True),
+    Column("status", String, nullable=False),
+    Column("request_data", JSON, nullable=False),
+    Column("generation_id", Integer, ForeignKey("generations.id"), nullable=True),
+    Column("error", Text, nullable=True),
+    Column("created_at", DateTime(timezone=True), server_default=func.now()),
+    Column("started_at", DateTime(timezone=True), nullable=True),
+    Column("finished_at", DateTime(timezone=True), nullable=True)
+)
+
+def _initial_schema(connection):
+    """Tablas e índices de la versión 1 (idempotente: vale para bases ya creadas con create_all)"""
+    _baseline.create_all(bind=connection)
+    # create_all no añade índices nuevos a tablas que ya existen
+    for table in _baseline.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=connection, checkfirst=True)
+
+def _create_tables(*names):
+    """Crear tablas nuevas de los modelos con sus índices (si no existen ya)"""
+    def apply(connection):
+        from app.core.database import Base
+        from app import models  # noqa: F401
+
+        for name in names:
+            table = Base.metadata.tables[name]
+            table.create(bind=connection, checkfirst=True)
+            for index in table.indexes:
+                index.create(bind=connection, checkfirst=True)
+    return apply
+
+def _add_columns(table_name: str, *names: str):
+    """Añadir columnas nuevas de un modelo a una tabla existente (si faltan)"""
+    def apply(connection):
+        from app.core.database import Base
+        from app import models  # noqa: F401
+
+        table = Base.metadata.tables[table_name]
+        existing = {column["name"] for column in inspect(connection).get_columns(table_name)}
+        for name in names:
+            if name in existing:
+                continue
+            column_type = table.c[name].type.compile(dialect=connection.dialect)
+            connection.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {name} {column_type}"))
+    return apply
+
+def _create_index(table: Table, name: str, connection):
+    """Crear un índice del modelo por su nombre (si no existe ya)"""
+    index = next(index for index in table.indexes if index.name == name)
+    index.create(bind=connection, checkfirst=True)
+
+def _billing_cycle(connection):
+    """
+    Día de corte y periodo de uso de los usuarios existentes: el día del
+    registro y el periodo en curso (su uso actual no se reinicia)
+    """
+    from app.models.user import User
+    from app.services.usage_reset_service import billing_period_start
+
+    _add_columns("users", "billing_anchor_day", "usage_period_start")(connection)
+    connection.execute(
+        update(User.__table__)
+        .where(User.billing_anchor_day.is_(None))
+        .values(billing_anchor_day=func.coalesce(extract("day", User.created_at), 1))
+    )
+    today = datetime.now(timezone.utc).date()
+    for anchor_day in range(1, 32):
+        connection.execute(
+            update(User.__table__)
+            .where(User.billing_anchor_day == anchor_day, User.usage_period_start.is_(None))
+            .values(usage_period_start=billing_period_start(anchor_day, today))
+        )
+    # Solo el índice de esta migración: los de migraciones posteriores pueden usar columnas que aún no existen
+    _create_index(User.__table__, "ix_users_billing_anchor_period", connection)
+
+def _search_index(connection):
+    """Índice de texto completo de las generaciones (tsvector + GIN o FTS5 según el motor)"""
+    from app.services.search_service import SearchService
+
+    SearchService.create_index(connection)
+
+# Migraciones en orden de versión. Cada una recibe la conexión dentro de la
+# transacción de migrate(); las nuevas se añaden al final y nunca se editan.
+# Uso: `python -m app.core.migrations [--check]`
+MIGRATIONS: List[Migration] = [
+    Migration(1, "Esquema inicial", _initial_schema),
+    Migration(2, "Rollups de uso para analytics", _create_tables("usage_rollups", "job_state")),
+    Migration(3, "Ciclo de facturación de los usuarios", _billing_cycle),
+    Migration(4, "Búsqueda de texto completo en generaciones", _search_index),
+]
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+_checked = False
+_check_lock = threading.Lock()
+
+def current_version(connection) -> int:
+    """Versión aplicada (0 si la tabla de versiones aún no existe)"""
+    if not engine.dialect.has_table(connection, schema_version.name):
+        return 0
+    return connection.execute(select(func.max(schema_version.c.version))).scalar() or 0
+
+def migrate() -> int:
+    """Aplicar las migraciones pendientes. Devuelve la versión resultante"""
+    with engine.begin() as connection:
+        if connection.dialect.name == "postgresql":
+            # Varios workers pueden arrancar a la vez: solo uno migra
+            connection.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": _LOCK_ID})
+        _metadata.create_all(bind=connection)
+        version = current_version(connection)
+        for migration in MIGRATIONS:
+            if migration.version <= version:
+                continue
+            logger.info(f"Aplicando migración {migration.version}: {migration.description}")
+            migration.apply(connection)
+            connection.execute(insert(schema_version).values(
+                version=migration.version, description=migration.description
+            ))
+            version = migration.version
+    return version
+
+def ensure_schema() -> bool:
+    """
+    Comprobar la versión del esquema una vez por proceso y migrar si hace
+    falta (DB_AUTO_MIGRATE). Devuelve True si el esquema está al día y
+    False si está desactualizado sin migración automática; si la migración
+    falla, la excepción se propaga para que el proceso no arranque.
+    """
+    global _checked
+    if _checked:
+        return True
+    with _check_lock:
+        if _checked:
+            return True
+        try:
+            with engine.connect() as connection:
+                version = connection.execute(select(func.max(schema_version.c.version))).scalar() or 0
+        except SQLAlchemyError:
+            # La tabla de versiones no existe todavía
+            version = 0
+
+        if version < LATEST_VERSION:
+            if not settings.db_auto_migrate:
+                logger.warning(f"Esquema en la versión {version}, se esperaba {LATEST_VERSION}. "
+                               "Ejecuta `python -m app.core.migrations`")
+                return False
+            try:
+                version = migrate()
+            except Exception:
+                logger.exception(f"Error migrando la base de datos desde la versión {version}")
+                raise
+            print(f"✅ Base de datos migrada a la versión {version}")
+
+        _checked = True
+        return True
+
+if __name__ == "__main__":
+    if "--check" in sys.argv:
+        with engine.connect() as connection:
+            version = current_version(connection)
+        print(f"Versión del esquema: {version} (última: {LATEST_VERSION})")
+        sys.exit(0 if version >= LATEST_VERSION else 1)
+    print(f"✅ Esquema en la versión {migrate()}")
@@ -0,0 +1,42 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any, Optional, Tuple
+from sqlalchemy import String, tuple_, type_coerce
+from app.core.database import engine
+
+def encode_cursor(*values: Any) -> str:
+    """Codificar la posición de la última fila de una página como cursor opaco"""
+    payload = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    raw = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> Optional[list]:
+    """Decodificar un cursor. Devuelve None si no es válido"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return values if isinstance(values, list) else None
+    except (ValueError, TypeError):
+        return None
+
+def timestamp_cursor(cursor: str) -> Optional[Tuple[datetime, int]]:
+    """Decodificar un cursor (created_at, id)"""
+    values = decode_cursor(cursor)
+    if not values or len(values) != 2:
+        return None
+    try:
+        return datetime.fromisoformat(values[0]), int(values[1])
+    except (ValueError, TypeError):
+        return None
+
+def before_timestamp_cursor(created_at_column, id_column, created_at: datetime, row_id: int):
+    """
+    Condición keyset para ORDER BY created_at DESC, id DESC:
+    filas estrictamente anteriores a (created_at, id)
+    """
+    value = created_at
+    if engine.dialect.name == "sqlite":
+        # SQLite guarda las fechas como texto: comparar con el mismo formato
+        value = type_coerce(created_at.isoformat(sep=" "), String)
+    return tuple_(created_at_column, id_column) < tuple_(value, row_id)
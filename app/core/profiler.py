@@ -0,0 +1,191 @@
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import random
+import re
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = "X-Profile"
+PROFILE_ID_HEADER = "X-Profile-Id"
+
+# Ids generados por capture_id(): "<epoch ms>-<pid>-<aleatorio>"
+_ID_PATTERN = re.compile(r"^\d{13}-\d+-[0-9a-f]{8}$")
+
+class ProfileStore:
+    """
+    Buffer circular en disco de perfiles cProfile. Cada captura son dos
+    ficheros: `<id>.prof` (formato pstats, abrible con snakeviz) y
+    `<id>.json` con los metadatos y las funciones más costosas. Al superar
+    PROFILER_MAX_CAPTURES se borran las más antiguas. Los nombres incluyen el
+    pid, así que varios workers pueden compartir el directorio.
+    """
+
+    def __init__(self, directory: str, max_captures: int):
+        self.directory = directory
+        self.max_captures = max_captures
+
+    @staticmethod
+    def capture_id() -> str:
+        return f"{int(time.time() * 1000)}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+    def save(self, profile: cProfile.Profile, metadata: Dict[str, Any]) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        capture_id = self.capture_id()
+        stats = pstats.Stats(profile)
+        stats.dump_stats(self._path(capture_id, "prof"))
+        metadata = {"id": capture_id, **metadata, "top": self._top_functions(stats)}
+        # El .json se escribe al final: solo se listan capturas completas
+        tmp_path = self._path(capture_id, "json.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(metadata, f)
+        os.replace(tmp_path, self._path(capture_id, "json"))
+        self._prune()
+        return capture_id
+
+    def list(self) -> List[Dict[str, Any]]:
+        """Metadatos de las capturas, de la más reciente a la más antigua"""
+        captures = []
+        for capture_id in reversed(self._ids()):
+            try:
+                with open(self._path(capture_id, "json")) as f:
+                    metadata = json.load(f)
+            except (OSError, ValueError):
+                # Borrada por otro worker mientras se listaba
+                continue
+            metadata.pop("top", None)
+            captures.append(metadata)
+        return captures
+
+    def get(self, capture_id: str) -> Optional[Dict[str, Any]]:
+        if not _ID_PATTERN.match(capture_id):
+            return None
+        try:
+            with open(self._path(capture_id, "json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def profile_path(self, capture_id: str) -> Optional[str]:
+        """Ruta del .prof, o None si el id no es válido o ya se ha descartado"""
+        if not _ID_PATTERN.match(capture_id):
+            return None
+        path = self._path(capture_id, "prof")
+        return path if os.path.exists(path) else None
+
+    def report(self, capture_id: str, limit: int = 40) -> Optional[str]:
+        """Informe de texto de pstats ordenado por tiempo acumulado"""
+        path = self.profile_path(capture_id)
+        if path is None:
+            return None
+        output = io.StringIO()
+        pstats.Stats(path, stream=output).sort_stats("cumulative").print_stats(limit)
+        return output.getvalue()
+
+    def _ids(self) -> List[str]:
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        # El prefijo en milisegundos ordena por antigüedad
+        return sorted(name[:-len(".json")] for name in names if name.endswith(".json"))
+
+    def _prune(self):
+        ids = self._ids()
+        for capture_id in ids[:max(0, len(ids) - self.max_captures)]:
+            for extension in ("json", "prof"):
+                try:
+                    os.remove(self._path(capture_id, extension))
+                except FileNotFoundError:
+                    pass
+
+    def _path(self, capture_id: str, extension: str) -> str:
+        return os.path.join(self.directory, f"{capture_id}.{extension}")
+
+    @staticmethod
+    def _top_functions(stats: pstats.Stats, limit: int = 15) -> List[Dict[str, Any]]:
+        rows = []
+        for (filename, line, function), (_, ncalls, tottime, cumtime, _) in stats.stats.items():
+            rows.append({
+                "function": f"{os.path.basename(filename)}:{line}({function})",
+                "ncalls": ncalls,
+                "tottime_ms": round(tottime * 1000, 2),
+                "cumtime_ms": round(cumtime * 1000, 2)
+            })
+        rows.sort(key=lambda row: row["cumtime_ms"], reverse=True)
+        return rows[:limit]
+
+profile_store = ProfileStore(settings.profiler_dir, settings.profiler_max_captures)
+
+def _requested_by_admin() -> bool:
+    """La petición trae credenciales válidas de un administrador"""
+    from app.core.auth import request_user_id
+    from app.models.user import UserRole
+    from app.services.user_cache import user_cache
+
+    user_id = request_user_id()
+    user = user_cache.get(user_id) if user_id is not None else None
+    return user is not None and user.role == UserRole.ADMIN.value
+
+def init_app(app):
+    """
+    Perfilar peticiones con cProfile: las que traen el header X-Profile de
+    un administrador y una fracción PROFILER_SAMPLE_RATE del resto. Con
+    PROFILER_ENABLED=False no se registra ningún hook (coste nulo).
+    """
+    if not settings.profiler_enabled:
+        return
+
+    from flask import g, request
+
+    @app.before_request
+    def _start_profile():
+        if request.headers.get(PROFILE_HEADER):
+            trigger = "header" if _requested_by_admin() else None
+        elif settings.profiler_sample_rate > 0 and random.random() < settings.profiler_sample_rate:
+            trigger = "sample"
+        else:
+            trigger = None
+        if trigger is None:
+            return
+        profile = cProfile.Profile()
+        g.profile = (profile, trigger, time.perf_counter())
+        profile.enable()
+
+    # Registrado el primero, after_request lo ejecuta el último: incluye los demás hooks
+    @app.after_request
+    def _save_profile(response):
+        capture = g.pop("profile", None)
+        if capture is None:
+            return response
+        profile, trigger, start = capture
+        profile.disable()
+        try:
+            capture_id = profile_store.save(profile, {
+                "method": request.method,
+                "path": request.path,
+                "route": request.url_rule.rule if request.url_rule is not None else None,
+                "status": response.status_code,
+                "duration_ms": round((time.perf_counter() - start) * 1000, 1),
+                "trigger": trigger,
+                "pid": os.getpid(),
+                "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+            })
+            response.headers[PROFILE_ID_HEADER] = capture_id
+        except Exception as e:
+            logger.error(f"Error guardando el perfil de la petición: {str(e)}")
+        return response
+
+    @app.teardown_request
+    def _stop_profile(error=None):
+        # Si la petición terminó sin pasar por after_request
+        capture = g.pop("profile", None)
+        if capture is not None:
+            capture[0].disable()
@@ -0,0 +1,129 @@
+import logging
+import re
+import time
+from collections import Counter as CounterDict
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Optional
+from sqlalchemy import event
+from app.core import metrics
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*(?:\?|%\(\w+\)s|\$\d+|:\w+)(?:\s*,\s*(?:\?|%\(\w+\)s|\$\d+|:\w+))+\s*\)")
+_NAMED_PLACEHOLDER = re.compile(r"%\(\w+\)s|\$\d+|(?<!:):\w+")
+
+@lru_cache(maxsize=2048)
+def normalize(statement: str) -> str:
+    """
+    Forma de una sentencia SQL sin literales: los parámetros pasan a `?` y
+    las listas de IN se colapsan, de modo que la misma consulta con valores
+    distintos tiene la misma forma.
+    """
+    shape = _WHITESPACE.sub(" ", statement).strip()
+    shape = _STRING_LITERAL.sub("?", shape)
+    shape = _NUMBER_LITERAL.sub("?", shape)
+    shape = _PLACEHOLDER_LIST.sub("(?)", shape)
+    return _NAMED_PLACEHOLDER.sub("?", shape)
+
+class RequestQueries:
+    """Consultas ejecutadas durante una petición"""
+
+    __slots__ = ("count", "duration", "connections", "shapes")
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.connections = 0
+        self.shapes = CounterDict()
+
+    def record(self, statement: str, elapsed: float):
+        self.count += 1
+        self.duration += elapsed
+        self.shapes[normalize(statement)] += 1
+
+    def repeated(self, threshold: int):
+        """Formas ejecutadas más de `threshold` veces (posible N+1)"""
+        return [(shape, count) for shape, count in self.shapes.most_common() if count > threshold]
+
+# Contexto de la petición en curso (None fuera de una petición)
+_current: ContextVar[Optional[RequestQueries]] = ContextVar("request_queries", default=None)
+
+def current() -> Optional[RequestQueries]:
+    return _current.get()
+
+def instrument(engine):
+    """Registrar los eventos de medición en un engine (síncrono o `async_engine.sync_engine`)"""
+    if not settings.sql_instrumentation_enabled:
+        return
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "checkout", _checkout)
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # En el contexto de la sentencia, no en la conexión: si la sentencia falla,
+    # after_cursor_execute no se llama y no queda nada en la conexión del pool
+    context._query_start = time.perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, "_query_start", None)
+    if start is None:
+        return
+    elapsed = time.perf_counter() - start
+    stats = _current.get()
+    if stats is not None:
+        stats.record(statement, elapsed)
+    if elapsed * 1000 >= settings.sql_slow_query_ms:
+        metrics.DB_SLOW_QUERIES.inc()
+        logger.warning(f"Consulta lenta ({elapsed * 1000:.1f} ms): {normalize(statement)}")
+
+def _checkout(dbapi_connection, connection_record, connection_proxy):
+    stats = _current.get()
+    if stats is not None:
+        stats.connections += 1
+
+def init_app(app):
+    """
+    Contar consultas y tiempo de base de datos por petición. Con DEBUG la
+    respuesta incluye `Server-Timing: db;dur=...`. Avisa en el log cuando una
+    petición repite la misma forma de consulta más de SQL_N_PLUS_ONE_THRESHOLD
+    veces.
+    """
+    if not settings.sql_instrumentation_enabled:
+        return
+
+    from flask import request
+
+    @app.before_request
+    def _start_queries():
+        _current.set(RequestQueries())
+
+    @app.after_request
+    def _finish_queries(response):
+        stats = _current.get()
+        if stats is None:
+            return response
+        _current.set(None)
+
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        metrics.DB_REQUEST_QUERIES.labels(route).observe(stats.count)
+        metrics.DB_REQUEST_TIME.labels(route).observe(stats.duration)
+
+        for shape, count in stats.repeated(settings.sql_n_plus_one_threshold):
+            metrics.DB_N_PLUS_ONE.labels(route).inc()
+            logger.warning(f"Posible N+1 en {request.method} {route}: {count} ejecuciones de {shape}")
+
+        if settings.debug:
+            response.headers.add(
+                "Server-Timing",
+                f'db;dur={stats.duration * 1000:.1f};desc="{stats.count} queries, {stats.connections} conn"'
+            )
+        return response
+
+    @app.teardown_request
+    def _reset_queries(error=None):
+        _current.set(None)
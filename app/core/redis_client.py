@@ -0,0 +1,49 @@
+import logging
+import threading
+import time
+from typing import Optional
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_client = None
+_client_lock = threading.Lock()
+_unavailable_until = 0.0
+
+def get_redis():
+    """
+    Obtener el cliente Redis compartido del proceso.
+    Devuelve None si Redis no está disponible para que los llamadores
+    puedan continuar sin la capa compartida.
+    """
+    global _client
+
+    if time.monotonic() < _unavailable_until:
+        return None
+
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                try:
+                    import redis
+                except ImportError:
+                    logger.warning("Paquete redis no instalado, capa Redis deshabilitada")
+                    mark_redis_unavailable()
+                    return None
+
+                _client = redis.Redis.from_url(
+                    settings.redis_url,
+                    socket_timeout=settings.redis_socket_timeout,
+                    socket_connect_timeout=settings.redis_socket_timeout,
+                    health_check_interval=30
+                )
+
+    return _client
+
+def mark_redis_unavailable(error: Optional[Exception] = None):
+    """Dejar de usar Redis durante `redis_retry_after` segundos tras un fallo"""
+    global _unavailable_until
+
+    if error is not None:
+        logger.warning(f"Redis no disponible: {str(error)}")
+    _unavailable_until = time.monotonic() + settings.redis_retry_after
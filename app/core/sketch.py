@@ -0,0 +1,73 @@
+import json
+import math
+from typing import Dict, Optional
+
+class QuantileSketch:
+    """
+    Sketch de cuantiles con error relativo acotado (estilo DDSketch): cada
+    valor positivo cae en el bucket ceil(log_gamma(x)). Dos sketches se
+    combinan sumando sus buckets, así que los de cada día se agregan en el
+    mes, o entre usuarios, con la misma precisión que si se hubieran
+    construido con todos los valores.
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01, bins: Optional[Dict[int, int]] = None, zeros: int = 0):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.bins: Dict[int, int] = bins or {}
+        self.zeros = zeros  # valores <= 0
+
+    @property
+    def count(self) -> int:
+        return self.zeros + sum(self.bins.values())
+
+    def add(self, value: float, count: int = 1):
+        if value is None:
+            return
+        if value <= 0:
+            self.zeros += count
+            return
+        index = math.ceil(math.log(value) / self._log_gamma)
+        self.bins[index] = self.bins.get(index, 0) + count
+
+    def merge(self, other: "QuantileSketch"):
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("No se pueden combinar sketches con distinta precisión")
+        self.zeros += other.zeros
+        for index, count in other.bins.items():
+            self.bins[index] = self.bins.get(index, 0) + count
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Valor aproximado del cuantil q (0-1), con error relativo <= relative_accuracy"""
+        total = self.count
+        if total == 0:
+            return None
+        rank = q * (total - 1)
+        seen = self.zeros
+        if rank < seen:
+            return 0.0
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if rank < seen:
+                # Punto medio del bucket (gamma^(i-1), gamma^i]
+                return 2 * self.gamma ** index / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.bins) / (self.gamma + 1)
+
+    def to_json(self) -> str:
+        return json.dumps({
+            "a": self.relative_accuracy,
+            "z": self.zeros,
+            "b": {str(index): count for index, count in self.bins.items()}
+        }, separators=(",", ":"))
+
+    @classmethod
+    def from_json(cls, raw: Optional[str]) -> "QuantileSketch":
+        if not raw:
+            return cls()
+        data = json.loads(raw)
+        return cls(
+            relative_accuracy=data.get("a", 0.01),
+            bins={int(index): count for index, count in data.get("b", {}).items()},
+            zeros=data.get("z", 0)
+        )
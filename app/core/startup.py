@@ -0,0 +1,114 @@
+import argparse
+import importlib
+import json
+import logging
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from typing import Any, Dict, Iterable
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Dependencias que la app importa al primer uso y no al arrancar
+HEAVY_MODULES = ("openai", "aiohttp", "httpx", "redis", "celery")
+
+# Se ejecuta en un intérprete limpio para medir un arranque en frío real
+_FIRST_REQUEST_SCRIPT = """
+import json, time
+start = time.perf_counter()
+from {module} import app
+imported = time.perf_counter()
+response = app.test_client().get("/health")
+assert response.status_code == 200, response.status_code
+print(json.dumps({{"import_ms": (imported - start) * 1000,
+                  "first_request_ms": (time.perf_counter() - start) * 1000}}))
+"""
+
+def warm_up(modules: Iterable[str] = HEAVY_MODULES) -> Dict[str, float]:
+    """
+    Importar por adelantado las dependencias pesadas. Se llama en el máster
+    de gunicorn antes de crear los workers: los workers (también los que se
+    reciclan con max_requests) las heredan ya cargadas.
+    """
+    timings = {}
+    for name in modules:
+        start = time.perf_counter()
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            continue
+        timings[name] = round((time.perf_counter() - start) * 1000, 1)
+    return timings
+
+def import_report(module: str = "app.main", top: int = 15) -> Dict[str, Any]:
+    """
+    Coste de importación por paquete de primer nivel, a partir de
+    `python -X importtime`, en un intérprete nuevo.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+
+    by_package = defaultdict(int)
+    total_us = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        name = name.strip()
+        by_package[name.split(".")[0]] += int(self_us)
+        if name == module:
+            total_us = int(cumulative_us)
+
+    packages = sorted(by_package.items(), key=lambda item: item[1], reverse=True)[:top]
+    return {
+        "module": module,
+        "total_ms": round(total_us / 1000, 1),
+        "packages": [{"package": name, "self_ms": round(us / 1000, 1)} for name, us in packages]
+    }
+
+def first_request_report(module: str = "app.main") -> Dict[str, float]:
+    """Tiempo de importación y hasta la primera respuesta (/health) en un intérprete nuevo"""
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-c", _FIRST_REQUEST_SCRIPT.format(module=module)],
+        capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    timings["process_ms"] = (time.perf_counter() - start) * 1000
+    return {name: round(value, 1) for name, value in timings.items()}
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Informe de tiempo de arranque en frío")
+    parser.add_argument("--module", default="app.main", help="Módulo de la app Flask")
+    parser.add_argument("--top", type=int, default=15, help="Paquetes a mostrar")
+    parser.add_argument("--target-ms", type=int, default=settings.startup_target_ms,
+                        help="Objetivo hasta la primera respuesta (STARTUP_TARGET_MS)")
+    parser.add_argument("--json", action="store_true", help="Salida en JSON")
+    args = parser.parse_args(argv)
+
+    report = import_report(args.module, args.top)
+    report.update(first_request_report(args.module))
+    report["target_ms"] = args.target_ms
+    report["within_target"] = report["first_request_ms"] <= args.target_ms
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"Importación de {args.module}: {report['total_ms']} ms")
+        for item in report["packages"]:
+            print(f"  {item['package']:<28} {item['self_ms']:>8} ms")
+        print(f"Primera respuesta: {report['first_request_ms']} ms "
+              f"(proceso completo {report['process_ms']} ms, objetivo {args.target_ms} ms)")
+        print("✅ Dentro del objetivo" if report["within_target"] else "⚠️ Por encima del objetivo")
+    return 0 if report["within_target"] else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
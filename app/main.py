@@ -1,17 +1,40 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, Response, request, jsonify, render_template, send_file, stream_with_context
 from flask_cors import CORS
-from flask_sqlalchemy import SQLAlchemy
-from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
-from flask_bcrypt import Bcrypt
+from flask_jwt_extended import JWTManager, create_access_token
+import json
 import logging
 import os
-from datetime import datetime, timedelta
+import time
+from datetime import date, datetime, timedelta, timezone
+from urllib.parse import urlencode
 from app.core.config import settings
-from app.services.openai_service import OpenAIService
+from app.services.openai_service import get_openai_service, UNAVAILABLE_ERRORS
+from app.services.cache_service import response_cache
+from app.services.singleflight import singleflight
+from app.services.quota_service import quota_service
+from app.services.api_key_service import api_key_service
+from app.services.write_behind import write_behind
+from app.services.password_service import password_hasher, HashQueueFullError
+from app.services.user_cache import user_cache
+from app.services.analytics_service import analytics_service, GROUP_BY_FIELDS
+from app.services.search_service import search_service, SearchUnavailableError
+from app.services.near_duplicate import describe_match, near_duplicates
+from app.services.generation_service import (
+    validate_generation_request, generation_params, generation_values, build_generation, generate_many,
+    wants_async
+)
 from app.models.user import User, UserRole
 from app.models.generation import Generation
-from app.core.database import engine, SessionLocal
-from app.models import user, generation as generation_model, api_key
+from app.models.generation_job import GenerationJob, JobStatus
+from app.models.api_key import APIKey
+from app.models.usage_rollup import ALL_USERS, RollupGranularity
+from app.core.database import SessionLocal
+from app.core.migrations import ensure_schema
+from app.core import metrics, profiler, query_monitor
+from app.core.profiler import profile_store
+from app.core.auth import auth_required, get_current_user, get_current_user_id
+from sqlalchemy import func, insert, or_, select
+from app.core.pagination import encode_cursor, decode_cursor, timestamp_cursor, before_timestamp_cursor
 
 # Configurar logging
 logging.basicConfig(
@@ -24,32 +47,39 @@ app = Flask(__name__)
 
 # Configuración
 app.config['SECRET_KEY'] = settings.secret_key
-app.config['SQLALCHEMY_DATABASE_URI'] = settings.database_url
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['JWT_SECRET_KEY'] = settings.jwt_secret_key
 app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(minutes=settings.access_token_expire_minutes)
 
 # Inicializar extensiones
-db = SQLAlchemy(app)
 jwt = JWTManager(app)
-bcrypt = Bcrypt(app)
 
 # Configurar CORS
 CORS(app, origins=settings.cors_origins)
 
-# Crear tablas solo si no existen (optimización)
-def init_db():
-    try:
-        with app.app_context():
-            user.Base.metadata.create_all(bind=engine)
-            generation_model.Base.metadata.create_all(bind=engine)
-            api_key.Base.metadata.create_all(bind=engine)
-            print("✅ Base de datos inicializada")
-    except Exception as e:
-        print(f"⚠️ Error inicializando DB: {e}")
+# Profiler bajo demanda (antes que el resto de hooks para que los incluya)
+profiler.init_app(app)
+
+# Consultas SQL por petición
+query_monitor.init_app(app)
+
+# Latencia y códigos de estado por ruta para /metrics
+if settings.metrics_enabled:
+    metrics.init_app(app)
+
+@jwt.user_lookup_loader
+def load_jwt_user(jwt_header, jwt_data):
+    """Usuario del token JWT desde la cache de usuarios (sin consulta por petición)"""
+    return user_cache.get(jwt_data[app.config.get('JWT_IDENTITY_CLAIM', 'sub')])
+
+@jwt.user_lookup_error_loader
+def jwt_user_not_found(jwt_header, jwt_data):
+    return jsonify({"error": "Usuario no encontrado"}), 404
 
-# Inicializar DB de forma asíncrona
-init_db()
+# Comprobar la versión del esquema: una consulta si está al día, migraciones si no
+# (con preload_app de gunicorn se hace una sola vez en el proceso máster).
+# Con el esquema desactualizado o una migración fallida el proceso no arranca
+if not ensure_schema():
+    raise RuntimeError("Esquema de la base de datos desactualizado: ejecuta `python -m app.core.migrations`")
 
 @app.route('/')
 def index():
@@ -65,6 +95,17 @@ def health_check():
         "version": "1.0.0"
     })
 
+@app.route('/metrics')
+def get_metrics():
+    """Métricas en formato Prometheus (agregadas entre los workers de gunicorn)"""
+    if not settings.metrics_enabled:
+        return jsonify({"error": "Métricas deshabilitadas"}), 404
+    if settings.metrics_token and request.headers.get('Authorization') != f"Bearer {settings.metrics_token}":
+        return jsonify({"error": "Token de métricas inválido"}), 401
+    
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
+
 @app.route('/api/v1/plans')
 def get_plans():
     """Obtener información de planes disponibles"""
@@ -113,6 +154,7 @@ def get_plans():
 @app.route('/api/v1/auth/register', methods=['POST'])
 def register():
     """Registrar nuevo usuario"""
+    db_session = SessionLocal()
     try:
         data = request.get_json()
         
@@ -125,20 +167,18 @@ def register():
         if not re.match(r"[^@]+@[^@]+\.[^@]+", data['email']):
             return jsonify({"error": "Email inválido"}), 400
         
-        db_session = SessionLocal()
         
-        # Verificar si el email ya existe
-        existing_user = db_session.query(User).filter(User.email == data['email']).first()
-        if existing_user:
+        # Verificar email y username con una sola consulta
+        taken = db_session.query(User.email, User.username).filter(
+            or_(User.email == data['email'], User.username == data['username'])
+        ).all()
+        if any(email == data['email'] for email, _ in taken):
             return jsonify({"error": "El email ya está registrado"}), 400
-        
-        # Verificar si el username ya existe
-        existing_username = db_session.query(User).filter(User.username == data['username']).first()
-        if existing_username:
+        if taken:
             return jsonify({"error": "El nombre de usuario ya está en uso"}), 400
         
-        # Crear usuario
-        hashed_password = bcrypt.generate_password_hash(data['password']).decode('utf-8')
+        # Crear usuario (el hash se calcula en el pool de procesos)
+        hashed_password = password_hasher.hash(data['password'])
         user = User(
             email=data['email'],
             username=data['username'],
@@ -166,6 +206,8 @@ def register():
             }
         }), 201
         
+    except HashQueueFullError as e:
+        return _hash_queue_full_response(e.retry_after)
     except Exception as e:
         logging.error(f"Error registrando usuario: {str(e)}")
         return jsonify({"error": "Error interno del servidor"}), 500
@@ -175,22 +217,34 @@ def register():
 @app.route('/api/v1/auth/login', methods=['POST'])
 def login():
     """Iniciar sesión"""
+    start = time.perf_counter()
+    completed = False
+    db_session = SessionLocal()
     try:
         data = request.get_json()
         
         if not all(key in data for key in ['email', 'password']):
             return jsonify({"error": "Email y contraseña son requeridos"}), 400
         
-        db_session = SessionLocal()
         user = db_session.query(User).filter(User.email == data['email']).first()
         
-        if not user or not bcrypt.check_password_hash(user.hashed_password, data['password']):
+        if not user or not password_hasher.verify(data['password'], user.hashed_password):
+            completed = True
             return jsonify({"error": "Email o contraseña incorrectos"}), 401
         
         if not user.is_active:
+            completed = True
             return jsonify({"error": "Usuario inactivo"}), 400
         
+        # Actualizar el hash si se generó con otro coste (BCRYPT_ROUNDS)
+        if password_hasher.needs_rehash(user.hashed_password):
+            new_hash = password_hasher.rehash(data['password'])
+            if new_hash:
+                user.hashed_password = new_hash
+                db_session.commit()
+        
         access_token = create_access_token(identity=user.id)
+        completed = True
         
         return jsonify({
             "access_token": access_token,
@@ -204,112 +258,105 @@ def login():
             }
         })
         
+    except HashQueueFullError as e:
+        return _hash_queue_full_response(e.retry_after)
     except Exception as e:
         logging.error(f"Error en login: {str(e)}")
         return jsonify({"error": "Error interno del servidor"}), 500
     finally:
         db_session.close()
+        # Latencia de login medida aparte (los 429 y 500 cuentan como error)
+        password_hasher.login_latency.record((time.perf_counter() - start) * 1000, ok=completed)
 
 @app.route('/api/v1/auth/me')
-@jwt_required()
+@auth_required
 def get_current_user_info():
     """Obtener información del usuario actual"""
     try:
-        user_id = get_jwt_identity()
-        db_session = SessionLocal()
-        user = db_session.query(User).filter(User.id == user_id).first()
+        user = get_current_user()
         
         if not user:
             return jsonify({"error": "Usuario no encontrado"}), 404
         
+        # El uso cambia en cada generación: se lee del contador de cuota
+        used, limit = quota_service.get_usage(user.id) or (0, user.monthly_generations_limit)
+        
         return jsonify({
             "id": user.id,
             "email": user.email,
             "username": user.username,
             "full_name": user.full_name,
             "is_active": user.is_active,
-            "role": user.role.value,
-            "monthly_generations_used": user.monthly_generations_used,
-            "monthly_generations_limit": user.monthly_generations_limit
+            "role": user.role,
+            "monthly_generations_used": used,
+            "monthly_generations_limit": limit
         })
         
     except Exception as e:
         logging.error(f"Error obteniendo usuario: {str(e)}")
         return jsonify({"error": "Error interno del servidor"}), 500
-    finally:
-        db_session.close()
 
 @app.route('/api/v1/generate', methods=['POST'])
-@jwt_required()
+@auth_required
 def generate_content():
     """Generar contenido usando IA"""
     try:
-        user_id = get_jwt_identity()
         data = request.get_json()
         
         db_session = SessionLocal()
-        user = db_session.query(User).filter(User.id == user_id).first()
+        user = get_current_user()
         
         if not user:
             return jsonify({"error": "Usuario no encontrado"}), 404
         
-        # Verificar límites del usuario
-        if not user.can_generate():
-            return jsonify({
-                "error": "Has alcanzado tu límite mensual de generaciones. Actualiza tu plan para continuar."
-            }), 402
+        # Validar parámetros de la generación
+        error = validate_generation_request(data)
+        if error:
+            return jsonify({"error": error}), 400
         
-        # Validar datos requeridos
-        required_fields = ['content_type', 'topic', 'tone', 'length']
-        if not all(field in data for field in required_fields):
-            return jsonify({"error": "Faltan campos requeridos"}), 400
+        # Reservar una unidad de cuota de forma atómica
+        user_id = user.id
+        if not quota_service.reserve(user_id):
+            return _quota_exceeded_response()
         
-        # Validar tipo de contenido
-        valid_types = ["post_social", "email", "description", "title", "blog_post"]
-        if data['content_type'] not in valid_types:
-            return jsonify({"error": f"Tipo de contenido no válido. Opciones: {', '.join(valid_types)}"}), 400
-        
-        # Validar tono
-        valid_tones = ["profesional", "casual", "amigable", "formal", "creativo", "persuasivo"]
-        if data['tone'] not in valid_tones:
-            return jsonify({"error": f"Tono no válido. Opciones: {', '.join(valid_tones)}"}), 400
-        
-        # Validar longitud
-        valid_lengths = ["corta", "media", "larga"]
-        if data['length'] not in valid_lengths:
-            return jsonify({"error": f"Longitud no válida. Opciones: {', '.join(valid_lengths)}"}), 400
-        
-        # Generar contenido
-        openai_service = OpenAIService()
-        result = openai_service.generate_content(
-            content_type=data['content_type'],
-            topic=data['topic'],
-            tone=data['tone'],
-            length=data['length'],
-            additional_prompt=data.get('additional_prompt')
-        )
+        # Modo asíncrono: encolar el job y responder 202 de inmediato
+        if wants_async(data, request.headers.get('Prefer', '')):
+            return _enqueue_generation_job(db_session, user_id, data)
         
-        # Guardar en base de datos
-        generation = Generation(
-            user_id=user.id,
-            content_type=data['content_type'],
-            topic=data['topic'],
-            tone=data['tone'],
-            length=data['length'],
-            additional_prompt=data.get('additional_prompt'),
-            generated_content=result["content"],
-            tokens_used=result["tokens_used"],
-            processing_time=result["processing_time"],
-            model_used=result["model_used"]
-        )
+        # No mantener la conexión a la base de datos durante la llamada a la IA
+        db_session.close()
         
-        db_session.add(generation)
+        # Modo streaming (Server-Sent Events)
+        if 'text/event-stream' in request.headers.get('Accept', ''):
+            return _stream_generation(user_id, data)
         
-        # Incrementar contador de uso del usuario
-        user.increment_usage()
+        try:
+            # Generar contenido (use_cache=false fuerza una generación nueva)
+            start_time = time.time()
+            params = generation_params(data)
+            similar = near_duplicates.find(user_id, data) if params["use_cache"] else None
+            result = None
+            if similar is not None and settings.near_duplicate_mode == "serve":
+                result = near_duplicates.cached_result(similar, start_time)
+            served = result is not None
+            if result is None:
+                result = get_openai_service().generate_content(**params)
+            
+            # Guardar en base de datos
+            generation = build_generation(user_id, data, result)
+            db_session.add(generation)
+            db_session.commit()
+            db_session.refresh(generation)
+        except Exception:
+            quota_service.refund(user_id)
+            raise
         
-        db_session.commit()
-        db_session.refresh(generation)
+        if not result["cached"]:
+            near_duplicates.add_generation(generation)
+        
+        # Los aciertos de cache pueden no contar contra el plan
+        if result["cached"] and not settings.cache_hits_count_against_quota:
+            quota_service.refund(user_id)
         
         return jsonify({
             "id": generation.id,
@@ -320,45 +367,372 @@ def generate_content():
             "generated_content": generation.generated_content,
             "tokens_used": generation.tokens_used,
             "processing_time": generation.processing_time,
+            "cached": result["cached"],
+            "coalesced": result["coalesced"],
+            "similar_generation": describe_match(similar, user_id, served),
             "created_at": generation.created_at.isoformat() if generation.created_at else None
         })
         
+    except UNAVAILABLE_ERRORS as e:
+        logging.warning(f"Servicio de IA no disponible: {str(e)}")
+        return _service_unavailable_response(e.retry_after)
     except Exception as e:
         logging.error(f"Error generando contenido: {str(e)}")
         return jsonify({"error": "Error interno del servidor al generar contenido"}), 500
     finally:
         db_session.close()
 
+@app.route('/api/v1/generate/stream', methods=['POST'])
+@auth_required
+def generate_content_stream():
+    """Generar contenido usando IA con respuesta en streaming (SSE)"""
+    try:
+        data = request.get_json()
+        
+        user = get_current_user()
+        
+        if not user:
+            return jsonify({"error": "Usuario no encontrado"}), 404
+        
+        error = validate_generation_request(data)
+        if error:
+            return jsonify({"error": error}), 400
+        
+        if not quota_service.reserve(user.id):
+            return _quota_exceeded_response()
+        
+        return _stream_generation(user.id, data)
+        
+    except Exception as e:
+        logging.error(f"Error generando contenido en streaming: {str(e)}")
+        return jsonify({"error": "Error interno del servidor al generar contenido"}), 500
+
+@app.route('/api/v1/generate/batch', methods=['POST'])
+@auth_required
+def generate_content_batch():
+    """Generar varios contenidos en una sola petición"""
+    try:
+        data = request.get_json() or {}
+        items = data.get('items')
+        
+        if not isinstance(items, list) or not items:
+            return jsonify({"error": "Se requiere una lista 'items' con al menos una generación"}), 400
+        
+        if len(items) > settings.batch_max_items:
+            return jsonify({"error": f"Máximo {settings.batch_max_items} generaciones por lote"}), 400
+        
+        db_session = SessionLocal()
+        user = get_current_user()
+        
+        if not user:
+            return jsonify({"error": "Usuario no encontrado"}), 404
+        
+        # Validar cada elemento; los inválidos se reportan sin abortar el lote
+        results = [None] * len(items)
+        valid_indexes = []
+        for index, item in enumerate(items):
+            error = validate_generation_request(item if isinstance(item, dict) else None)
+            if error:
+                results[index] = {"index": index, "status": "failed", "error": error}
+            else:
+                valid_indexes.append(index)
+        
+        # Reservar la cuota de todo el lote de una sola vez
+        user_id = user.id
+        if not quota_service.reserve(user_id, len(valid_indexes)):
+            used, limit = quota_service.get_usage(user_id)
+            return jsonify({
+                "error": "El lote supera tu límite mensual de generaciones. Actualiza tu plan para continuar.",
+                "remaining_generations": max(0, limit - used)
+            }), 402
+        db_session.close()
+        
+        # Llamadas a la IA en paralelo con un pool acotado
+        valid_items = [items[index] for index in valid_indexes]
+        outcomes = generate_many(get_openai_service(), valid_items, settings.batch_max_workers)
+        
+        rows = []
+        row_indexes = []
+        refunds = 0
+        for index, item, outcome in zip(valid_indexes, valid_items, outcomes):
+            if "error" in outcome:
+                logging.error(f"Error generando elemento {index} del lote: {outcome['error']}")
+                results[index] = {"index": index, "status": "failed", "error": "Error al generar contenido"}
+                refunds += 1
+                continue
+            result = outcome["result"]
+            if result["cached"] and not settings.cache_hits_count_against_quota:
+                refunds += 1
+            rows.append(generation_values(user_id, item, result))
+            row_indexes.append((index, result["cached"]))
+        
+        # Inserción masiva de todas las generaciones y un único commit
+        if rows:
+            try:
+                inserted = db_session.execute(
+                    insert(Generation).returning(Generation.id, Generation.created_at, sort_by_parameter_order=True),
+                    rows
+                ).all()
+                db_session.commit()
+            except Exception:
+                quota_service.refund(user_id, len(valid_indexes))
+                raise
+            
+            for (index, cached), row, (generation_id, created_at) in zip(row_indexes, rows, inserted):
+                results[index] = {
+                    "index": index,
+                    "status": "completed",
+                    "generation": {
+                        "id": generation_id,
+                        "content_type": row["content_type"],
+                        "topic": row["topic"],
+                        "tone": row["tone"],
+                        "length": row["length"],
+                        "generated_content": row["generated_content"],
+                        "tokens_used": row["tokens_used"],
+                        "processing_time": row["processing_time"],
+                        "cached": cached,
+                        "created_at": created_at.isoformat() if created_at else None
+                    }
+                }
+        
+        # Devolver la cuota de los elementos fallidos o servidos desde cache
+        quota_service.refund(user_id, refunds)
+        
+        completed = len(rows)
+        return jsonify({
+            "results": results,
+            "completed": completed,
+            "failed": len(items) - completed
+        })
+        
+    except Exception as e:
+        logging.error(f"Error generando lote de contenido: {str(e)}")
+        return jsonify({"error": "Error interno del servidor al generar contenido"}), 500
+    finally:
+        db_session.close()
+
+def _sse_event(event, payload):
+    """Formatear un evento Server-Sent Events"""
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+def _stream_generation(user_id, data):
+    """
+    Emitir el contenido como SSE a medida que llega de OpenAI y guardar la
+    Generation al terminar. La cuota ya está reservada y se devuelve si la
+    generación falla. El guardado abre su propia sesión.
+    """
+    def events():
+        try:
+            openai_service = get_openai_service()
+            result = None
+            for event in openai_service.stream_content(**generation_params(data)):
+                if event["type"] == "delta":
+                    yield _sse_event("token", {"content": event["content"]})
+                else:
+                    result = event
+            
+            db_session = SessionLocal()
+            try:
+                generation = build_generation(user_id, data, result)
+                generation.settings = {
+                    "stream": True,
+                    "time_to_first_token": result["time_to_first_token"]
+                }
+                db_session.add(generation)
+                db_session.commit()
+                db_session.refresh(generation)
+                
+                if result["cached"] and not settings.cache_hits_count_against_quota:
+                    quota_service.refund(user_id)
+                
+                logging.info(
+                    f"Generación {generation.id} en streaming: "
+                    f"time_to_first_token={result['time_to_first_token']}ms "
+                    f"processing_time={result['processing_time']}ms"
+                )
+                
+                yield _sse_event("done", {
+                    **generation.to_dict(),
+                    "cached": result["cached"],
+                    "time_to_first_token": result["time_to_first_token"]
+                })
+            finally:
+                db_session.close()
+            
+        except UNAVAILABLE_ERRORS as e:
+            logging.warning(f"Servicio de IA no disponible: {str(e)}")
+            quota_service.refund(user_id)
+            yield _sse_event("error", {
+                "error": "El servicio de generación no está disponible temporalmente. Intenta de nuevo más tarde.",
+                "retry_after": e.retry_after
+            })
+        except Exception as e:
+            logging.error(f"Error en streaming de contenido: {str(e)}")
+            quota_service.refund(user_id)
+            yield _sse_event("error", {"error": "Error interno del servidor al generar contenido"})
+    
+    response = Response(stream_with_context(events()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def _service_unavailable_response(retry_after):
+    """503 con Retry-After cuando el proveedor de IA no está disponible"""
+    response = jsonify({
+        "error": "El servicio de generación no está disponible temporalmente. Intenta de nuevo más tarde.",
+        "retry_after": retry_after
+    })
+    response.headers['Retry-After'] = str(retry_after)
+    return response, 503
+
+def _hash_queue_full_response(retry_after):
+    """429 cuando hay demasiados hashes de contraseña en curso"""
+    response = jsonify({
+        "error": "Demasiadas solicitudes de autenticación en curso. Intenta de nuevo en unos segundos.",
+        "retry_after": retry_after
+    })
+    response.headers['Retry-After'] = str(retry_after)
+    return response, 429
+
+def _quota_exceeded_response():
+    """Respuesta estándar cuando el usuario no tiene cuota disponible"""
+    return jsonify({
+        "error": "Has alcanzado tu límite mensual de generaciones. Actualiza tu plan para continuar."
+    }), 402
+
+def _enqueue_generation_job(db_session, user_id, data):
+    """Crear un GenerationJob (con la cuota ya reservada) y encolarlo en Celery"""
+    from app.tasks.generation_tasks import generate_content_task
+    
+    job = GenerationJob(
+        user_id=user_id,
+        status=JobStatus.PENDING,
+        request_data={key: data[key] for key in
+                      ['content_type', 'topic', 'tone', 'length', 'additional_prompt', 'use_cache']
+                      if key in data}
+    )
+    db_session.add(job)
+    db_session.commit()
+    job_id = job.id
+    
+    try:
+        generate_content_task.delay(job_id)
+    except Exception as e:
+        logging.error(f"Error encolando job {job_id}: {str(e)}")
+        job.status = JobStatus.FAILED
+        job.error = "No se pudo encolar el job"
+        db_session.commit()
+        quota_service.refund(user_id)
+        return jsonify({"error": "Servicio de generación asíncrona no disponible"}), 503
+    
+    status_url = f"/api/v1/jobs/{job_id}"
+    response = jsonify({
+        "job_id": job_id,
+        "status": JobStatus.PENDING,
+        "status_url": status_url
+    })
+    response.headers['Location'] = status_url
+    return response, 202
+
+@app.route('/api/v1/jobs/<job_id>')
+@auth_required
+def get_generation_job(job_id):
+    """Consultar el estado y resultado de un job de generación"""
+    try:
+        user_id = get_current_user_id()
+        db_session = SessionLocal()
+        job = db_session.query(GenerationJob).filter(
+            GenerationJob.id == job_id,
+            GenerationJob.user_id == user_id
+        ).first()
+        
+        if not job:
+            return jsonify({"error": "Job no encontrado"}), 404
+        
+        payload = job.to_dict()
+        payload["result"] = None
+        if job.status == JobStatus.COMPLETED and job.generation_id:
+            generation = db_session.query(Generation).filter(Generation.id == job.generation_id).first()
+            payload["result"] = generation.to_dict() if generation else None
+        
+        return jsonify(payload)
+        
+    except Exception as e:
+        logging.error(f"Error obteniendo job: {str(e)}")
+        return jsonify({"error": "Error interno del servidor"}), 500
+    finally:
+        db_session.close()
+
+GENERATION_FIELDS = [
+    "id", "content_type", "topic", "tone", "length", "generated_content",
+    "tokens_used", "processing_time", "created_at"
+]
+
 @app.route('/api/v1/generations')
-@jwt_required()
+@auth_required
 def get_user_generations():
-    """Obtener historial de generaciones del usuario"""
+    """
+    Obtener historial de generaciones del usuario.
+    Paginación keyset con `cursor` (el siguiente cursor viaja en el header
+    X-Next-Cursor); `skip` se mantiene por compatibilidad. `fields` limita las
+    columnas devueltas y `summary=true` sustituye el contenido por un extracto.
+    """
     try:
-        user_id = get_jwt_identity()
+        db_session = SessionLocal()
+        user_id = get_current_user_id()
         skip = request.args.get('skip', 0, type=int)
-        limit = request.args.get('limit', 10, type=int)
+        limit = max(1, min(request.args.get('limit', 10, type=int), settings.generations_max_page_size))
+        cursor = request.args.get('cursor')
+        summary = request.args.get('summary', '').lower() in ('1', 'true', 'yes')
         
-        db_session = SessionLocal()
-        generations = db_session.query(Generation).filter(
-            Generation.user_id == user_id
-        ).order_by(
-            Generation.created_at.desc()
-        ).offset(skip).limit(limit).all()
+        fields = GENERATION_FIELDS
+        if request.args.get('fields'):
+            fields = [field.strip() for field in request.args['fields'].split(',') if field.strip()]
+            invalid = [field for field in fields if field not in GENERATION_FIELDS]
+            if invalid:
+                return jsonify({"error": f"Campos no válidos: {', '.join(invalid)}. Opciones: {', '.join(GENERATION_FIELDS)}"}), 400
+        if summary:
+            fields = [field for field in fields if field != "generated_content"]
         
-        return jsonify([
-            {
-                "id": g.id,
-                "content_type": g.content_type,
-                "topic": g.topic,
-                "tone": g.tone,
-                "length": g.length,
-                "generated_content": g.generated_content,
-                "tokens_used": g.tokens_used,
-                "processing_time": g.processing_time,
-                "created_at": g.created_at.isoformat() if g.created_at else None
-            }
-            for g in generations
-        ])
+        # Proyección por columnas: filas ligeras en lugar de objetos ORM
+        columns = [getattr(Generation, field).label(field) for field in fields if field not in ("id", "created_at")]
+        columns += [Generation.id.label("id"), Generation.created_at.label("created_at")]
+        if summary:
+            columns.append(func.substr(Generation.generated_content, 1, settings.generations_preview_chars).label("preview"))
+        
+        query = select(*columns).where(Generation.user_id == user_id)
+        
+        if cursor:
+            position = timestamp_cursor(cursor)
+            if not position:
+                return jsonify({"error": "Cursor no válido"}), 400
+            query = query.where(before_timestamp_cursor(Generation.created_at, Generation.id, *position))
+        elif skip:
+            query = query.offset(skip)
+        
+        query = query.order_by(Generation.created_at.desc(), Generation.id.desc()).limit(limit)
+        rows = db_session.execute(query).all()
+        
+        items = []
+        for row in rows:
+            values = row._mapping
+            item = {field: values[field] for field in fields}
+            if "created_at" in item:
+                item["created_at"] = values["created_at"].isoformat() if values["created_at"] else None
+            if summary:
+                item["preview"] = values["preview"]
+            items.append(item)
+        
+        response = jsonify(items)
+        if len(rows) == limit:
+            last = rows[-1]._mapping
+            next_cursor = encode_cursor(last["created_at"], last["id"])
+            response.headers['X-Next-Cursor'] = next_cursor
+            next_args = {key: value for key, value in request.args.items() if key != 'skip'}
+            next_args.update(cursor=next_cursor, limit=limit)
+            response.headers['Link'] = f'<{request.path}?{urlencode(next_args)}>; rel="next"'
+        return response
         
     except Exception as e:
         logging.error(f"Error obteniendo generaciones: {str(e)}")
@@ -366,5 +740,311 @@ def get_user_generations():
     finally:
         db_session.close()
 
+@app.route('/api/v1/generations/search')
+@auth_required
+def search_generations():
+    """
+    Buscar en el historial del usuario por palabras clave (tema y contenido),
+    ordenado por relevancia. Filtros `content_type`, `from` y `to`
+    (YYYY-MM-DD). Paginación keyset con `cursor` (header X-Next-Cursor).
+    """
+    try:
+        db_session = SessionLocal()
+        user_id = get_current_user_id()
+        q = (request.args.get('q') or '').strip()
+        if not q:
+            return jsonify({"error": "El parámetro q es requerido"}), 400
+        limit = max(1, min(request.args.get('limit', 10, type=int), settings.generations_max_page_size))
+        
+        try:
+            start = date.fromisoformat(request.args['from']) if request.args.get('from') else None
+            end = date.fromisoformat(request.args['to']) if request.args.get('to') else None
+        except ValueError:
+            return jsonify({"error": "Fechas no válidas, formato YYYY-MM-DD"}), 400
+        
+        after = None
+        if request.args.get('cursor'):
+            values = decode_cursor(request.args['cursor'])
+            try:
+                after = (float(values[0]), int(values[1])) if values and len(values) == 2 else None
+            except (TypeError, ValueError):
+                after = None
+            if after is None:
+                return jsonify({"error": "Cursor no válido"}), 400
+        
+        items = search_service.search(
+            db_session, user_id, q, limit,
+            content_type=request.args.get('content_type'), start=start, end=end, after=after
+        )
+        
+        response = jsonify(items)
+        # Las generaciones más recientes que este id aún no están indexadas
+        response.headers['X-Indexed-Through'] = str(search_service.indexed_through(db_session))
+        if len(items) == limit:
+            next_cursor = encode_cursor(items[-1]["rank"], items[-1]["id"])
+            response.headers['X-Next-Cursor'] = next_cursor
+            next_args = dict(request.args.items())
+            next_args.update(cursor=next_cursor, limit=limit)
+            response.headers['Link'] = f'<{request.path}?{urlencode(next_args)}>; rel="next"'
+        return response
+        
+    except SearchUnavailableError as e:
+        return jsonify({"error": str(e)}), 501
+    except Exception as e:
+        logging.error(f"Error buscando generaciones: {str(e)}")
+        return jsonify({"error": "Error interno del servidor"}), 500
+    finally:
+        db_session.close()
+
+@app.route('/api/v1/analytics')
+@auth_required
+def get_analytics():
+    """
+    Uso por periodo servido desde los rollups (sin recorrer `generations`).
+    `granularity` day|month, `from`/`to` (YYYY-MM-DD, en UTC), filtros
+    `content_type` y `model`, y `group_by` (content_type, model). Un
+    administrador puede pedir otro `user_id` o `user_id=all`.
+    """
+    try:
+        db_session = SessionLocal()
+        user_id = get_current_user_id()
+        
+        granularity = request.args.get('granularity', RollupGranularity.DAY)
+        if granularity not in (RollupGranularity.DAY, RollupGranularity.MONTH):
+            return jsonify({"error": "granularity debe ser day o month"}), 400
+        
+        try:
+            end = date.fromisoformat(request.args['to']) if request.args.get('to') else datetime.now(timezone.utc).date()
+            if request.args.get('from'):
+                start = date.fromisoformat(request.args['from'])
+            elif granularity == RollupGranularity.DAY:
+                start = end - timedelta(days=29)
+            else:
+                # Los últimos 12 meses, incluido el actual
+                months = end.year * 12 + end.month - 12
+                start = date(months // 12, months % 12 + 1, 1)
+        except ValueError:
+            return jsonify({"error": "Fechas no válidas, formato YYYY-MM-DD"}), 400
+        if start > end:
+            return jsonify({"error": "from debe ser anterior a to"}), 400
+        if granularity == RollupGranularity.DAY and (end - start).days >= settings.analytics_max_days:
+            return jsonify({"error": f"Rango máximo de {settings.analytics_max_days} días con granularity=day"}), 400
+        
+        group_by = [field.strip() for field in request.args.get('group_by', 'content_type').split(',') if field.strip()]
+        invalid = [field for field in group_by if field not in GROUP_BY_FIELDS]
+        if invalid:
+            return jsonify({"error": f"group_by no válido: {', '.join(invalid)}. Opciones: {', '.join(GROUP_BY_FIELDS)}"}), 400
+        
+        requested = request.args.get('user_id')
+        if requested is not None and requested != str(user_id):
+            if not _is_admin(get_current_user()):
+                return jsonify({"error": "Acceso restringido a administradores"}), 403
+            if requested == 'all':
+                user_id = ALL_USERS
+            elif requested.isdigit():
+                user_id = int(requested)
+            else:
+                return jsonify({"error": "user_id debe ser un id o all"}), 400
+        
+        usage = analytics_service.usage(
+            db_session, user_id, granularity, start, end,
+            content_type=request.args.get('content_type'),
+            model=request.args.get('model'),
+            group_by=group_by
+        )
+        return jsonify({"user_id": "all" if user_id == ALL_USERS else user_id, **usage})
+        
+    except Exception as e:
+        logging.error(f"Error obteniendo analytics: {str(e)}")
+        return jsonify({"error": "Error interno del servidor"}), 500
+    finally:
+        db_session.close()
+
+@app.route('/api/v1/api-keys', methods=['POST'])
+@auth_required
+def create_api_key():
+    """Crear una API key para integraciones servidor a servidor"""
+    try:
+        db_session = SessionLocal()
+        user_id = get_current_user_id()
+        data = request.get_json() or {}
+        
+        name = (data.get('name') or '').strip()
+        if not name:
+            return jsonify({"error": "El nombre de la API key es requerido"}), 400
+        
+        expires_in_days = data.get('expires_in_days')
+        if expires_in_days is not None and (not isinstance(expires_in_days, int) or expires_in_days <= 0):
+            return jsonify({"error": "expires_in_days debe ser un entero positivo"}), 400
+        
+        active_keys = db_session.query(func.count(APIKey.id)).filter(
+            APIKey.user_id == user_id,
+            APIKey.is_active == True
+        ).scalar()
+        if active_keys >= settings.api_key_max_per_user:
+            return jsonify({"error": f"Máximo {settings.api_key_max_per_user} API keys activas por usuario"}), 400
+        
+        api_key_obj, raw_key = api_key_service.create_key(db_session, user_id, name, expires_in_days)
+        
+        # La key en claro solo se muestra una vez
+        return jsonify({**api_key_obj.to_dict(), "key": raw_key}), 201
+        
+    except Exception as e:
+        logging.error(f"Error creando API key: {str(e)}")
+        return jsonify({"error": "Error interno del servidor"}), 500
+    finally:
+        db_session.close()
+
+@app.route('/api/v1/api-keys')
+@auth_required
+def list_api_keys():
+    """Listar las API keys del usuario"""
+    try:
+        db_session = SessionLocal()
+        user_id = get_current_user_id()
+        return jsonify([key.to_dict() for key in api_key_service.list_keys(db_session, user_id)])
+        
+    except Exception as e:
+        logging.error(f"Error listando API keys: {str(e)}")
+        return jsonify({"error": "Error interno del servidor"}), 500
+    finally:
+        db_session.close()
+
+@app.route('/api/v1/api-keys/<int:key_id>', methods=['DELETE'])
+@auth_required
+def revoke_api_key(key_id):
+    """Revocar una API key"""
+    try:
+        db_session = SessionLocal()
+        user_id = get_current_user_id()
+        
+        if not api_key_service.revoke_key(db_session, user_id, key_id):
+            return jsonify({"error": "API key no encontrada"}), 404
+        
+        return jsonify({"message": "API key revocada exitosamente"})
+        
+    except Exception as e:
+        logging.error(f"Error revocando API key: {str(e)}")
+        return jsonify({"error": "Error interno del servidor"}), 500
+    finally:
+        db_session.close()
+
+@app.route('/api/v1/cache/stats')
+@auth_required
+def get_cache_stats():
+    """Obtener contadores de la cache de respuestas (solo administradores)"""
+    try:
+        if not _is_admin(get_current_user()):
+            return jsonify({"error": "Acceso restringido a administradores"}), 403
+        
+        return jsonify({
+            **response_cache.stats(),
+            "singleflight": singleflight.stats(),
+            "near_duplicates": near_duplicates.stats()
+        })
+        
+    except Exception as e:
+        logging.error(f"Error obteniendo estadísticas de cache: {str(e)}")
+        return jsonify({"error": "Error interno del servidor"}), 500
+
+@app.route('/api/v1/providers/stats')
+@auth_required
+def get_provider_stats():
+    """Obtener latencias, tasa de error y estado de cada proveedor de IA (solo administradores)"""
+    try:
+        if not _is_admin(get_current_user()):
+            return jsonify({"error": "Acceso restringido a administradores"}), 403
+        
+        return jsonify(get_openai_service().stats())
+        
+    except Exception as e:
+        logging.error(f"Error obteniendo estadísticas de proveedores: {str(e)}")
+        return jsonify({"error": "Error interno del servidor"}), 500
+
+@app.route('/api/v1/auth/stats')
+@auth_required
+def get_auth_stats():
+    """Obtener latencia de login, estado del pool de hashing y de la cache de usuarios (solo administradores)"""
+    try:
+        if not _is_admin(get_current_user()):
+            return jsonify({"error": "Acceso restringido a administradores"}), 403
+        
+        return jsonify({**password_hasher.stats(), "user_cache": user_cache.stats()})
+        
+    except Exception as e:
+        logging.error(f"Error obteniendo estadísticas de autenticación: {str(e)}")
+        return jsonify({"error": "Error interno del servidor"}), 500
+
+@app.route('/api/v1/write-behind/stats')
+@auth_required
+def get_write_behind_stats():
+    """Profundidad de cola y latencia de volcado del buffer write-behind (solo administradores)"""
+    try:
+        if not _is_admin(get_current_user()):
+            return jsonify({"error": "Acceso restringido a administradores"}), 403
+        
+        return jsonify(write_behind.stats())
+        
+    except Exception as e:
+        logging.error(f"Error obteniendo estadísticas de write-behind: {str(e)}")
+        return jsonify({"error": "Error interno del servidor"}), 500
+
+@app.route('/api/v1/profiles')
+@auth_required
+def list_profiles():
+    """Listar los perfiles capturados, del más reciente al más antiguo (solo administradores)"""
+    try:
+        if not _is_admin(get_current_user()):
+            return jsonify({"error": "Acceso restringido a administradores"}), 403
+        
+        return jsonify({
+            "enabled": settings.profiler_enabled,
+            "sample_rate": settings.profiler_sample_rate,
+            "max_captures": settings.profiler_max_captures,
+            "profiles": profile_store.list()
+        })
+        
+    except Exception as e:
+        logging.error(f"Error listando perfiles: {str(e)}")
+        return jsonify({"error": "Error interno del servidor"}), 500
+
+@app.route('/api/v1/profiles/<profile_id>')
+@auth_required
+def get_profile(profile_id):
+    """
+    Descargar un perfil (solo administradores). Por defecto devuelve los
+    metadatos y las funciones más costosas; `format=prof` descarga el
+    fichero pstats y `format=text` el informe ordenado por tiempo acumulado.
+    """
+    try:
+        if not _is_admin(get_current_user()):
+            return jsonify({"error": "Acceso restringido a administradores"}), 403
+        
+        output = request.args.get('format', 'json')
+        if output == 'prof':
+            path = profile_store.profile_path(profile_id)
+            if path is None:
+                return jsonify({"error": "Perfil no encontrado"}), 404
+            return send_file(os.path.abspath(path), mimetype='application/octet-stream',
+                             as_attachment=True, download_name=f"{profile_id}.prof")
+        if output == 'text':
+            report = profile_store.report(profile_id)
+            if report is None:
+                return jsonify({"error": "Perfil no encontrado"}), 404
+            return Response(report, mimetype='text/plain')
+        
+        profile = profile_store.get(profile_id)
+        if profile is None:
+            return jsonify({"error": "Perfil no encontrado"}), 404
+        return jsonify(profile)
+        
+    except Exception as e:
+        logging.error(f"Error obteniendo perfil: {str(e)}")
+        return jsonify({"error": "Error interno del servidor"}), 500
+
+def _is_admin(user):
+    """Verificar si el usuario tiene rol de administrador"""
+    return user is not None and user.role == UserRole.ADMIN.value
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=8000, debug=settings.debug) 
\ No newline at end of file
@@ -2,5 +2,9 @@
 from .user import User, UserRole
 from .generation import Generation
 from .api_key import APIKey
+from .generation_job import GenerationJob, JobStatus
+from .usage_rollup import UsageRollup, RollupGranularity
+from .job_state import JobState
 
-__all__ = ["User", "UserRole", "Generation", "APIKey"] 
\ No newline at end of file
+__all__ = ["User", "UserRole", "Generation", "APIKey", "GenerationJob", "JobStatus",
+           "UsageRollup", "RollupGranularity", "JobState"] 
\ No newline at end of file
@@ -2,6 +2,7 @@ from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.core.database import Base
+from datetime import datetime, timezone
 import secrets
 
 class APIKey(Base):
@@ -40,4 +41,19 @@ class APIKey(Base):
         """Verificar si la key ha expirado"""
         if not self.expires_at:
             return False
-        return func.now() > self.expires_at 
\ No newline at end of file
+        expires_at = self.expires_at
+        if expires_at.tzinfo is None:
+            expires_at = expires_at.replace(tzinfo=timezone.utc)
+        return datetime.now(timezone.utc) > expires_at
+    
+    def to_dict(self):
+        """Convertir a diccionario para API (nunca incluye la key)"""
+        return {
+            "id": self.id,
+            "name": self.name,
+            "key_prefix": self.key_prefix,
+            "is_active": self.is_active,
+            "last_used": self.last_used.isoformat() if self.last_used else None,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "expires_at": self.expires_at.isoformat() if self.expires_at else None
+        } 
\ No newline at end of file
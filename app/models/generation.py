@@ -1,10 +1,14 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, JSON
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, JSON, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.core.database import Base
 
 class Generation(Base):
     __tablename__ = "generations"
+    __table_args__ = (
+        # Historial por usuario en orden cronológico inverso (paginación keyset)
+        Index("ix_generations_user_created_id", "user_id", "created_at", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -0,0 +1,39 @@
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, JSON
+from sqlalchemy.sql import func
+from app.core.database import Base
+import uuid
+
+class JobStatus:
+    PENDING = "pending"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+class GenerationJob(Base):
+    __tablename__ = "generation_jobs"
+    
+    id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    
+    # Estado del job
+    status = Column(String, nullable=False, default=JobStatus.PENDING)
+    request_data = Column(JSON, nullable=False)  # Parámetros de la generación
+    generation_id = Column(Integer, ForeignKey("generations.id"), nullable=True)
+    error = Column(Text, nullable=True)
+    
+    # Timestamps
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    
+    def to_dict(self):
+        """Convertir a diccionario para API"""
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "generation_id": self.generation_id,
+            "error": self.error,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None
+        }
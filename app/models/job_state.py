@@ -0,0 +1,26 @@
+from sqlalchemy import Column, BigInteger, String, DateTime, insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.sql import func
+from app.core.database import Base
+
+class JobState(Base):
+    """Posición de los jobs incrementales (última fila procesada)"""
+    __tablename__ = "job_state"
+    
+    name = Column(String, primary_key=True)
+    watermark = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    
+    @staticmethod
+    def load_watermark(db_session, name: str) -> int:
+        """Marca de agua del job, creando su fila si aún no existe"""
+        state = db_session.get(JobState, name)
+        if state is not None:
+            return state.watermark
+        try:
+            db_session.execute(insert(JobState).values(name=name, watermark=0))
+            db_session.commit()
+        except IntegrityError:
+            # Creada a la vez por otra ejecución
+            db_session.rollback()
+        return db_session.get(JobState, name).watermark
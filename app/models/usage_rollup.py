@@ -0,0 +1,39 @@
+from sqlalchemy import Column, Integer, BigInteger, String, Text, Date, DateTime, Index, UniqueConstraint
+from sqlalchemy.sql import func
+from app.core.database import Base
+
+class RollupGranularity:
+    DAY = "day"
+    MONTH = "month"
+
+# user_id de las filas agregadas de todos los usuarios
+ALL_USERS = 0
+
+class UsageRollup(Base):
+    """
+    Uso agregado por periodo (día o mes, en UTC), usuario, tipo de contenido
+    y modelo. Lo mantiene el job de analytics a partir de `generations`; las
+    filas con user_id = ALL_USERS suman a todos los usuarios.
+    """
+    __tablename__ = "usage_rollups"
+    __table_args__ = (
+        UniqueConstraint("granularity", "period_start", "user_id", "content_type", "model",
+                         name="uq_usage_rollups_key"),
+        Index("ix_usage_rollups_user_period", "user_id", "granularity", "period_start"),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    granularity = Column(String(5), nullable=False)  # day, month
+    period_start = Column(Date, nullable=False)
+    # Sin clave foránea: los agregados sobreviven al usuario y ALL_USERS no existe en users
+    user_id = Column(Integer, nullable=False)
+    content_type = Column(String, nullable=False)
+    model = Column(String, nullable=False)
+    
+    # Agregados
+    generations = Column(Integer, nullable=False, default=0)
+    tokens_used = Column(BigInteger, nullable=False, default=0)
+    processing_time_total = Column(BigInteger, nullable=False, default=0)  # en milisegundos
+    processing_time_sketch = Column(Text, nullable=True)  # QuantileSketch serializado
+    
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -1,7 +1,8 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Enum, Text
+from sqlalchemy import Column, Integer, String, Boolean, Date, DateTime, Enum, Text, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.core.database import Base
+from datetime import datetime, timezone
 import enum
 
 class UserRole(str, enum.Enum):
@@ -12,6 +13,10 @@ class UserRole(str, enum.Enum):
 
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        # Reinicio mensual: usuarios de un día de facturación con el periodo vencido
+        Index("ix_users_billing_anchor_period", "billing_anchor_day", "usage_period_start"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     email = Column(String, unique=True, index=True, nullable=False)
@@ -29,6 +34,11 @@ class User(Base):
     # Límites de uso
     monthly_generations_used = Column(Integer, default=0)
     monthly_generations_limit = Column(Integer, default=10)  # Plan gratuito
+    # Ciclo de facturación: el uso se reinicia cada mes el día billing_anchor_day
+    # (el último día del mes si es más corto); usage_period_start es el inicio
+    # del periodo en curso, es decir, la fecha del último reinicio
+    billing_anchor_day = Column(Integer, default=lambda: datetime.now(timezone.utc).day)
+    usage_period_start = Column(Date, default=lambda: datetime.now(timezone.utc).date())
     
     # Timestamps
     created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -46,6 +56,8 @@ class User(Base):
         """Incrementar contador de uso"""
         self.monthly_generations_used += 1
     
-    def reset_monthly_usage(self):
-        """Resetear uso mensual"""
-        self.monthly_generations_used = 0 
\ No newline at end of file
+    def reset_monthly_usage(self, period_start=None):
+        """Resetear uso mensual (el reinicio programado está en usage_reset_service)"""
+        self.monthly_generations_used = 0
+        if period_start is not None:
+            self.usage_period_start = period_start 
\ No newline at end of file
@@ -1,5 +1,17 @@
 # Servicios de la aplicación
-from .openai_service import OpenAIService
-from .wompi_service import wompi_service
+# Se cargan al primer acceso: importar un servicio no arrastra las dependencias
+# pesadas de los demás (openai, httpx...) en el arranque
+from importlib import import_module
 
-__all__ = ["OpenAIService", "wompi_service"] 
\ No newline at end of file
+_EXPORTS = {
+    "OpenAIService": ".openai_service",
+    "get_openai_service": ".openai_service",
+    "wompi_service": ".wompi_service"
+}
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(import_module(_EXPORTS[name], __name__), name)
+
+__all__ = ["OpenAIService", "get_openai_service", "wompi_service"]
@@ -0,0 +1,300 @@
+import argparse
+import logging
+import sys
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from sqlalchemy import delete, insert, select, tuple_, update
+from sqlalchemy.sql import func
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.core.sketch import QuantileSketch
+from app.models.generation import Generation
+from app.models.job_state import JobState
+from app.models.usage_rollup import ALL_USERS, RollupGranularity, UsageRollup
+
+logger = logging.getLogger(__name__)
+
+JOB_NAME = "usage_rollups"
+
+# Modelo de las generaciones sin model_used
+UNKNOWN_MODEL = "unknown"
+
+GROUP_BY_FIELDS = ("content_type", "model")
+PERCENTILES = (("p50", 0.5), ("p95", 0.95), ("p99", 0.99))
+
+# Claves por fila de rollup en cada consulta IN (5 parámetros por clave)
+_KEYS_PER_QUERY = 500
+
+RollupKey = Tuple[str, date, int, str, str]
+
+class _Aggregate:
+    __slots__ = ("generations", "tokens_used", "processing_time_total", "sketch")
+
+    def __init__(self, sketch: Optional[QuantileSketch] = None):
+        self.generations = 0
+        self.tokens_used = 0
+        self.processing_time_total = 0
+        self.sketch = sketch or QuantileSketch()
+
+    def add(self, tokens_used: Optional[int], processing_time: Optional[int]):
+        self.generations += 1
+        self.tokens_used += tokens_used or 0
+        if processing_time is not None:
+            self.processing_time_total += processing_time
+            self.sketch.add(processing_time)
+
+    def merge(self, generations: int, tokens_used: int, processing_time_total: int, sketch: QuantileSketch):
+        self.generations += generations
+        self.tokens_used += tokens_used
+        self.processing_time_total += processing_time_total
+        self.sketch.merge(sketch)
+
+    def to_dict(self) -> Dict[str, Any]:
+        timed = self.sketch.count
+        processing_time = {
+            "avg": round(self.processing_time_total / timed, 1) if timed else None
+        }
+        for name, q in PERCENTILES:
+            value = self.sketch.quantile(q)
+            processing_time[name] = round(value) if value is not None else None
+        return {
+            "generations": self.generations,
+            "tokens_used": self.tokens_used,
+            "processing_time_ms": processing_time
+        }
+
+def period_start(moment: datetime, granularity: str) -> date:
+    """Inicio del periodo (en UTC) que contiene `moment`"""
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc)
+    day = moment.date()
+    return day.replace(day=1) if granularity == RollupGranularity.MONTH else day
+
+def _as_utc(moment: datetime) -> datetime:
+    # SQLite devuelve fechas sin zona horaria (CURRENT_TIMESTAMP está en UTC)
+    return moment.replace(tzinfo=timezone.utc) if moment.tzinfo is None else moment
+
+class AnalyticsService:
+    """
+    Rollups de uso diarios y mensuales por usuario, tipo de contenido y
+    modelo. Un job periódico (Celery beat) recorre las generaciones nuevas
+    por id a partir de una marca de agua y las suma a `usage_rollups`; el
+    endpoint de analytics solo lee los rollups.
+
+    Solo se procesan generaciones con más de ANALYTICS_ROLLUP_LAG segundos
+    para no saltarse ids de transacciones que aún no han confirmado. La
+    marca de agua avanza con un UPDATE condicional en la misma transacción
+    que los rollups: si dos ejecuciones coinciden, la segunda no suma nada.
+    """
+
+    def rollup(self, batch_size: Optional[int] = None, lag: Optional[int] = None) -> int:
+        """Procesar un lote de generaciones. Devuelve cuántas se han sumado (0 = al día)"""
+        batch_size = batch_size or settings.analytics_rollup_batch_size
+        lag = settings.analytics_rollup_lag if lag is None else lag
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=lag)
+
+        db_session = SessionLocal()
+        try:
+            watermark = JobState.load_watermark(db_session, JOB_NAME)
+            rows = db_session.execute(
+                select(
+                    Generation.id, Generation.user_id, Generation.content_type, Generation.model_used,
+                    Generation.tokens_used, Generation.processing_time, Generation.created_at
+                ).where(Generation.id > watermark).order_by(Generation.id).limit(batch_size)
+            ).all()
+
+            batch = []
+            for row in rows:
+                if row.created_at is not None and _as_utc(row.created_at) > cutoff:
+                    break
+                batch.append(row)
+            if not batch:
+                return 0
+
+            claimed = db_session.execute(
+                update(JobState)
+                .where(JobState.name == JOB_NAME, JobState.watermark == watermark)
+                .values(watermark=batch[-1].id, updated_at=func.now())
+            )
+            if claimed.rowcount != 1:
+                # Otra ejecución ha procesado este lote
+                db_session.rollback()
+                return 0
+
+            self._merge(db_session, self._aggregate(batch))
+            db_session.commit()
+            return len(batch)
+        except Exception:
+            db_session.rollback()
+            raise
+        finally:
+            db_session.close()
+
+    def catch_up(self, max_batches: Optional[int] = None, batch_size: Optional[int] = None,
+                 lag: Optional[int] = None) -> int:
+        """Procesar lotes hasta ponerse al día (o hasta `max_batches`)"""
+        total = 0
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            processed = self.rollup(batch_size, lag)
+            if not processed:
+                break
+            total += processed
+            batches += 1
+        return total
+
+    def rebuild(self, batch_size: Optional[int] = None, lag: Optional[int] = None) -> int:
+        """Borrar los rollups y recalcularlos desde la primera generación"""
+        db_session = SessionLocal()
+        try:
+            JobState.load_watermark(db_session, JOB_NAME)
+            db_session.execute(
+                update(JobState).where(JobState.name == JOB_NAME).values(watermark=0, updated_at=func.now())
+            )
+            db_session.execute(delete(UsageRollup))
+            db_session.commit()
+        except Exception:
+            db_session.rollback()
+            raise
+        finally:
+            db_session.close()
+        return self.catch_up(batch_size=batch_size, lag=lag)
+
+    def usage(self, db_session, user_id: int, granularity: str, start: date, end: date,
+              content_type: Optional[str] = None, model: Optional[str] = None,
+              group_by: Sequence[str] = ()) -> Dict[str, Any]:
+        """
+        Uso entre `start` y `end` (inclusive) a partir de los rollups: una
+        serie por periodo (y por cada campo de `group_by`) más los totales.
+        `user_id` = ALL_USERS agrega a todos los usuarios.
+        """
+        if granularity == RollupGranularity.MONTH:
+            start = start.replace(day=1)
+        query = select(
+            UsageRollup.period_start, UsageRollup.content_type, UsageRollup.model,
+            UsageRollup.generations, UsageRollup.tokens_used,
+            UsageRollup.processing_time_total, UsageRollup.processing_time_sketch
+        ).where(
+            UsageRollup.user_id == user_id,
+            UsageRollup.granularity == granularity,
+            UsageRollup.period_start >= start,
+            UsageRollup.period_start <= end
+        )
+        if content_type:
+            query = query.where(UsageRollup.content_type == content_type)
+        if model:
+            query = query.where(UsageRollup.model == model)
+
+        series: Dict[tuple, _Aggregate] = {}
+        totals = _Aggregate()
+        for row in db_session.execute(query):
+            sketch = QuantileSketch.from_json(row.processing_time_sketch)
+            key = (row.period_start,) + tuple(getattr(row, field) for field in group_by)
+            series.setdefault(key, _Aggregate()).merge(
+                row.generations, row.tokens_used, row.processing_time_total, sketch
+            )
+            totals.merge(row.generations, row.tokens_used, row.processing_time_total, sketch)
+
+        state = db_session.get(JobState, JOB_NAME)
+        return {
+            "granularity": granularity,
+            "from": start.isoformat(),
+            "to": end.isoformat(),
+            "group_by": list(group_by),
+            "series": [
+                {"period": key[0].isoformat(), **dict(zip(group_by, key[1:])), **aggregate.to_dict()}
+                for key, aggregate in sorted(series.items())
+            ],
+            "totals": totals.to_dict(),
+            # Hasta dónde llegan los rollups: las generaciones posteriores aún no cuentan
+            "rollup": {
+                "last_generation_id": state.watermark if state else 0,
+                "updated_at": state.updated_at.isoformat() if state and state.updated_at else None
+            }
+        }
+
+    @staticmethod
+    def _aggregate(rows: Iterable) -> Dict[RollupKey, _Aggregate]:
+        aggregates: Dict[RollupKey, _Aggregate] = {}
+        for row in rows:
+            model = row.model_used or UNKNOWN_MODEL
+            for granularity in (RollupGranularity.DAY, RollupGranularity.MONTH):
+                start = period_start(row.created_at, granularity)
+                for user_id in (row.user_id, ALL_USERS):
+                    key = (granularity, start, user_id, row.content_type, model)
+                    aggregates.setdefault(key, _Aggregate()).add(row.tokens_used, row.processing_time)
+        return aggregates
+
+    @staticmethod
+    def _merge(db_session, aggregates: Dict[RollupKey, _Aggregate]):
+        """Sumar los agregados del lote a las filas existentes o crearlas"""
+        key_columns = (
+            UsageRollup.granularity, UsageRollup.period_start, UsageRollup.user_id,
+            UsageRollup.content_type, UsageRollup.model
+        )
+        keys: List[RollupKey] = list(aggregates)
+        existing = {}
+        for offset in range(0, len(keys), _KEYS_PER_QUERY):
+            chunk = keys[offset:offset + _KEYS_PER_QUERY]
+            rows = db_session.execute(
+                select(UsageRollup.id, *key_columns, UsageRollup.processing_time_sketch)
+                .where(tuple_(*key_columns).in_(chunk))
+            ).all()
+            for row in rows:
+                existing[tuple(row[1:6])] = (row.id, row.processing_time_sketch)
+
+        new_rows = []
+        for key, aggregate in aggregates.items():
+            if key in existing:
+                row_id, raw_sketch = existing[key]
+                sketch = QuantileSketch.from_json(raw_sketch)
+                sketch.merge(aggregate.sketch)
+                db_session.execute(
+                    update(UsageRollup).where(UsageRollup.id == row_id).values(
+                        generations=UsageRollup.generations + aggregate.generations,
+                        tokens_used=UsageRollup.tokens_used + aggregate.tokens_used,
+                        processing_time_total=UsageRollup.processing_time_total + aggregate.processing_time_total,
+                        processing_time_sketch=sketch.to_json(),
+                        updated_at=func.now()
+                    )
+                )
+            else:
+                granularity, start, user_id, content_type, model = key
+                new_rows.append({
+                    "granularity": granularity,
+                    "period_start": start,
+                    "user_id": user_id,
+                    "content_type": content_type,
+                    "model": model,
+                    "generations": aggregate.generations,
+                    "tokens_used": aggregate.tokens_used,
+                    "processing_time_total": aggregate.processing_time_total,
+                    "processing_time_sketch": aggregate.sketch.to_json()
+                })
+        if new_rows:
+            db_session.execute(insert(UsageRollup), new_rows)
+
+analytics_service = AnalyticsService()
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Actualizar los rollups de uso (backfill)")
+    parser.add_argument("--rebuild", action="store_true", help="Borrar los rollups y recalcularlos desde cero")
+    parser.add_argument("--batch-size", type=int, default=settings.analytics_rollup_batch_size,
+                        help="Generaciones por transacción (ANALYTICS_ROLLUP_BATCH_SIZE)")
+    parser.add_argument("--lag", type=int, default=settings.analytics_rollup_lag,
+                        help="Ignorar las generaciones de los últimos N segundos (ANALYTICS_ROLLUP_LAG)")
+    args = parser.parse_args(argv)
+
+    from app.core.migrations import ensure_schema
+    if not ensure_schema():
+        return 1
+
+    if args.rebuild:
+        processed = analytics_service.rebuild(args.batch_size, args.lag)
+    else:
+        processed = analytics_service.catch_up(batch_size=args.batch_size, lag=args.lag)
+    print(f"✅ {processed} generaciones sumadas a los rollups de uso")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,192 @@
+import hashlib
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import List, NamedTuple, Optional, Tuple
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.core.redis_client import get_redis, mark_redis_unavailable
+from app.models.api_key import APIKey
+from app.models.user import User
+from app.services.cache_service import LRUCache
+
+logger = logging.getLogger(__name__)
+
+# TTL de las búsquedas de keys inexistentes (evita consultas repetidas con keys inválidas)
+_NEGATIVE_TTL = 30
+_MISSING = object()
+
+class APIKeyIdentity(NamedTuple):
+    """Datos verificados de una API key que se guardan en cache"""
+    key_id: int
+    user_id: int
+    role: str
+    is_active: bool
+    expires_at: Optional[datetime]
+
+    def is_expired(self) -> bool:
+        if not self.expires_at:
+            return False
+        expires_at = self.expires_at
+        if expires_at.tzinfo is None:
+            expires_at = expires_at.replace(tzinfo=timezone.utc)
+        return datetime.now(timezone.utc) > expires_at
+
+class _CachedIdentity(NamedTuple):
+    identity: APIKeyIdentity
+    loaded_at: float
+    # Contador de revocaciones leído antes de consultar la base de datos (None sin Redis)
+    generation: Optional[int]
+
+class APIKeyService:
+    """
+    Autenticación con API keys. Las búsquedas hash -> identidad se guardan
+    en una cache TTL por worker, de modo que una petición autenticada cuesta
+    un hash y una búsqueda en diccionario.
+
+    Revocar una key (o cambiar el rol o el estado del usuario) incrementa
+    un contador en Redis. Cada worker lo lee antes de usar una identidad de
+    su cache y la recarga si ha cambiado desde que la guardó, así que la
+    revocación vale en todos los procesos. Sin Redis, la identidad en
+    cache solo se usa durante API_KEY_CACHE_UNSHARED_TTL segundos.
+    """
+
+    revocations_key = "gcai:api_keys:revocations"
+
+    def __init__(self):
+        self.cache = LRUCache(settings.api_key_cache_max_entries)
+
+    @staticmethod
+    def hash_key(raw_key: str) -> str:
+        """Hash de la key (las keys tienen 256 bits aleatorios, SHA-256 es suficiente)"""
+        return hashlib.sha256(raw_key.encode("utf-8")).hexdigest()
+
+    def authenticate(self, raw_key: str) -> Optional[APIKeyIdentity]:
+        """Verificar una key. Devuelve la identidad o None si no es válida"""
+        key_hash = self.hash_key(raw_key)
+        cached = self.cache.get(key_hash)
+
+        if cached is _MISSING:
+            identity = _MISSING
+        elif cached is not None and self._is_current(cached):
+            identity = cached.identity
+        else:
+            identity = self._load(key_hash)
+
+        if identity is _MISSING or not identity.is_active or identity.is_expired():
+            return None
+        return identity
+
+    def create_key(self, db_session, user_id: int, name: str,
+                   expires_in_days: Optional[int] = None) -> Tuple[APIKey, str]:
+        """Crear una API key. La key en claro solo se devuelve aquí"""
+        raw_key = APIKey.generate_key()
+        expires_at = None
+        if expires_in_days:
+            expires_at = datetime.now(timezone.utc) + timedelta(days=expires_in_days)
+
+        api_key = APIKey(
+            user_id=user_id,
+            key_hash=self.hash_key(raw_key),
+            key_prefix=APIKey.get_key_prefix(raw_key),
+            name=name,
+            is_active=True,
+            expires_at=expires_at
+        )
+        db_session.add(api_key)
+        db_session.commit()
+        db_session.refresh(api_key)
+
+        # Descartar una posible entrada negativa de la cache
+        self.cache.delete(api_key.key_hash)
+        return api_key, raw_key
+
+    def list_keys(self, db_session, user_id: int) -> List[APIKey]:
+        return db_session.query(APIKey).filter(
+            APIKey.user_id == user_id
+        ).order_by(APIKey.created_at.desc(), APIKey.id.desc()).all()
+
+    def revoke_key(self, db_session, user_id: int, key_id: int) -> bool:
+        """Revocar una key del usuario e invalidarla en cache"""
+        api_key = db_session.query(APIKey).filter(
+            APIKey.id == key_id,
+            APIKey.user_id == user_id
+        ).first()
+        if not api_key:
+            return False
+
+        api_key.is_active = False
+        db_session.commit()
+        self.invalidate(api_key.key_hash)
+        return True
+
+    def invalidate(self, key_hash: str):
+        """Invalidar una key en la cache local y en la del resto de workers"""
+        self.cache.delete(key_hash)
+        self._publish_revocation()
+
+    def invalidate_user(self, user_id: int):
+        """Invalidar todas las keys en cache de un usuario (rol, plan o estado cambiados)"""
+        # Recorre la cache (acotada por API_KEY_CACHE_MAX_ENTRIES): los cambios de usuario son poco frecuentes
+        self.cache.delete_where(
+            lambda cached: isinstance(cached, _CachedIdentity) and cached.identity.user_id == user_id
+        )
+        self._publish_revocation()
+
+    def _publish_revocation(self):
+        """Incrementar el contador de revocaciones: el resto de workers recargan sus identidades"""
+        client = get_redis() if settings.api_key_redis_enabled else None
+        if client is None:
+            return
+        try:
+            client.incr(self.revocations_key)
+        except Exception as e:
+            mark_redis_unavailable(e)
+
+    def _revocation_generation(self) -> Optional[int]:
+        """Valor actual del contador de revocaciones, o None si Redis no está disponible"""
+        client = get_redis() if settings.api_key_redis_enabled else None
+        if client is None:
+            return None
+        try:
+            return int(client.get(self.revocations_key) or 0)
+        except Exception as e:
+            mark_redis_unavailable(e)
+            return None
+
+    def _is_current(self, cached: _CachedIdentity) -> bool:
+        """Si la identidad en cache sigue valiendo (sin revocaciones desde que se cargó)"""
+        generation = self._revocation_generation()
+        if generation is None:
+            return time.monotonic() - cached.loaded_at < settings.api_key_cache_unshared_ttl
+        return cached.generation == generation
+
+    def _load(self, key_hash: str):
+        # Antes de la consulta: una revocación confirmada después invalida lo que se lea
+        generation = self._revocation_generation()
+        loaded_at = time.monotonic()
+        db_session = SessionLocal()
+        try:
+            row = db_session.query(
+                APIKey.id, APIKey.user_id, APIKey.is_active, APIKey.expires_at,
+                User.role, User.is_active
+            ).join(User, User.id == APIKey.user_id).filter(APIKey.key_hash == key_hash).first()
+        finally:
+            db_session.close()
+
+        if row is None:
+            self.cache.set(key_hash, _MISSING, _NEGATIVE_TTL)
+            return _MISSING
+
+        key_id, user_id, key_active, expires_at, role, user_active = row
+        identity = APIKeyIdentity(
+            key_id=key_id,
+            user_id=user_id,
+            role=role.value if role else None,
+            is_active=bool(key_active) and bool(user_active),
+            expires_at=expires_at
+        )
+        self.cache.set(key_hash, _CachedIdentity(identity, loaded_at, generation), settings.api_key_cache_ttl)
+        return identity
+
+api_key_service = APIKeyService()
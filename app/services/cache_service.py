@@ -0,0 +1,153 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+from app.core import metrics
+from app.core.config import settings
+from app.core.redis_client import get_redis, mark_redis_unavailable
+
+logger = logging.getLogger(__name__)
+
+class LRUCache:
+    """Cache LRU en memoria, acotado por número de entradas y con TTL por entrada"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: int):
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def delete_where(self, predicate: Callable[[Any], bool]) -> int:
+        """Borrar las entradas cuyo valor cumple `predicate`. Devuelve cuántas"""
+        with self._lock:
+            keys = [key for key, (_, value) in self._data.items() if predicate(value)]
+            for key in keys:
+                del self._data[key]
+        return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+class ResponseCache:
+    """
+    Cache de dos niveles para respuestas de IA: LRU local del proceso
+    respaldado por Redis compartido entre workers.
+    """
+
+    key_prefix = "gcai:gen:"
+
+    def __init__(self):
+        self.local = LRUCache(settings.cache_max_entries)
+        self._stats_lock = threading.Lock()
+        self._stats = {"local_hits": 0, "redis_hits": 0, "misses": 0, "sets": 0}
+
+    @staticmethod
+    def make_key(content_type: str, topic: str, tone: str, length: str,
+                 additional_prompt: Optional[str], model: str) -> str:
+        """Construir la clave de cache a partir de los parámetros de la petición"""
+        payload = json.dumps({
+            "content_type": content_type,
+            "topic": topic.strip(),
+            "tone": tone,
+            "length": length,
+            "additional_prompt": (additional_prompt or "").strip(),
+            "model": model
+        }, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def ttl_for(content_type: str) -> int:
+        """TTL en segundos según el tipo de contenido"""
+        return settings.cache_ttls.get(content_type, settings.cache_default_ttl)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Buscar primero en memoria y después en Redis"""
+        value = self.local.get(key)
+        if value is not None:
+            self._count("local_hits")
+            return value
+
+        client = self._redis()
+        if client is not None:
+            try:
+                raw = client.get(self.key_prefix + key)
+                if raw is not None:
+                    value = json.loads(raw)
+                    ttl = client.ttl(self.key_prefix + key)
+                    if ttl and ttl > 0:
+                        self.local.set(key, value, ttl)
+                    self._count("redis_hits")
+                    return value
+            except Exception as e:
+                mark_redis_unavailable(e)
+
+        self._count("misses")
+        return None
+
+    def set(self, key: str, value: Dict[str, Any], content_type: str):
+        """Guardar en ambos niveles con el TTL del tipo de contenido"""
+        ttl = self.ttl_for(content_type)
+        if ttl <= 0:
+            return
+
+        self.local.set(key, value, ttl)
+        self._count("sets")
+
+        client = self._redis()
+        if client is not None:
+            try:
+                client.set(self.key_prefix + key, json.dumps(value), ex=ttl)
+            except Exception as e:
+                mark_redis_unavailable(e)
+
+    def stats(self) -> Dict[str, Any]:
+        """Contadores de aciertos y fallos"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        hits = stats["local_hits"] + stats["redis_hits"]
+        lookups = hits + stats["misses"]
+        stats["hits"] = hits
+        stats["hit_ratio"] = round(hits / lookups, 4) if lookups else 0.0
+        stats["local_entries"] = len(self.local)
+        return stats
+
+    def _count(self, name: str):
+        with self._stats_lock:
+            self._stats[name] += 1
+        metrics.count_cache("responses", name)
+
+    def _redis(self):
+        if not settings.cache_redis_enabled:
+            return None
+        return get_redis()
+
+response_cache = ResponseCache()
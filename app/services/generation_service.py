@@ -0,0 +1,89 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+from app.core.config import settings
+from app.models.generation import Generation
+from app.services.prompt_templates import CONTENT_TYPES, LENGTHS, TONES, get_template
+
+VALID_CONTENT_TYPES = list(CONTENT_TYPES)
+VALID_TONES = TONES
+VALID_LENGTHS = LENGTHS
+REQUIRED_FIELDS = ['content_type', 'topic', 'tone', 'length']
+
+def validate_generation_request(data: Optional[Dict[str, Any]]) -> Optional[str]:
+    """
+    Validar los parámetros de una generación.
+    Devuelve el mensaje de error o None si la petición es válida.
+    """
+    if not data or not all(field in data for field in REQUIRED_FIELDS):
+        return "Faltan campos requeridos"
+
+    if data['content_type'] not in VALID_CONTENT_TYPES:
+        return f"Tipo de contenido no válido. Opciones: {', '.join(VALID_CONTENT_TYPES)}"
+
+    if data['tone'] not in VALID_TONES:
+        return f"Tono no válido. Opciones: {', '.join(VALID_TONES)}"
+
+    if data['length'] not in VALID_LENGTHS:
+        return f"Longitud no válida. Opciones: {', '.join(VALID_LENGTHS)}"
+
+    template = get_template(data['content_type'], data['tone'], data['length'])
+    prompt_tokens = template.estimate_prompt_tokens(str(data['topic']), data.get('additional_prompt'))
+    if prompt_tokens > settings.prompt_max_tokens:
+        return f"El tema y las instrucciones adicionales son demasiado largos (máximo ~{settings.prompt_max_tokens} tokens)"
+
+    return None
+
+def wants_async(data: Dict[str, Any], prefer_header: str = "") -> bool:
+    """Decidir si la generación se procesa como job en segundo plano"""
+    if 'async' in data:
+        return data['async'] is True
+    if 'respond-async' in prefer_header:
+        return True
+    return settings.generation_async_default
+
+def generation_params(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Extraer los parámetros que se envían a OpenAIService.generate_content"""
+    return {
+        "content_type": data['content_type'],
+        "topic": data['topic'],
+        "tone": data['tone'],
+        "length": data['length'],
+        "additional_prompt": data.get('additional_prompt'),
+        "use_cache": data.get('use_cache', True) is not False
+    }
+
+def generation_values(user_id: int, data: Dict[str, Any], result: Dict[str, Any]) -> Dict[str, Any]:
+    """Valores de columna de una Generation a partir de la petición y el resultado de la IA"""
+    return {
+        "user_id": user_id,
+        "content_type": data['content_type'],
+        "topic": data['topic'],
+        "tone": data['tone'],
+        "length": data['length'],
+        "additional_prompt": data.get('additional_prompt'),
+        "generated_content": result["content"],
+        "tokens_used": result["tokens_used"],
+        "processing_time": result["processing_time"],
+        "model_used": result["model_used"]
+    }
+
+def build_generation(user_id: int, data: Dict[str, Any], result: Dict[str, Any]) -> Generation:
+    """Construir la fila Generation a partir de la petición y el resultado de la IA"""
+    return Generation(**generation_values(user_id, data, result))
+
+def generate_many(openai_service, items: List[Dict[str, Any]], max_workers: int) -> List[Dict[str, Any]]:
+    """
+    Generar varios contenidos en paralelo con un pool de hilos acotado.
+    Devuelve, en el mismo orden que `items`, {"result": ...} o {"error": ...}.
+    """
+    def run(item):
+        try:
+            return {"result": openai_service.generate_content(**generation_params(item))}
+        except Exception as e:
+            return {"error": str(e)}
+
+    if not items:
+        return []
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as executor:
+        return list(executor.map(run, items))
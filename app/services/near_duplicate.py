@@ -0,0 +1,354 @@
+import hashlib
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, FrozenSet, List, NamedTuple, Optional, Set, Tuple
+from sqlalchemy import select
+from app.core import metrics
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.core.latency import LatencyTracker
+from app.models.generation import Generation
+
+logger = logging.getLogger(__name__)
+
+# NEAR_DUPLICATE_MODE con índice activo (con "off" no se carga nada)
+ENABLED_MODES = ("suggest", "serve")
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+# Palabras vacías: "zapatos de cuero para hombre" y "zapatos hombre cuero" tienen los mismos términos
+_STOPWORDS = frozenset(
+    "a al con de del e el en la las lo los o para por que se sin sobre su sus u un una unas unos y".split()
+)
+# Primo de Mersenne 2^61 - 1 para las permutaciones (a * x + b) mod p
+_PRIME = (1 << 61) - 1
+_LATENCY_WINDOW = 1000
+# Filas por consulta al cargar el índice desde `generations`
+_LOAD_BATCH = 1000
+
+def shingles(topic: Optional[str], additional_prompt: Optional[str]) -> FrozenSet[str]:
+    """
+    Términos normalizados del tema y las instrucciones adicionales: sin
+    mayúsculas, acentos, signos ni palabras vacías, y con el plural en -s
+    recortado. Es un conjunto, así que el orden de las palabras no cuenta.
+    """
+    text = unicodedata.normalize("NFKD", f"{topic or ''} {additional_prompt or ''}".lower())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    terms = set()
+    for token in _TOKEN.findall(text):
+        if token in _STOPWORDS:
+            continue
+        if len(token) > 3 and token.endswith("s"):
+            token = token[:-1]
+        terms.add(sys.intern(token))
+    return frozenset(terms)
+
+class MinHasher:
+    """Firmas MinHash de `num_perm` permutaciones aleatorias (semilla fija)"""
+
+    def __init__(self, num_perm: int, seed: int = 1):
+        rng = random.Random(seed)
+        self.params = [(rng.randrange(1, _PRIME), rng.randrange(0, _PRIME)) for _ in range(num_perm)]
+
+    def signature(self, terms: FrozenSet[str]) -> Tuple[int, ...]:
+        hashes = [int.from_bytes(hashlib.blake2b(term.encode("utf-8"), digest_size=8).digest(), "big")
+                  for term in terms]
+        return tuple(min((a * value + b) % _PRIME for value in hashes) for a, b in self.params)
+
+class Match(NamedTuple):
+    generation_id: int
+    user_id: int
+    similarity: float
+
+def describe_match(match: Optional[Match], user_id: int, served: bool) -> Optional[Dict[str, Any]]:
+    """Campo `similar_generation` de la respuesta (el id solo si la generación es del usuario)"""
+    if match is None:
+        return None
+    return {
+        "id": match.generation_id if match.user_id == user_id else None,
+        "similarity": match.similarity,
+        "served": served
+    }
+
+class _Entry(NamedTuple):
+    user_id: int
+    terms: FrozenSet[str]
+    buckets: Tuple[int, ...]
+
+class NearDuplicateIndex:
+    """
+    Índice MinHash/LSH por worker de las peticiones ya generadas, agrupado
+    por (content_type, tone, length). La firma se parte en
+    NEAR_DUPLICATE_BANDS bandas; dos peticiones son candidatas si coinciden
+    en alguna banda, y se confirma con la similitud de Jaccard exacta de sus
+    términos frente a NEAR_DUPLICATE_THRESHOLD.
+
+    Se carga en un hilo en segundo plano con las últimas
+    NEAR_DUPLICATE_MAX_ENTRIES generaciones y el mismo hilo añade cada
+    NEAR_DUPLICATE_REFRESH_INTERVAL segundos las nuevas de otros procesos.
+    Al superar el máximo se descartan las entradas menos usadas. Solo se
+    guardan ids y términos: el contenido se lee de la base de datos.
+    """
+
+    def __init__(self):
+        self.hasher = MinHasher(settings.near_duplicate_num_perm)
+        self.bands = settings.near_duplicate_bands
+        self.rows = max(1, settings.near_duplicate_num_perm // self.bands)
+        self._init_state()
+        # Tras un fork (gunicorn) el hijo no tiene el hilo de carga y los locks pueden haberse copiado cogidos
+        os.register_at_fork(after_in_child=self._init_state)
+
+    def _init_state(self):
+        """
+        Estado vacío del índice. Solo se llama al crear el objeto y en el hijo
+        justo después de un fork, cuando aún no hay otros hilos que lo usen.
+        """
+        self.latency = LatencyTracker(_LATENCY_WINDOW)
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._pid = None
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._buckets: Dict[int, Set[int]] = {}
+        self._max_id = 0
+        self._ready = threading.Event()
+        self._stop = threading.Event()
+        self._stats = {"matches": 0, "misses": 0, "warming": 0, "served": 0}
+
+    def find(self, user_id: int, data: Dict[str, Any]) -> Optional[Match]:
+        """
+        Generación previa parecida a la petición, solo entre las del propio
+        usuario. En modo serve, NEAR_DUPLICATE_CROSS_USER amplía la búsqueda
+        a las de cualquiera (como la cache de respuestas).
+        """
+        if settings.near_duplicate_mode not in ENABLED_MODES:
+            return None
+        self._ensure_started()
+        if not self._ready.is_set():
+            self._count("warming")
+            return None
+
+        start = time.perf_counter()
+        match = self.lookup(
+            data['content_type'], data['tone'], data['length'], data['topic'], data.get('additional_prompt'),
+            user_id=None if settings.near_duplicate_mode == "serve" and settings.near_duplicate_cross_user else user_id
+        )
+        elapsed = time.perf_counter() - start
+        self.latency.record(elapsed * 1000, ok=True)
+        metrics.NEAR_DUPLICATE_LOOKUP.observe(elapsed)
+        self._count("matches" if match else "misses")
+        return match
+
+    def lookup(self, content_type: str, tone: str, length: str, topic: str,
+               additional_prompt: Optional[str] = None, user_id: Optional[int] = None) -> Optional[Match]:
+        """La entrada más parecida por encima del umbral, o None"""
+        terms = shingles(topic, additional_prompt)
+        if not terms:
+            return None
+        buckets = self._bucket_keys((content_type, tone, length), terms)
+
+        with self._lock:
+            candidates = set()
+            for key in buckets:
+                candidates.update(self._buckets.get(key, ()))
+            best = None
+            for generation_id in candidates:
+                entry = self._entries[generation_id]
+                if user_id is not None and entry.user_id != user_id:
+                    continue
+                similarity = len(terms & entry.terms) / len(terms | entry.terms)
+                if similarity >= settings.near_duplicate_threshold and (
+                    best is None or similarity > best.similarity
+                    or (similarity == best.similarity and generation_id > best.generation_id)
+                ):
+                    best = Match(generation_id, entry.user_id, round(similarity, 4))
+            if best is not None:
+                self._entries.move_to_end(best.generation_id)
+        return best
+
+    def add(self, generation_id: int, user_id: int, content_type: str, tone: str, length: str,
+            topic: str, additional_prompt: Optional[str] = None, recent: bool = True):
+        """
+        Añadir una generación (sin efecto si ya está en el índice). Con
+        `recent=False` entra como la menos usada: la carga inicial no
+        desplaza a las generaciones añadidas mientras tanto.
+        """
+        terms = shingles(topic, additional_prompt)
+        if not terms:
+            return
+        buckets = self._bucket_keys((content_type, tone, length), terms)
+        with self._lock:
+            if generation_id in self._entries:
+                return
+            self._entries[generation_id] = _Entry(user_id, terms, buckets)
+            if not recent:
+                self._entries.move_to_end(generation_id, last=False)
+            for key in buckets:
+                self._buckets.setdefault(key, set()).add(generation_id)
+            while len(self._entries) > settings.near_duplicate_max_entries:
+                self._evict()
+
+    def add_generation(self, generation: Generation):
+        """Añadir una generación recién guardada sin esperar al refresco periódico"""
+        if settings.near_duplicate_mode not in ENABLED_MODES:
+            return
+        self._ensure_started()
+        self.add(generation.id, generation.user_id, generation.content_type, generation.tone,
+                 generation.length, generation.topic, generation.additional_prompt)
+
+    def cached_result(self, match: Match, start_time: float) -> Optional[Dict[str, Any]]:
+        """Resultado de la generación encontrada con el formato de un acierto de cache"""
+        db_session = SessionLocal()
+        try:
+            row = db_session.execute(
+                select(Generation.generated_content, Generation.tokens_used, Generation.model_used)
+                .where(Generation.id == match.generation_id)
+            ).first()
+        finally:
+            db_session.close()
+        if row is None:
+            self.remove(match.generation_id)
+            return None
+        self._count("served")
+        return {
+            "content": row.generated_content,
+            "tokens_used": row.tokens_used,
+            "processing_time": int((time.time() - start_time) * 1000),
+            "model_used": row.model_used,
+            "cached": True,
+            "coalesced": False
+        }
+
+    def remove(self, generation_id: int):
+        with self._lock:
+            entry = self._entries.pop(generation_id, None)
+            if entry is not None:
+                self._discard_buckets(generation_id, entry)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        lookups = stats["matches"] + stats["misses"]
+        return {
+            **stats,
+            "mode": settings.near_duplicate_mode,
+            "ready": self._ready.is_set(),
+            "match_ratio": round(stats["matches"] / lookups, 4) if lookups else 0.0,
+            "entries": len(self._entries),
+            "max_entries": settings.near_duplicate_max_entries,
+            "buckets": len(self._buckets),
+            "threshold": settings.near_duplicate_threshold,
+            "lookup_latency": self.latency.snapshot()
+        }
+
+    def _bucket_keys(self, group: Tuple[str, str, str], terms: FrozenSet[str]) -> Tuple[int, ...]:
+        signature = self.hasher.signature(terms)
+        return tuple(
+            hash((group, band, signature[band * self.rows:(band + 1) * self.rows]))
+            for band in range(self.bands)
+        )
+
+    def _evict(self):
+        generation_id, entry = self._entries.popitem(last=False)
+        self._discard_buckets(generation_id, entry)
+
+    def _discard_buckets(self, generation_id: int, entry: _Entry):
+        for key in entry.buckets:
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(generation_id)
+                if not bucket:
+                    del self._buckets[key]
+
+    def _ensure_started(self):
+        """Arrancar el hilo de carga en este proceso (una vez por worker)"""
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            # El estado no se sustituye aquí: otros hilos pueden estar usándolo
+            thread = threading.Thread(target=self._run, name="near-duplicate-index", daemon=True)
+            thread.start()
+            self._pid = os.getpid()
+
+    def _run(self):
+        loaded = False
+        while True:
+            try:
+                if not loaded:
+                    self._load_recent()
+                    loaded = True
+                    self._ready.set()
+                else:
+                    self._load_new()
+            except Exception as e:
+                logger.error(f"Error actualizando el índice de casi duplicados: {str(e)}")
+            if self._stop.wait(settings.near_duplicate_refresh_interval):
+                return
+
+    def _load_recent(self):
+        """Carga inicial: las últimas NEAR_DUPLICATE_MAX_ENTRIES generaciones"""
+        start = time.perf_counter()
+        rows: List = []
+        before = None
+        while len(rows) < settings.near_duplicate_max_entries:
+            query = self._select().order_by(Generation.id.desc()).limit(
+                min(_LOAD_BATCH, settings.near_duplicate_max_entries - len(rows))
+            )
+            if before is not None:
+                query = query.where(Generation.id < before)
+            batch = self._fetch(query)
+            if not batch:
+                break
+            rows.extend(batch)
+            before = batch[-1].id
+        # De la más nueva a la más antigua, cada una detrás de las anteriores
+        for row in rows:
+            self._add_row(row, recent=False)
+        logger.info(f"Índice de casi duplicados cargado: {len(self._entries)} entradas "
+                    f"en {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    def _load_new(self):
+        """Generaciones posteriores a la última cargada (incluidas las de otros workers)"""
+        while True:
+            batch = self._fetch(
+                self._select().where(Generation.id > self._max_id).order_by(Generation.id).limit(_LOAD_BATCH)
+            )
+            for row in batch:
+                self._add_row(row)
+            if len(batch) < _LOAD_BATCH:
+                return
+
+    @staticmethod
+    def _select():
+        return select(
+            Generation.id, Generation.user_id, Generation.content_type, Generation.tone,
+            Generation.length, Generation.topic, Generation.additional_prompt
+        )
+
+    @staticmethod
+    def _fetch(query) -> List:
+        db_session = SessionLocal()
+        try:
+            return db_session.execute(query).all()
+        finally:
+            db_session.close()
+
+    def _add_row(self, row, recent: bool = True):
+        self.add(row.id, row.user_id, row.content_type, row.tone, row.length, row.topic, row.additional_prompt,
+                 recent)
+        self._max_id = max(self._max_id, row.id)
+
+    def _count(self, name: str):
+        with self._stats_lock:
+            self._stats[name] += 1
+        metrics.NEAR_DUPLICATE_EVENTS.labels(name).inc()
+
+near_duplicates = NearDuplicateIndex()
@@ -1,122 +1,410 @@
-import openai
+import asyncio
+import random
+import threading
 import time
-from typing import Dict, Any, Optional
+from itertools import chain
+from typing import Dict, Any, Awaitable, Callable, Iterator, List, Optional, Tuple
+from app.core import metrics
 from app.core.config import settings
+from app.core.circuit_breaker import CircuitOpenError
+from app.services.cache_service import response_cache
+from app.services.prompt_templates import estimate_tokens, get_template
+from app.services.providers import Backend, ProviderError, build_router
+from app.services.singleflight import singleflight
 import logging
 
 logger = logging.getLogger(__name__)
 
+class UpstreamUnavailableError(Exception):
+    """Ningún proveedor de IA respondió tras agotar reintentos y fallbacks"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+# Errores que la API traduce a 503 con Retry-After
+UNAVAILABLE_ERRORS = (UpstreamUnavailableError, CircuitOpenError)
+
+async def _offload_cache(fn, *args):
+    """Con Redis las operaciones de cache bloquean: se ejecutan en un hilo"""
+    if settings.cache_redis_enabled:
+        return await asyncio.to_thread(fn, *args)
+    return fn(*args)
+
+# Parámetros de muestreo comunes a todos los proveedores
+SAMPLING_PARAMS = {
+    "temperature": 0.7,
+    "top_p": 0.9,
+    "frequency_penalty": 0.1,
+    "presence_penalty": 0.1
+}
+
 class OpenAIService:
-    def __init__(self):
-        openai.api_key = settings.openai_api_key
-        self.model = settings.openai_model
-        self.max_tokens = settings.openai_max_tokens
+    """
+    Servicio de generación de contenido. Enruta cada petición entre los
+    proveedores configurados (AI_PROVIDERS) según el tipo de contenido y la
+    latencia y tasa de error observadas, con circuit breaker por backend y
+    fallback automático cuando uno se degrada.
+    """
+
+    def __init__(self, router=None):
+        self.router = router or build_router()
     
     def generate_content(self, content_type: str, topic: str, tone: str, 
-                        length: str, additional_prompt: Optional[str] = None) -> Dict[str, Any]:
+                        length: str, additional_prompt: Optional[str] = None,
+                        use_cache: bool = True) -> Dict[str, Any]:
+        """
+        Generar contenido, pasando antes por la cache de respuestas
+        """
+        start_time = time.time()
+        use_cache = use_cache and settings.cache_enabled
+        cache_key = response_cache.make_key(content_type, topic, tone, length,
+                                            additional_prompt, self.router.primary_model(content_type))
+        
+        if use_cache:
+            cached = response_cache.get(cache_key)
+            if cached is not None:
+                processing_time = int((time.time() - start_time) * 1000)
+                return {**cached, "processing_time": processing_time, "cached": True, "coalesced": False}
+        
+        def generate():
+            result = self._generate(content_type, topic, tone, length, additional_prompt)
+            if use_cache:
+                response_cache.set(cache_key, result, content_type)
+            return result
+        
+        # Las peticiones idénticas en curso comparten una única llamada al proveedor
+        if settings.singleflight_enabled:
+            result, coalesced = singleflight.do(cache_key, generate)
+        else:
+            result, coalesced = generate(), False
+        
+        if coalesced:
+            result["processing_time"] = int((time.time() - start_time) * 1000)
+        
+        return {**result, "cached": False, "coalesced": coalesced}
+    
+    def _generate(self, content_type: str, topic: str, tone: str, 
+                  length: str, additional_prompt: Optional[str] = None) -> Dict[str, Any]:
         """
-        Generar contenido usando OpenAI
+        Llamar al proveedor sin cache
         """
         start_time = time.time()
         
-        # Construir prompt según el tipo de contenido
-        prompt = self._build_prompt(content_type, topic, tone, length, additional_prompt)
+        template = get_template(content_type, tone, length)
+        messages = self._messages(template, topic, additional_prompt)
+        max_tokens = template.output_budget(template.estimate_prompt_tokens(topic, additional_prompt))
         
         try:
-            response = openai.ChatCompletion.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": self._get_system_prompt(content_type)},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=self.max_tokens,
-                temperature=0.7,
-                top_p=0.9,
-                frequency_penalty=0.1,
-                presence_penalty=0.1
+            backend, completion = self._call(
+                content_type,
+                lambda provider, timeout: provider.complete(messages, max_tokens, timeout, **SAMPLING_PARAMS)
             )
             
             processing_time = int((time.time() - start_time) * 1000)  # en milisegundos
+            metrics.observe_ai_tokens(backend, content_type, completion.tokens_used)
             
             return {
-                "content": response.choices[0].message.content.strip(),
-                "tokens_used": response.usage.total_tokens,
+                "content": completion.content,
+                "tokens_used": completion.tokens_used,
                 "processing_time": processing_time,
-                "model_used": self.model
+                "model_used": backend.provider.model
             }
             
+        except UNAVAILABLE_ERRORS:
+            raise
         except Exception as e:
             logger.error(f"Error generando contenido: {str(e)}")
             raise Exception(f"Error al generar contenido: {str(e)}")
     
-    def _build_prompt(self, content_type: str, topic: str, tone: str, 
-                     length: str, additional_prompt: Optional[str] = None) -> str:
+    async def agenerate_content(self, content_type: str, topic: str, tone: str, 
+                                length: str, additional_prompt: Optional[str] = None,
+                                use_cache: bool = True) -> Dict[str, Any]:
         """
-        Construir prompt específico según el tipo de contenido
+        Versión asíncrona de generate_content para el modo ASGI
         """
-        base_prompt = f"Genera contenido sobre: {topic}\n"
-        base_prompt += f"Tono: {tone}\n"
-        base_prompt += f"Longitud: {length}\n"
-        
-        if additional_prompt:
-            base_prompt += f"Instrucciones adicionales: {additional_prompt}\n"
-        
-        # Agregar instrucciones específicas según el tipo
-        if content_type == "post_social":
-            base_prompt += "Crea un post atractivo para redes sociales con hashtags relevantes."
-        elif content_type == "email":
-            base_prompt += "Escribe un email profesional y persuasivo."
-        elif content_type == "description":
-            base_prompt += "Crea una descripción detallada y atractiva."
-        elif content_type == "title":
-            base_prompt += "Genera títulos llamativos y optimizados para SEO."
-        elif content_type == "blog_post":
-            base_prompt += "Escribe un artículo de blog completo y bien estructurado."
+        start_time = time.time()
+        use_cache = use_cache and settings.cache_enabled
+        cache_key = response_cache.make_key(content_type, topic, tone, length,
+                                            additional_prompt, self.router.primary_model(content_type))
+        
+        if use_cache:
+            cached = await _offload_cache(response_cache.get, cache_key)
+            if cached is not None:
+                processing_time = int((time.time() - start_time) * 1000)
+                return {**cached, "processing_time": processing_time, "cached": True, "coalesced": False}
+        
+        async def generate():
+            result = await self._agenerate(content_type, topic, tone, length, additional_prompt)
+            if use_cache:
+                await _offload_cache(response_cache.set, cache_key, result, content_type)
+            return result
+        
+        if settings.singleflight_enabled:
+            result, coalesced = await singleflight.ado(cache_key, generate)
         else:
-            base_prompt += "Genera contenido creativo y de calidad."
+            result, coalesced = await generate(), False
         
-        return base_prompt
+        if coalesced:
+            result["processing_time"] = int((time.time() - start_time) * 1000)
+        
+        return {**result, "cached": False, "coalesced": coalesced}
     
-    def _get_system_prompt(self, content_type: str) -> str:
+    async def _agenerate(self, content_type: str, topic: str, tone: str, 
+                         length: str, additional_prompt: Optional[str] = None) -> Dict[str, Any]:
         """
-        Obtener prompt del sistema según el tipo de contenido
+        Llamar al proveedor sin cache (asíncrono)
         """
-        system_prompts = {
-            "post_social": """Eres un experto en marketing digital y redes sociales. 
-            Crea contenido viral, atractivo y que genere engagement. 
-            Incluye hashtags relevantes y emojis apropiados.""",
+        start_time = time.time()
+        
+        template = get_template(content_type, tone, length)
+        messages = self._messages(template, topic, additional_prompt)
+        max_tokens = template.output_budget(template.estimate_prompt_tokens(topic, additional_prompt))
+        
+        try:
+            backend, completion = await self._acall(
+                content_type,
+                lambda provider, timeout: provider.acomplete(messages, max_tokens, timeout, **SAMPLING_PARAMS)
+            )
+            metrics.observe_ai_tokens(backend, content_type, completion.tokens_used)
             
-            "email": """Eres un copywriter experto en email marketing. 
-            Crea emails persuasivos, profesionales y que generen conversiones. 
-            Usa técnicas de copywriting probadas.""",
+            return {
+                "content": completion.content,
+                "tokens_used": completion.tokens_used,
+                "processing_time": int((time.time() - start_time) * 1000),
+                "model_used": backend.provider.model
+            }
             
-            "description": """Eres un experto en descripciones de productos y servicios. 
-            Crea descripciones atractivas, detalladas y que conviertan. 
-            Enfócate en beneficios y características clave.""",
+        except UNAVAILABLE_ERRORS:
+            raise
+        except Exception as e:
+            logger.error(f"Error generando contenido: {str(e)}")
+            raise Exception(f"Error al generar contenido: {str(e)}")
+    
+    def stream_content(self, content_type: str, topic: str, tone: str, 
+                       length: str, additional_prompt: Optional[str] = None,
+                       use_cache: bool = True) -> Iterator[Dict[str, Any]]:
+        """
+        Generar contenido en modo streaming.
+        Produce eventos {"type": "delta", "content": ...} y al final un evento
+        {"type": "done", ...} con el texto completo y sus métricas.
+        """
+        start_time = time.time()
+        use_cache = use_cache and settings.cache_enabled
+        cache_key = None
+        
+        if use_cache:
+            cache_key = response_cache.make_key(content_type, topic, tone, length,
+                                                additional_prompt, self.router.primary_model(content_type))
+            cached = response_cache.get(cache_key)
+            if cached is not None:
+                elapsed = int((time.time() - start_time) * 1000)
+                yield {"type": "delta", "content": cached["content"]}
+                yield {"type": "done", **cached, "processing_time": elapsed,
+                       "time_to_first_token": elapsed, "cached": True}
+                return
+        
+        template = get_template(content_type, tone, length)
+        messages = self._messages(template, topic, additional_prompt)
+        prompt_tokens = template.estimate_prompt_tokens(topic, additional_prompt)
+        max_tokens = template.output_budget(prompt_tokens)
+        
+        def open_stream(provider, timeout):
+            # Se espera al primer fragmento para poder hacer fallback si el backend falla al empezar
+            chunks = provider.stream(messages, max_tokens, timeout, **SAMPLING_PARAMS)
+            return next(chunks, None), chunks
+        
+        try:
+            backend, (first, chunks) = self._call(content_type, open_stream)
             
-            "title": """Eres un experto en SEO y copywriting. 
-            Crea títulos llamativos, optimizados para SEO y que generen clicks. 
-            Usa palabras de poder y técnicas de persuasión.""",
+            parts = []
+            time_to_first_token = None
+            for delta in chain([first], chunks):
+                if not delta:
+                    continue
+                if time_to_first_token is None:
+                    elapsed = time.time() - start_time
+                    time_to_first_token = int(elapsed * 1000)
+                    metrics.observe_ai_first_token(backend, elapsed)
+                parts.append(delta)
+                yield {"type": "delta", "content": delta}
             
-            "blog_post": """Eres un blogger experto y escritor profesional. 
-            Crea artículos informativos, bien estructurados y que aporten valor. 
-            Usa un lenguaje claro y accesible."""
+        except UNAVAILABLE_ERRORS:
+            raise
+        except Exception as e:
+            logger.error(f"Error generando contenido en streaming: {str(e)}")
+            raise Exception(f"Error al generar contenido: {str(e)}")
+        
+        content = "".join(parts).strip()
+        result = {
+            "content": content,
+            # El modo streaming no devuelve usage: se estima a partir del texto
+            "tokens_used": prompt_tokens + estimate_tokens(content),
+            "processing_time": int((time.time() - start_time) * 1000),
+            "model_used": backend.provider.model
         }
+        metrics.observe_ai_tokens(backend, content_type, result["tokens_used"])
+        
+        if use_cache and content:
+            response_cache.set(cache_key, result, content_type)
+        
+        yield {"type": "done", **result, "time_to_first_token": time_to_first_token, "cached": False}
+    
+    def stats(self) -> Dict[str, Any]:
+        """Latencias, tasa de error y estado del circuito de cada backend"""
+        return self.router.stats()
+    
+    def _messages(self, template, topic: str, additional_prompt: Optional[str]) -> List[Dict[str, str]]:
+        return [
+            {"role": "system", "content": template.system_prompt},
+            {"role": "user", "content": template.build_prompt(topic, additional_prompt)}
+        ]
+    
+    def _call(self, content_type: str, invoke: Callable[[Any, float], Any]) -> Tuple[Backend, Any]:
+        """
+        Ejecutar `invoke(provider, timeout)` sobre los backends en el orden que
+        decide el router. Un fallo transitorio pasa al siguiente backend; si
+        fallan todos se reintenta la ronda con backoff y jitter dentro del
+        timeout total. Sin ningún backend disponible se lanza
+        UpstreamUnavailableError, o CircuitOpenError si todos tienen el
+        circuito abierto.
+        """
+        timeout = settings.openai_timeouts.get(content_type, settings.openai_timeout)
+        deadline = time.monotonic() + settings.openai_total_timeout
+        attempt = 0
+        
+        while True:
+            last_error = None
+            open_circuit = None
+            for backend in self.router.candidates(content_type):
+                if last_error is not None and time.monotonic() + timeout > deadline:
+                    break
+                open_circuit, allowed = self._admit(backend, open_circuit)
+                if not allowed:
+                    continue
+                
+                start = time.perf_counter()
+                try:
+                    value = invoke(backend.provider, timeout)
+                except ProviderError as e:
+                    last_error = self._on_failure(backend, content_type, e, start)
+                    continue
+                
+                self._on_success(backend, content_type, start)
+                return backend, value
+            
+            time.sleep(self._round_failed(last_error, open_circuit, attempt, timeout, deadline))
+            attempt += 1
+    
+    async def _acall(self, content_type: str, invoke: Callable[[Any, float], Awaitable[Any]]) -> Tuple[Backend, Any]:
+        """Versión asíncrona de `_call` (mismo orden, fallback y reintentos)"""
+        timeout = settings.openai_timeouts.get(content_type, settings.openai_timeout)
+        deadline = time.monotonic() + settings.openai_total_timeout
+        attempt = 0
+        
+        while True:
+            last_error = None
+            open_circuit = None
+            for backend in self.router.candidates(content_type):
+                if last_error is not None and time.monotonic() + timeout > deadline:
+                    break
+                open_circuit, allowed = self._admit(backend, open_circuit)
+                if not allowed:
+                    continue
+                
+                start = time.perf_counter()
+                try:
+                    value = await invoke(backend.provider, timeout)
+                except ProviderError as e:
+                    last_error = self._on_failure(backend, content_type, e, start)
+                    continue
+                
+                self._on_success(backend, content_type, start)
+                return backend, value
+            
+            await asyncio.sleep(self._round_failed(last_error, open_circuit, attempt, timeout, deadline))
+            attempt += 1
+    
+    def _admit(self, backend: Backend, open_circuit: Optional[CircuitOpenError]):
+        """Consultar el circuit breaker; guarda el circuito abierto con menor Retry-After"""
+        try:
+            backend.breaker.before_call()
+            return open_circuit, True
+        except CircuitOpenError as e:
+            if open_circuit is None or e.retry_after < open_circuit.retry_after:
+                open_circuit = e
+            return open_circuit, False
+    
+    def _on_success(self, backend: Backend, content_type: str, start: float):
+        elapsed = time.perf_counter() - start
+        backend.breaker.record_success()
+        backend.tracker.record(elapsed * 1000, ok=True)
+        metrics.observe_ai_call(backend, content_type, "success", elapsed)
+    
+    def _on_failure(self, backend: Backend, content_type: str, error: ProviderError, start: float) -> ProviderError:
+        """Registrar un fallo transitorio; los errores no reintentables se propagan"""
+        elapsed = time.perf_counter() - start
+        if not error.retryable:
+            # El backend respondió: el error es de la petición, no de disponibilidad
+            backend.breaker.record_success()
+            metrics.observe_ai_call(backend, content_type, "error", elapsed)
+            raise error
+        backend.breaker.record_failure()
+        backend.tracker.record(elapsed * 1000, ok=False)
+        metrics.observe_ai_call(backend, content_type, "retryable", elapsed)
+        logger.warning(f"Error transitorio en el proveedor {backend.name}: {str(error)}")
+        return error
+    
+    def _round_failed(self, last_error: Optional[ProviderError], open_circuit: Optional[CircuitOpenError],
+                      attempt: int, timeout: float, deadline: float) -> float:
+        """Segundos a esperar antes de la siguiente ronda, o la excepción si no quedan reintentos"""
+        if last_error is None:
+            if open_circuit is not None:
+                raise open_circuit
+            raise UpstreamUnavailableError("Servicio de IA no disponible", retry_after=1)
         
-        return system_prompts.get(content_type, 
-            "Eres un asistente de IA experto en crear contenido de alta calidad.")
+        delay = self._retry_delay(last_error, attempt)
+        if attempt >= settings.openai_max_retries or time.monotonic() + delay + timeout > deadline:
+            logger.error(f"Proveedores de IA no disponibles tras {attempt + 1} rondas: {str(last_error)}")
+            raise UpstreamUnavailableError(
+                f"Servicio de IA no disponible: {str(last_error)}",
+                retry_after=max(1, int(delay + 0.999))
+            ) from last_error
+        logger.warning(f"Todos los proveedores fallaron, reintento {attempt + 1} en {delay:.2f}s")
+        return delay
+    
+    def _retry_delay(self, error: ProviderError, attempt: int) -> float:
+        """Backoff exponencial con jitter completo; respeta Retry-After en los 429"""
+        if error.retry_after:
+            return error.retry_after
+        return random.uniform(0, settings.openai_retry_backoff * (2 ** attempt))
+    
+    async def aclose(self):
+        """Cerrar las sesiones asíncronas de los proveedores"""
+        for backend in self.router.backends:
+            await backend.provider.aclose()
     
     def test_connection(self) -> bool:
         """
-        Probar conexión con OpenAI
+        Probar conexión con el proveedor por defecto
         """
         try:
-            response = openai.ChatCompletion.create(
-                model=self.model,
-                messages=[{"role": "user", "content": "Hola"}],
-                max_tokens=10
+            self.router.default.provider.complete(
+                [{"role": "user", "content": "Hola"}], 10, settings.openai_timeout
             )
             return True
         except Exception as e:
-            logger.error(f"Error conectando con OpenAI: {str(e)}")
-            return False 
\ No newline at end of file
+            logger.error(f"Error conectando con el proveedor de IA: {str(e)}")
+            return False
+
+_service = None
+_service_lock = threading.Lock()
+
+def get_openai_service() -> OpenAIService:
+    """Instancia única del servicio por proceso (comparte pools HTTP, métricas y circuit breakers)"""
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = OpenAIService()
+    return _service
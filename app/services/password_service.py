@@ -0,0 +1,182 @@
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Optional
+import bcrypt
+from app.core.config import settings
+from app.core.latency import LatencyTracker
+
+logger = logging.getLogger(__name__)
+
+class HashQueueFullError(Exception):
+    """Hay demasiados hashes de contraseña en curso: se rechaza sin esperar"""
+
+    def __init__(self, retry_after: int = 1):
+        super().__init__("Cola de hashing de contraseñas saturada")
+        self.retry_after = retry_after
+
+def _password_bytes(password: str) -> bytes:
+    # bcrypt solo usa los primeros 72 bytes; las versiones antiguas los truncaban sin avisar
+    return password.encode("utf-8")[:72]
+
+def _hash(password: str, rounds: int) -> str:
+    return bcrypt.hashpw(_password_bytes(password), bcrypt.gensalt(rounds=rounds)).decode("utf-8")
+
+def _verify(password: str, hashed: str) -> bool:
+    try:
+        return bcrypt.checkpw(_password_bytes(password), hashed.encode("utf-8"))
+    except ValueError:
+        # Hash con formato inválido
+        return False
+
+def hash_rounds(hashed: str) -> Optional[int]:
+    """Coste (log2 de rondas) de un hash bcrypt "$2b$12$..." """
+    parts = hashed.split("$") if hashed else []
+    try:
+        return int(parts[2])
+    except (IndexError, ValueError):
+        return None
+
+class PasswordHasher:
+    """
+    Hashing de contraseñas con bcrypt fuera del worker web.
+
+    Los hashes se calculan en un pool de procesos acotado (PASSWORD_HASH_WORKERS):
+    el CPU de bcrypt no compite con el del worker web y una ráfaga de logins
+    no ocupa más de PASSWORD_HASH_WORKERS núcleos. Si hay más de
+    PASSWORD_HASH_MAX_PENDING hashes en curso (incluidos los que siguen en el
+    pool tras un timeout) se lanza HashQueueFullError de inmediato (la API
+    responde 429). Con PASSWORD_HASH_WORKERS=0 se calcula en el propio proceso.
+
+    La petición que hace el login espera el resultado en su hilo; con workers
+    `gthread` (GUNICORN_THREADS) el resto de hilos siguen atendiendo peticiones.
+    Si un proceso del pool muere (OOM, kill) el pool queda roto: se descarta,
+    se crea otro y el hash se reintenta una vez.
+    """
+
+    def __init__(self):
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_pid = None
+        self._pool_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(settings.password_hash_max_pending)
+        self._stats_lock = threading.Lock()
+        self._stats = {"hashes": 0, "verifications": 0, "rehashes": 0, "rejected": 0}
+        self.hash_latency = LatencyTracker(settings.password_hash_latency_window)
+        self.login_latency = LatencyTracker(settings.password_hash_latency_window)
+
+    def hash(self, password: str) -> str:
+        """Hash bcrypt con el coste configurado (BCRYPT_ROUNDS)"""
+        hashed = self._run(_hash, password, settings.bcrypt_rounds)
+        self._count("hashes")
+        return hashed
+
+    def verify(self, password: str, hashed: str) -> bool:
+        """Comprobar una contraseña contra su hash"""
+        ok = self._run(_verify, password, hashed)
+        self._count("verifications")
+        return ok
+
+    def needs_rehash(self, hashed: str) -> bool:
+        """El hash se generó con un coste distinto del configurado"""
+        return hash_rounds(hashed) != settings.bcrypt_rounds
+
+    def rehash(self, password: str) -> Optional[str]:
+        """Nuevo hash tras un login correcto; None si la cola está saturada (se reintenta en otro login)"""
+        try:
+            hashed = self.hash(password)
+        except HashQueueFullError:
+            return None
+        self._count("rehashes")
+        return hashed
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        return {
+            **stats,
+            "rounds": settings.bcrypt_rounds,
+            "workers": settings.password_hash_workers,
+            "max_pending": settings.password_hash_max_pending,
+            "hash_latency": self.hash_latency.snapshot(),
+            "login_latency": self.login_latency.snapshot()
+        }
+
+    def shutdown(self):
+        if self._pool is not None and self._pool_pid == os.getpid():
+            self._pool.shutdown(wait=False, cancel_futures=True)
+        self._pool = None
+
+    def _run(self, fn, *args):
+        self._acquire_slot()
+        start = time.perf_counter()
+        ok = False
+        try:
+            try:
+                result = self._execute(fn, *args)
+            except BrokenProcessPool:
+                logger.warning("Pool de hashing de contraseñas roto, se recrea y se reintenta")
+                self._acquire_slot()
+                result = self._execute(fn, *args)
+            ok = True
+            return result
+        finally:
+            self.hash_latency.record((time.perf_counter() - start) * 1000, ok=ok)
+
+    def _acquire_slot(self):
+        if not self._slots.acquire(blocking=False):
+            self._count("rejected")
+            raise HashQueueFullError()
+
+    def _execute(self, fn, *args):
+        """Calcular con un hueco ya reservado; el hueco se libera cuando termina el cálculo"""
+        future = None
+        pool = None
+        try:
+            pool = self._get_pool()
+            if pool is None:
+                return fn(*args)
+            future = pool.submit(fn, *args)
+            # El hueco se libera cuando el hash termina en el pool, no cuando vence el timeout
+            future.add_done_callback(lambda _: self._slots.release())
+            return future.result(timeout=settings.password_hash_timeout)
+        except BrokenProcessPool:
+            self._discard_pool(pool)
+            raise
+        finally:
+            if future is None:
+                self._slots.release()
+            else:
+                # Tras un timeout: si aún no ha empezado no llega a ejecutarse
+                future.cancel()
+
+    def _get_pool(self) -> Optional[ProcessPoolExecutor]:
+        """Pool de procesos de este worker (se crea al primer uso y tras un fork)"""
+        if settings.password_hash_workers <= 0:
+            return None
+        if self._pool is None or self._pool_pid != os.getpid():
+            with self._pool_lock:
+                if self._pool is None or self._pool_pid != os.getpid():
+                    # spawn: no heredar los hilos ni las conexiones del worker web
+                    self._pool = ProcessPoolExecutor(
+                        max_workers=settings.password_hash_workers,
+                        mp_context=multiprocessing.get_context("spawn")
+                    )
+                    self._pool_pid = os.getpid()
+        return self._pool
+
+    def _discard_pool(self, pool: ProcessPoolExecutor):
+        """Quitar un pool roto para que el siguiente uso cree otro (solo si nadie lo ha hecho ya)"""
+        with self._pool_lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def _count(self, name: str):
+        with self._stats_lock:
+            self._stats[name] += 1
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,102 @@
+from typing import Dict, NamedTuple, Optional, Tuple
+from app.core.config import settings
+
+TONES = ["profesional", "casual", "amigable", "formal", "creativo", "persuasivo"]
+LENGTHS = ["corta", "media", "larga"]
+
+DEFAULT_SYSTEM_PROMPT = "Eres un asistente de IA experto en crear contenido de alta calidad."
+DEFAULT_INSTRUCTION = "Genera contenido creativo y de calidad."
+
+# Tipos de contenido: prompt del sistema, instrucción final del prompt y
+# presupuesto de tokens de salida por longitud. Un tipo nuevo se añade aquí.
+CONTENT_TYPES: Dict[str, Dict] = {
+    "post_social": {
+        "system": """Eres un experto en marketing digital y redes sociales.
+            Crea contenido viral, atractivo y que genere engagement.
+            Incluye hashtags relevantes y emojis apropiados.""",
+        "instruction": "Crea un post atractivo para redes sociales con hashtags relevantes.",
+        "max_tokens": {"corta": 120, "media": 250, "larga": 400}
+    },
+    "email": {
+        "system": """Eres un copywriter experto en email marketing.
+            Crea emails persuasivos, profesionales y que generen conversiones.
+            Usa técnicas de copywriting probadas.""",
+        "instruction": "Escribe un email profesional y persuasivo.",
+        "max_tokens": {"corta": 250, "media": 450, "larga": 700}
+    },
+    "description": {
+        "system": """Eres un experto en descripciones de productos y servicios.
+            Crea descripciones atractivas, detalladas y que conviertan.
+            Enfócate en beneficios y características clave.""",
+        "instruction": "Crea una descripción detallada y atractiva.",
+        "max_tokens": {"corta": 150, "media": 300, "larga": 500}
+    },
+    "title": {
+        "system": """Eres un experto en SEO y copywriting.
+            Crea títulos llamativos, optimizados para SEO y que generen clicks.
+            Usa palabras de poder y técnicas de persuasión.""",
+        "instruction": "Genera títulos llamativos y optimizados para SEO.",
+        "max_tokens": {"corta": 60, "media": 100, "larga": 150}
+    },
+    "blog_post": {
+        "system": """Eres un blogger experto y escritor profesional.
+            Crea artículos informativos, bien estructurados y que aporten valor.
+            Usa un lenguaje claro y accesible.""",
+        "instruction": "Escribe un artículo de blog completo y bien estructurado.",
+        "max_tokens": {"corta": 400, "media": 700, "larga": 1000}
+    }
+}
+
+def estimate_tokens(text: str) -> int:
+    """Estimación aproximada de tokens (~4 caracteres por token)"""
+    return max(1, len(text) // 4) if text else 0
+
+class PromptTemplate(NamedTuple):
+    """Plantilla precompilada para una combinación (content_type, tone, length)"""
+    system_prompt: str
+    settings_block: str
+    instruction: str
+    max_tokens: int
+    static_tokens: int
+
+    def build_prompt(self, topic: str, additional_prompt: Optional[str] = None) -> str:
+        """Construir el prompt de usuario con el tema y las instrucciones adicionales"""
+        extra = f"Instrucciones adicionales: {additional_prompt}\n" if additional_prompt else ""
+        return f"Genera contenido sobre: {topic}\n{self.settings_block}{extra}{self.instruction}"
+
+    def estimate_prompt_tokens(self, topic: str, additional_prompt: Optional[str] = None) -> int:
+        """Tokens estimados de entrada (sistema + prompt) sin construir el texto"""
+        return self.static_tokens + estimate_tokens(topic) + estimate_tokens(additional_prompt)
+
+    def output_budget(self, prompt_tokens: int) -> int:
+        """Tokens de salida permitidos sin exceder la ventana de contexto del modelo"""
+        available = settings.openai_context_window - prompt_tokens
+        return max(1, min(self.max_tokens, settings.openai_max_tokens, available))
+
+def _compile(content_type: Optional[str], tone: str, length: str) -> PromptTemplate:
+    spec = CONTENT_TYPES.get(content_type, {})
+    system_prompt = spec.get("system", DEFAULT_SYSTEM_PROMPT)
+    instruction = spec.get("instruction", DEFAULT_INSTRUCTION)
+    settings_block = f"Tono: {tone}\nLongitud: {length}\n"
+    return PromptTemplate(
+        system_prompt=system_prompt,
+        settings_block=settings_block,
+        instruction=instruction,
+        max_tokens=spec.get("max_tokens", {}).get(length, settings.openai_max_tokens),
+        static_tokens=(estimate_tokens(system_prompt) + estimate_tokens("Genera contenido sobre: \n")
+                       + estimate_tokens(settings_block) + estimate_tokens(instruction))
+    )
+
+_REGISTRY: Dict[Tuple[str, str, str], PromptTemplate] = {
+    (content_type, tone, length): _compile(content_type, tone, length)
+    for content_type in CONTENT_TYPES
+    for tone in TONES
+    for length in LENGTHS
+}
+
+def get_template(content_type: str, tone: str, length: str) -> PromptTemplate:
+    """Plantilla de la combinación; las combinaciones no registradas usan los prompts genéricos"""
+    template = _REGISTRY.get((content_type, tone, length))
+    if template is None:
+        template = _compile(content_type, tone, length)
+    return template
@@ -0,0 +1,63 @@
+# Proveedores de modelos de lenguaje
+from importlib import import_module
+from typing import Dict, List, Type
+from urllib.parse import parse_qsl
+from app.core.config import settings
+from .base import Completion, Provider, ProviderError
+from .router import Backend, ProviderRouter
+
+# Tipo -> "módulo:clase". El módulo se importa solo si algún backend lo usa
+# (el SDK de openai es de lo más lento de importar en el arranque)
+PROVIDER_KINDS = {
+    "openai": ".openai_provider:OpenAIProvider",
+    "mock": ".mock:MockProvider"
+}
+
+def provider_class(kind: str) -> Type[Provider]:
+    module, _, name = PROVIDER_KINDS[kind].partition(":")
+    return getattr(import_module(module, __name__), name)
+
+def __getattr__(name):
+    # Compatibilidad: `from app.services.providers import OpenAIProvider`
+    for kind, target in PROVIDER_KINDS.items():
+        if target.endswith(f":{name}"):
+            return provider_class(kind)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def parse_provider_specs(value: str) -> List[Provider]:
+    """
+    Crear los proveedores a partir de "nombre=tipo:modelo?opcion=valor&...",
+    separados por comas. El primero es el backend por defecto.
+    """
+    providers = []
+    for spec in value.split(","):
+        spec = spec.strip()
+        if not spec:
+            continue
+        name, _, target = spec.partition("=")
+        kind, _, model = target.partition(":")
+        model, _, query = model.partition("?")
+        if kind not in PROVIDER_KINDS:
+            raise ValueError(f"Tipo de proveedor desconocido '{kind}' en AI_PROVIDERS")
+        providers.append(provider_class(kind)(name.strip(), model.strip(), dict(parse_qsl(query))))
+    return providers
+
+def parse_routes(value: str) -> Dict[str, List[str]]:
+    """Convertir "tipo:backend|backend,tipo:backend" en {tipo: [backends]}"""
+    routes = {}
+    for item in value.split(","):
+        if ":" not in item:
+            continue
+        content_type, names = item.split(":", 1)
+        routes[content_type.strip()] = [name.strip() for name in names.split("|") if name.strip()]
+    return routes
+
+def build_router() -> ProviderRouter:
+    """Router con los backends y rutas de la configuración"""
+    return ProviderRouter(parse_provider_specs(settings.ai_providers), parse_routes(settings.ai_routes))
+
+__all__ = [
+    "Backend", "Completion", "MockProvider", "OpenAIProvider", "Provider",
+    "ProviderError", "ProviderRouter", "build_router", "parse_provider_specs", "parse_routes",
+    "provider_class"
+]
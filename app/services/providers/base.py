@@ -0,0 +1,52 @@
+import asyncio
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional
+
+class ProviderError(Exception):
+    """
+    Error de un proveedor de modelos. `retryable` indica un fallo transitorio
+    (429, 5xx, timeout, red) que admite reintento o fallback a otro backend.
+    """
+
+    def __init__(self, message: str, retryable: bool = True, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+class Completion(NamedTuple):
+    """Respuesta normalizada de un proveedor"""
+    content: str
+    tokens_used: int
+
+class Provider:
+    """
+    Interfaz de un backend de modelos de lenguaje. Cada implementación
+    traduce sus errores transitorios a ProviderError(retryable=True).
+    """
+
+    kind = "base"
+
+    def __init__(self, name: str, model: str, options: Optional[Dict[str, str]] = None):
+        self.name = name
+        self.model = model
+        self.options = options or {}
+
+    def complete(self, messages: List[Dict[str, str]], max_tokens: int,
+                 timeout: float, **params: Any) -> Completion:
+        """Generar la respuesta completa"""
+        raise NotImplementedError
+
+    def stream(self, messages: List[Dict[str, str]], max_tokens: int,
+               timeout: float, **params: Any) -> Iterator[str]:
+        """Generar la respuesta como una secuencia de fragmentos de texto"""
+        raise NotImplementedError
+
+    async def acomplete(self, messages: List[Dict[str, str]], max_tokens: int,
+                        timeout: float, **params: Any) -> Completion:
+        """Versión asíncrona de complete; por defecto ejecuta complete en un hilo"""
+        return await asyncio.to_thread(self.complete, messages, max_tokens, timeout, **params)
+
+    async def aclose(self):
+        """Liberar los recursos asíncronos del proveedor"""
+
+    def __repr__(self):
+        return f"<{type(self).__name__} {self.name} model={self.model}>"
@@ -0,0 +1,94 @@
+import asyncio
+import hashlib
+import math
+import random
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional
+from app.core.config import settings
+from app.services.prompt_templates import estimate_tokens
+from app.services.providers.base import Completion, Provider, ProviderError
+
+_WORDS = (
+    "contenido", "marca", "clientes", "resultados", "estrategia", "digital", "valor",
+    "calidad", "innovación", "crecimiento", "experiencia", "ideas", "audiencia", "impacto"
+)
+
+class MockProvider(Provider):
+    """
+    Proveedor local determinista para pruebas y benchmarks sin red.
+
+    La latencia sigue una distribución log-normal definida por su mediana
+    (`latency_ms`) y su p95 (`p95_ms`); `error_rate` es la probabilidad de
+    un fallo transitorio. Con la misma semilla (`seed`) la secuencia de
+    latencias y errores se repite, y el texto depende solo del prompt.
+    """
+
+    kind = "mock"
+
+    def __init__(self, name: str, model: str, options: Optional[Dict[str, str]] = None):
+        super().__init__(name, model, options)
+        self.latency_ms = float(self.options.get("latency_ms", settings.mock_latency_ms))
+        self.p95_ms = max(self.latency_ms, float(self.options.get("p95_ms", settings.mock_latency_p95_ms)))
+        self.error_rate = float(self.options.get("error_rate", settings.mock_error_rate))
+        seed = self.options.get("seed", settings.mock_seed)
+        self._random = random.Random(f"{seed}:{name}")
+        self._lock = threading.Lock()
+
+    def complete(self, messages: List[Dict[str, str]], max_tokens: int,
+                 timeout: float, **params: Any) -> Completion:
+        latency, fail = self._sample()
+        self._wait(latency, timeout)
+        if fail:
+            raise ProviderError(f"Error simulado en {self.name}", retryable=True)
+        content = self._content(messages, max_tokens)
+        prompt_tokens = sum(estimate_tokens(message["content"]) for message in messages)
+        return Completion(content=content, tokens_used=prompt_tokens + estimate_tokens(content))
+
+    async def acomplete(self, messages: List[Dict[str, str]], max_tokens: int,
+                        timeout: float, **params: Any) -> Completion:
+        latency, fail = self._sample()
+        if latency / 1000 > timeout:
+            await asyncio.sleep(timeout)
+            raise ProviderError(f"Timeout simulado en {self.name}", retryable=True)
+        await asyncio.sleep(latency / 1000)
+        if fail:
+            raise ProviderError(f"Error simulado en {self.name}", retryable=True)
+        content = self._content(messages, max_tokens)
+        prompt_tokens = sum(estimate_tokens(message["content"]) for message in messages)
+        return Completion(content=content, tokens_used=prompt_tokens + estimate_tokens(content))
+
+    def stream(self, messages: List[Dict[str, str]], max_tokens: int,
+               timeout: float, **params: Any) -> Iterator[str]:
+        latency, fail = self._sample()
+        # Un tercio de la latencia hasta el primer token y el resto repartido
+        self._wait(latency / 3, timeout)
+        if fail:
+            raise ProviderError(f"Error simulado en {self.name}", retryable=True)
+        words = self._content(messages, max_tokens).split(" ")
+        pause = (latency * 2 / 3) / max(1, len(words)) / 1000
+        for index, word in enumerate(words):
+            if index:
+                time.sleep(pause)
+            yield word if index == 0 else f" {word}"
+
+    def _sample(self):
+        """Latencia (ms) y si la llamada falla, a partir del generador con semilla"""
+        with self._lock:
+            sigma = math.log(self.p95_ms / self.latency_ms) / 1.645 if self.latency_ms > 0 else 0.0
+            latency = self._random.lognormvariate(math.log(self.latency_ms), sigma) if self.latency_ms > 0 else 0.0
+            fail = self._random.random() < self.error_rate
+        return latency, fail
+
+    def _wait(self, latency_ms: float, timeout: float):
+        if latency_ms / 1000 > timeout:
+            time.sleep(timeout)
+            raise ProviderError(f"Timeout simulado en {self.name}", retryable=True)
+        time.sleep(latency_ms / 1000)
+
+    def _content(self, messages: List[Dict[str, str]], max_tokens: int) -> str:
+        """Texto determinista según el prompt, acotado por max_tokens"""
+        digest = hashlib.sha256(messages[-1]["content"].encode("utf-8")).digest()
+        count = max(3, min(max_tokens // 2, 20 + digest[0] % 40))
+        words = [_WORDS[digest[index % len(digest)] % len(_WORDS)] for index in range(count)]
+        return f"[{self.model}] " + " ".join(words).capitalize() + "."
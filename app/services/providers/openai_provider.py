@@ -0,0 +1,132 @@
+import asyncio
+import openai
+from typing import Any, Dict, Iterator, List, Optional
+from app.core.config import settings
+from app.services.providers.base import Completion, Provider, ProviderError
+
+# Errores transitorios de OpenAI (429, 5xx, timeouts y red) que se reintentan
+RETRYABLE_ERRORS = (
+    openai.error.RateLimitError,
+    openai.error.APIError,
+    openai.error.ServiceUnavailableError,
+    openai.error.Timeout,
+    openai.error.APIConnectionError,
+    openai.error.TryAgain
+)
+
+def _build_http_session():
+    """Sesión HTTP compartida con pool de conexiones persistentes hacia OpenAI"""
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=settings.openai_pool_maxsize)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Valor del header Retry-After de un 429, si lo hay"""
+    headers = getattr(error, "headers", None) or {}
+    value = headers.get("retry-after") if hasattr(headers, "get") else None
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+class OpenAIProvider(Provider):
+    """
+    Backend de OpenAI (ChatCompletion). Opciones: `api_base` para apuntar a
+    un endpoint compatible y `api_key_env` para leer otra API key del entorno.
+    """
+
+    kind = "openai"
+
+    def __init__(self, name: str, model: str, options: Optional[Dict[str, str]] = None):
+        super().__init__(name, model, options)
+        self.api_key = settings.openai_api_key
+        if self.options.get("api_key_env"):
+            from decouple import config
+            self.api_key = config(self.options["api_key_env"], default=self.api_key)
+        self.api_base = self.options.get("api_base")
+        if openai.requestssession is None:
+            openai.requestssession = _build_http_session()
+        # Sesión aiohttp por event loop para el modo asíncrono
+        self._aiosessions = {}
+
+    def complete(self, messages: List[Dict[str, str]], max_tokens: int,
+                 timeout: float, **params: Any) -> Completion:
+        response = self._create(messages, max_tokens, timeout, **params)
+        return Completion(
+            content=response.choices[0].message.content.strip(),
+            tokens_used=response.usage.total_tokens
+        )
+
+    def stream(self, messages: List[Dict[str, str]], max_tokens: int,
+               timeout: float, **params: Any) -> Iterator[str]:
+        response = self._create(messages, max_tokens, timeout, stream=True, **params)
+        try:
+            for chunk in response:
+                delta = chunk["choices"][0].get("delta", {}).get("content")
+                if delta:
+                    yield delta
+        except RETRYABLE_ERRORS as e:
+            raise ProviderError(str(e), retryable=True, retry_after=_retry_after(e)) from e
+
+    async def acomplete(self, messages: List[Dict[str, str]], max_tokens: int,
+                        timeout: float, **params: Any) -> Completion:
+        # openai usa la sesión del contexto actual en lugar de abrir una por petición
+        openai.aiosession.set(self._aiosession())
+        kwargs = {"api_base": self.api_base} if self.api_base else {}
+        try:
+            response = await openai.ChatCompletion.acreate(
+                api_key=self.api_key,
+                request_timeout=timeout,
+                model=self.model,
+                messages=messages,
+                max_tokens=max_tokens,
+                **kwargs,
+                **params
+            )
+        except RETRYABLE_ERRORS as e:
+            raise ProviderError(str(e), retryable=True, retry_after=_retry_after(e)) from e
+        except openai.error.OpenAIError as e:
+            raise ProviderError(str(e), retryable=False) from e
+        return Completion(
+            content=response.choices[0].message.content.strip(),
+            tokens_used=response.usage.total_tokens
+        )
+
+    async def aclose(self):
+        sessions, self._aiosessions = self._aiosessions, {}
+        for session in sessions.values():
+            await session.close()
+
+    def _aiosession(self):
+        """Sesión aiohttp con pool de conexiones para el event loop actual"""
+        import aiohttp
+
+        loop = asyncio.get_running_loop()
+        session = self._aiosessions.get(loop)
+        if session is None or session.closed:
+            connector = aiohttp.TCPConnector(limit=settings.openai_async_max_connections)
+            session = aiohttp.ClientSession(connector=connector)
+            self._aiosessions[loop] = session
+        return session
+
+    def _create(self, messages, max_tokens, timeout, **params):
+        kwargs = {"api_base": self.api_base} if self.api_base else {}
+        try:
+            return openai.ChatCompletion.create(
+                api_key=self.api_key,
+                request_timeout=timeout,
+                model=self.model,
+                messages=messages,
+                max_tokens=max_tokens,
+                **kwargs,
+                **params
+            )
+        except RETRYABLE_ERRORS as e:
+            raise ProviderError(str(e), retryable=True, retry_after=_retry_after(e)) from e
+        except openai.error.OpenAIError as e:
+            raise ProviderError(str(e), retryable=False) from e
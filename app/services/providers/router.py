@@ -0,0 +1,91 @@
+from typing import Any, Dict, List, Optional
+from app.core.config import settings
+from app.core.circuit_breaker import CircuitBreaker
+from app.core.latency import LatencyTracker
+from app.services.providers.base import Provider
+
+class Backend:
+    """Un proveedor configurado con su circuit breaker y sus métricas"""
+
+    def __init__(self, provider: Provider):
+        self.provider = provider
+        self.name = provider.name
+        self.tracker = LatencyTracker(settings.ai_router_window)
+        self.breaker = CircuitBreaker(
+            f"ai:{provider.name}",
+            error_threshold=settings.openai_circuit_error_threshold,
+            min_requests=settings.openai_circuit_min_requests,
+            window_seconds=settings.openai_circuit_window,
+            open_seconds=settings.openai_circuit_open_seconds
+        )
+
+    def is_degraded(self, snapshot: Dict[str, Any]) -> bool:
+        """Degradado si su tasa de error o su p95 superan los umbrales del router"""
+        if snapshot["samples"] < settings.ai_router_min_samples:
+            return False
+        if snapshot["error_rate"] > settings.ai_router_max_error_rate:
+            return True
+        return snapshot["p95_ms"] is not None and snapshot["p95_ms"] > settings.ai_router_max_p95_ms
+
+    def score(self, snapshot: Dict[str, Any]) -> float:
+        """Menor es mejor: p95 penalizado por la tasa de error"""
+        p95 = snapshot["p95_ms"] or 0.0
+        return p95 * (1 + 4 * snapshot["error_rate"])
+
+class ProviderRouter:
+    """
+    Elige el orden de backends para cada petición. Primero van los backends
+    preferidos para el tipo de contenido (AI_ROUTES, o el backend por defecto)
+    que no estén degradados, después el resto ordenados por p95 y tasa de
+    error y al final los degradados, que solo se usan como último recurso.
+    Los backends con el circuito abierto los descarta quien llama.
+    """
+
+    def __init__(self, providers: List[Provider], routes: Dict[str, List[str]]):
+        if not providers:
+            raise ValueError("Se necesita al menos un proveedor de IA configurado")
+        self.backends = [Backend(provider) for provider in providers]
+        self._by_name = {backend.name: backend for backend in self.backends}
+        self.default = self.backends[0]
+        self.routes = {
+            content_type: [self._by_name[name] for name in names if name in self._by_name]
+            for content_type, names in routes.items()
+        }
+
+    def preferred(self, content_type: str) -> List[Backend]:
+        return self.routes.get(content_type) or [self.default]
+
+    def primary_model(self, content_type: str) -> str:
+        """Modelo que atiende normalmente el tipo de contenido (forma parte de la clave de cache)"""
+        return self.preferred(content_type)[0].provider.model
+
+    def candidates(self, content_type: str) -> List[Backend]:
+        """Backends en orden de preferencia para esta petición"""
+        snapshots = {backend.name: backend.tracker.snapshot() for backend in self.backends}
+        preferred = self.preferred(content_type)
+        others = sorted((backend for backend in self.backends if backend not in preferred),
+                        key=lambda backend: backend.score(snapshots[backend.name]))
+        healthy = [backend for backend in preferred + others if not backend.is_degraded(snapshots[backend.name])]
+        degraded = [backend for backend in preferred + others if backend not in healthy]
+        return healthy + degraded
+
+    def get(self, name: str) -> Optional[Backend]:
+        return self._by_name.get(name)
+
+    def stats(self) -> Dict[str, Any]:
+        backends = {}
+        for backend in self.backends:
+            snapshot = backend.tracker.snapshot()
+            backends[backend.name] = {
+                "kind": backend.provider.kind,
+                "model": backend.provider.model,
+                **snapshot,
+                "degraded": backend.is_degraded(snapshot),
+                "circuit": backend.breaker.stats()
+            }
+        return {
+            "default": self.default.name,
+            "routes": {content_type: [backend.name for backend in backends_]
+                       for content_type, backends_ in self.routes.items()},
+            "backends": backends
+        }
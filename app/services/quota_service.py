@@ -0,0 +1,301 @@
+import asyncio
+import atexit
+import logging
+import os
+import threading
+import uuid
+from typing import Optional, Tuple
+from sqlalchemy import case, select, update
+from app.core import metrics
+from app.core.config import settings
+from app.core.database import SessionLocal, get_async_sessionmaker
+from app.core.redis_client import get_redis, mark_redis_unavailable
+from app.models.user import User
+from app.services.write_behind import apply_updates
+
+logger = logging.getLogger(__name__)
+
+# Reserva atómica en Redis: -1 si el contador no está cargado, -2 si no hay cuota
+_RESERVE_SCRIPT = """
+local used = redis.call('HGET', KEYS[1], 'used')
+if not used then return -1 end
+local limit = tonumber(redis.call('HGET', KEYS[1], 'limit'))
+local units = tonumber(ARGV[1])
+if tonumber(used) + units > limit then return -2 end
+redis.call('HINCRBY', KEYS[1], 'used', units)
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+redis.call('HINCRBY', KEYS[2], ARGV[2], units)
+return tonumber(used) + units
+"""
+
+_REFUND_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    redis.call('HINCRBY', KEYS[1], 'used', -tonumber(ARGV[1]))
+end
+redis.call('HINCRBY', KEYS[2], ARGV[2], -tonumber(ARGV[1]))
+return 1
+"""
+
+class QuotaService:
+    """
+    Reserva de generaciones mensuales sin condiciones de carrera.
+
+    La reserva es un único UPDATE condicional, por lo que nunca se vende
+    más cuota de la disponible y no se mantiene ningún bloqueo de fila
+    durante la llamada a la IA. Si la generación falla, la unidad se devuelve
+    en el momento con otro UPDATE (no se difiere: el uso limita al usuario).
+
+    Con QUOTA_REDIS_ENABLED el contador vive en Redis (script atómico) y los
+    incrementos pendientes se vuelcan a la base de datos cada
+    QUOTA_FLUSH_INTERVAL segundos con un único UPDATE masivo.
+    """
+
+    key_prefix = "gcai:quota:"
+    pending_key = "gcai:quota:pending"
+
+    def __init__(self):
+        self._flusher_pid = None
+        self._flusher_lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def reserve(self, user_id: int, units: int = 1) -> bool:
+        """Reservar `units` generaciones. Devuelve False si no hay cuota suficiente"""
+        if units <= 0:
+            return True
+
+        if settings.quota_redis_enabled:
+            reserved = self._reserve_redis(user_id, units)
+            if reserved is not None:
+                metrics.count_quota(reserved)
+                return reserved
+
+        reserved = self._reserve_db(user_id, units)
+        metrics.count_quota(reserved)
+        return reserved
+
+    async def areserve(self, user_id: int, units: int = 1) -> bool:
+        """Versión asíncrona de reserve para el modo ASGI"""
+        if units <= 0:
+            return True
+
+        if settings.quota_redis_enabled:
+            reserved = await asyncio.to_thread(self._reserve_redis, user_id, units)
+            if reserved is not None:
+                metrics.count_quota(reserved)
+                return reserved
+
+        async with get_async_sessionmaker()() as db_session:
+            row = (await db_session.execute(self._reserve_statement(user_id, units))).first()
+            await db_session.commit()
+        metrics.count_quota(row is not None)
+        return row is not None
+
+    def refund(self, user_id: int, units: int = 1):
+        """Devolver unidades reservadas (generación fallida o no facturable)"""
+        if units <= 0:
+            return
+        metrics.count_refund(units)
+
+        if settings.quota_redis_enabled:
+            client = get_redis()
+            if client is not None:
+                try:
+                    client.eval(_REFUND_SCRIPT, 2, self._key(user_id), self.pending_key, units, user_id)
+                    return
+                except Exception as e:
+                    mark_redis_unavailable(e)
+
+        db_session = SessionLocal()
+        try:
+            db_session.execute(self._refund_statement(user_id, units))
+            db_session.commit()
+        except Exception as e:
+            db_session.rollback()
+            logger.error(f"Error devolviendo {units} unidades de cuota al usuario {user_id}: {str(e)}")
+        finally:
+            db_session.close()
+
+    async def arefund(self, user_id: int, units: int = 1):
+        """Versión asíncrona de refund (Redis se usa desde un hilo)"""
+        if settings.quota_redis_enabled:
+            await asyncio.to_thread(self.refund, user_id, units)
+            return
+        if units <= 0:
+            return
+        metrics.count_refund(units)
+
+        try:
+            async with get_async_sessionmaker()() as db_session:
+                await db_session.execute(self._refund_statement(user_id, units))
+                await db_session.commit()
+        except Exception as e:
+            logger.error(f"Error devolviendo {units} unidades de cuota al usuario {user_id}: {str(e)}")
+
+    def get_usage(self, user_id: int) -> Optional[Tuple[int, int]]:
+        """Obtener (usadas, límite) del usuario"""
+        if settings.quota_redis_enabled:
+            client = get_redis()
+            if client is not None:
+                try:
+                    used, limit = client.hmget(self._key(user_id), "used", "limit")
+                    if used is not None and limit is not None:
+                        return int(used), int(limit)
+                except Exception as e:
+                    mark_redis_unavailable(e)
+
+        return self._db_usage(user_id)
+
+    def invalidate(self, user_id: int):
+        """Descartar el contador en Redis (p. ej. tras un cambio de plan)"""
+        self.invalidate_many([user_id])
+
+    def invalidate_many(self, user_ids):
+        """Descartar los contadores en Redis de varios usuarios (p. ej. tras el reinicio mensual)"""
+        if not settings.quota_redis_enabled or not user_ids:
+            return
+        client = get_redis()
+        if client is not None:
+            try:
+                client.delete(*(self._key(user_id) for user_id in user_ids))
+            except Exception as e:
+                mark_redis_unavailable(e)
+
+    def flush(self) -> int:
+        """Volcar a la base de datos los incrementos pendientes en Redis"""
+        client = get_redis()
+        if client is None:
+            return 0
+
+        flushing_key = f"{self.pending_key}:flushing:{uuid.uuid4().hex}"
+        try:
+            # RENAME es atómico: las nuevas reservas van a un hash pendiente nuevo
+            client.rename(self.pending_key, flushing_key)
+        except Exception as e:
+            if "no such key" not in str(e).lower():
+                mark_redis_unavailable(e)
+            return 0
+
+        try:
+            raw = client.hgetall(flushing_key)
+            deltas = {int(user_id): int(delta) for user_id, delta in raw.items() if int(delta)}
+            apply_updates({}, deltas)
+            client.delete(flushing_key)
+            return len(deltas)
+        except Exception as e:
+            logger.error(f"Error volcando cuotas a la base de datos: {str(e)}")
+            # Devolver los incrementos al hash pendiente para el próximo volcado
+            try:
+                for user_id, delta in client.hgetall(flushing_key).items():
+                    client.hincrby(self.pending_key, user_id, int(delta))
+                client.delete(flushing_key)
+            except Exception as redis_error:
+                mark_redis_unavailable(redis_error)
+            return 0
+
+    def _reserve_db(self, user_id: int, units: int) -> bool:
+        db_session = SessionLocal()
+        try:
+            row = db_session.execute(self._reserve_statement(user_id, units)).first()
+            db_session.commit()
+            return row is not None
+        finally:
+            db_session.close()
+
+    @staticmethod
+    def _reserve_statement(user_id: int, units: int):
+        """UPDATE condicional: solo incrementa si cabe dentro del límite"""
+        return (
+            update(User)
+            .where(
+                User.id == user_id,
+                User.monthly_generations_used + units <= User.monthly_generations_limit
+            )
+            .values(monthly_generations_used=User.monthly_generations_used + units)
+            .returning(User.monthly_generations_used)
+            .execution_options(synchronize_session=False)
+        )
+
+    @staticmethod
+    def _refund_statement(user_id: int, units: int):
+        """UPDATE inmediato sin bajar de cero (la devolución puede llegar tras el reinicio mensual)"""
+        remaining = User.monthly_generations_used - units
+        return (
+            update(User)
+            .where(User.id == user_id)
+            .values(monthly_generations_used=case((remaining < 0, 0), else_=remaining))
+            .execution_options(synchronize_session=False)
+        )
+
+    def _reserve_redis(self, user_id: int, units: int) -> Optional[bool]:
+        """Reserva en Redis. Devuelve None si Redis no está disponible"""
+        client = get_redis()
+        if client is None:
+            return None
+
+        self._ensure_flusher()
+        key = self._key(user_id)
+        try:
+            for _ in range(2):
+                result = client.eval(_RESERVE_SCRIPT, 2, key, self.pending_key,
+                                     units, user_id, settings.quota_redis_ttl)
+                if result == -1:
+                    self._load_counter(client, user_id)
+                    continue
+                return result != -2
+            return None
+        except Exception as e:
+            mark_redis_unavailable(e)
+            return None
+
+    def _load_counter(self, client, user_id: int):
+        """Cargar el contador desde la base de datos sumando lo pendiente de volcar"""
+        usage = self._db_usage(user_id)
+        if usage is None:
+            client.hset(self._key(user_id), mapping={"used": 0, "limit": 0})
+        else:
+            used, limit = usage
+            pending = int(client.hget(self.pending_key, user_id) or 0)
+            client.hsetnx(self._key(user_id), "limit", limit)
+            client.hsetnx(self._key(user_id), "used", used + pending)
+        client.expire(self._key(user_id), settings.quota_redis_ttl)
+
+    def _db_usage(self, user_id: int) -> Optional[Tuple[int, int]]:
+        db_session = SessionLocal()
+        try:
+            row = db_session.execute(
+                select(User.monthly_generations_used, User.monthly_generations_limit)
+                .where(User.id == user_id)
+            ).first()
+            return (row[0] or 0, row[1] or 0) if row else None
+        finally:
+            db_session.close()
+
+
+    def _ensure_flusher(self):
+        """Arrancar el hilo de volcado en este proceso (una vez por worker)"""
+        if self._flusher_pid == os.getpid():
+            return
+        with self._flusher_lock:
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid = os.getpid()
+            self._stop = threading.Event()
+            thread = threading.Thread(target=self._flush_loop, name="quota-flusher", daemon=True)
+            thread.start()
+            atexit.register(self._shutdown)
+
+    def _flush_loop(self):
+        while not self._stop.wait(settings.quota_flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error en volcado periódico de cuotas: {str(e)}")
+
+    def _shutdown(self):
+        self._stop.set()
+        self.flush()
+
+    def _key(self, user_id: int) -> str:
+        return f"{self.key_prefix}{user_id}"
+
+quota_service = QuotaService()
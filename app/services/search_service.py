@@ -0,0 +1,268 @@
+import argparse
+import logging
+import re
+import sys
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy import select, text, update
+from sqlalchemy.sql import func
+from app.core.config import settings
+from app.core.database import SessionLocal, engine
+from app.models.generation import Generation
+from app.models.job_state import JobState
+
+logger = logging.getLogger(__name__)
+
+JOB_NAME = "generation_search"
+
+# Términos de búsqueda para FTS5 (el resto de caracteres de `q` se ignora)
+_TERM = re.compile(r"\w+", re.UNICODE)
+
+# Columnas de `generations` devueltas en cada resultado
+_RESULT_COLUMNS = (
+    "g.id, g.content_type, g.topic, g.tone, g.length, g.tokens_used, g.processing_time, g.created_at, "
+    "substr(g.generated_content, 1, :preview_chars) AS preview"
+)
+
+# PostgreSQL: tsvector precalculado (el tema pesa más que el contenido) con índice GIN.
+# La tabla está fuera de Base.metadata porque el tipo no existe en SQLite.
+_POSTGRES_DDL = (
+    "CREATE TABLE IF NOT EXISTS generation_search ("
+    " generation_id INTEGER PRIMARY KEY REFERENCES generations(id) ON DELETE CASCADE,"
+    " user_id INTEGER NOT NULL,"
+    " document TSVECTOR NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS ix_generation_search_document ON generation_search USING GIN (document)",
+    "CREATE INDEX IF NOT EXISTS ix_generation_search_user ON generation_search (user_id)",
+)
+
+# SQLite: tabla FTS5 de contenido externo (el texto no se duplica, se lee de generations)
+_SQLITE_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS generation_search USING fts5("
+    "topic, generated_content, content='generations', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2')",
+)
+
+class SearchUnavailableError(Exception):
+    """El motor de base de datos no tiene índice de texto completo"""
+
+class SearchService:
+    """
+    Búsqueda de texto completo en el historial de generaciones (tema y
+    contenido). En PostgreSQL usa un tsvector con índice GIN y ts_rank_cd;
+    en SQLite, una tabla FTS5 con bm25.
+
+    El índice no se actualiza en POST /generate: un job periódico (Celery
+    beat) indexa las generaciones nuevas por id desde una marca de agua,
+    igual que los rollups de analytics. Las generaciones de los últimos
+    SEARCH_INDEX_LAG segundos aún no aparecen en los resultados.
+    """
+
+    @staticmethod
+    def create_index(connection):
+        """Crear las tablas e índices de búsqueda del motor actual (migración 4)"""
+        dialect = connection.dialect.name
+        if dialect == "postgresql":
+            statements = _POSTGRES_DDL
+        elif dialect == "sqlite":
+            statements = _SQLITE_DDL
+        else:
+            logger.warning(f"Búsqueda de texto completo no disponible en {dialect}")
+            return
+        for statement in statements:
+            connection.execute(text(statement))
+
+    def index_pending(self, batch_size: Optional[int] = None, lag: Optional[int] = None) -> int:
+        """Indexar un lote de generaciones nuevas. Devuelve cuántas (0 = al día)"""
+        self._check_dialect()
+        batch_size = batch_size or settings.search_index_batch_size
+        lag = settings.search_index_lag if lag is None else lag
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=lag)
+
+        db_session = SessionLocal()
+        try:
+            watermark = JobState.load_watermark(db_session, JOB_NAME)
+            rows = db_session.execute(
+                select(Generation.id, Generation.created_at)
+                .where(Generation.id > watermark).order_by(Generation.id).limit(batch_size)
+            ).all()
+            last_id = None
+            count = 0
+            for row in rows:
+                created_at = row.created_at
+                if created_at is not None and created_at.tzinfo is None:
+                    created_at = created_at.replace(tzinfo=timezone.utc)
+                if created_at is not None and created_at > cutoff:
+                    break
+                last_id = row.id
+                count += 1
+            if last_id is None:
+                return 0
+
+            claimed = db_session.execute(
+                update(JobState)
+                .where(JobState.name == JOB_NAME, JobState.watermark == watermark)
+                .values(watermark=last_id, updated_at=func.now())
+            )
+            if claimed.rowcount != 1:
+                # Otra ejecución ha indexado este lote
+                db_session.rollback()
+                return 0
+
+            params = {"first": watermark, "last": last_id}
+            if engine.dialect.name == "postgresql":
+                db_session.execute(text(
+                    "INSERT INTO generation_search (generation_id, user_id, document) "
+                    "SELECT id, user_id, "
+                    "setweight(to_tsvector(CAST(:config AS regconfig), coalesce(topic, '')), 'A') || "
+                    "setweight(to_tsvector(CAST(:config AS regconfig), coalesce(generated_content, '')), 'B') "
+                    "FROM generations WHERE id > :first AND id <= :last "
+                    "ON CONFLICT (generation_id) DO NOTHING"
+                ), {**params, "config": settings.search_language})
+            else:
+                db_session.execute(text(
+                    "INSERT INTO generation_search (rowid, topic, generated_content) "
+                    "SELECT id, topic, generated_content FROM generations WHERE id > :first AND id <= :last"
+                ), params)
+            db_session.commit()
+            return count
+        except Exception:
+            db_session.rollback()
+            raise
+        finally:
+            db_session.close()
+
+    def catch_up(self, max_batches: Optional[int] = None, batch_size: Optional[int] = None,
+                 lag: Optional[int] = None) -> int:
+        """Indexar lotes hasta ponerse al día (o hasta `max_batches`)"""
+        total = 0
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            indexed = self.index_pending(batch_size, lag)
+            if not indexed:
+                break
+            total += indexed
+            batches += 1
+        return total
+
+    def rebuild(self, batch_size: Optional[int] = None, lag: Optional[int] = None) -> int:
+        """Vaciar el índice y volver a indexar desde la primera generación"""
+        self._check_dialect()
+        db_session = SessionLocal()
+        try:
+            JobState.load_watermark(db_session, JOB_NAME)
+            db_session.execute(
+                update(JobState).where(JobState.name == JOB_NAME).values(watermark=0, updated_at=func.now())
+            )
+            if engine.dialect.name == "postgresql":
+                db_session.execute(text("TRUNCATE generation_search"))
+            else:
+                db_session.execute(text("INSERT INTO generation_search (generation_search) VALUES ('delete-all')"))
+            db_session.commit()
+        except Exception:
+            db_session.rollback()
+            raise
+        finally:
+            db_session.close()
+        return self.catch_up(batch_size=batch_size, lag=lag)
+
+    def search(self, db_session, user_id: int, q: str, limit: int,
+               content_type: Optional[str] = None, start: Optional[date] = None, end: Optional[date] = None,
+               after: Optional[Tuple[float, int]] = None) -> List[Dict[str, Any]]:
+        """
+        Generaciones del usuario que coinciden con `q`, de mayor a menor
+        relevancia (a igual relevancia, la más reciente primero). `after`
+        es la posición (rank, id) del último resultado de la página anterior.
+        """
+        self._check_dialect()
+        postgres = engine.dialect.name == "postgresql"
+        params: Dict[str, Any] = {
+            "user_id": user_id, "limit": limit, "preview_chars": settings.generations_preview_chars
+        }
+
+        if postgres:
+            params.update(q=q, config=settings.search_language)
+            matches = (
+                "SELECT s.generation_id AS id, "
+                "ts_rank_cd(s.document, websearch_to_tsquery(CAST(:config AS regconfig), :q)) AS rank "
+                "FROM generation_search s "
+                "WHERE s.user_id = :user_id "
+                "AND s.document @@ websearch_to_tsquery(CAST(:config AS regconfig), :q)"
+            )
+        else:
+            terms = _TERM.findall(q)
+            if not terms:
+                return []
+            # Cada término entre comillas: sin operadores de FTS5, todos obligatorios
+            params["q"] = " ".join('"' + term + '"' for term in terms)
+            matches = (
+                "SELECT generation_search.rowid AS id, -bm25(generation_search, 2.0, 1.0) AS rank "
+                "FROM generation_search WHERE generation_search MATCH :q"
+            )
+
+        conditions = ["g.user_id = :user_id"]
+        if content_type:
+            conditions.append("g.content_type = :content_type")
+            params["content_type"] = content_type
+        # SQLite guarda las fechas como texto "YYYY-MM-DD HH:MM:SS": se compara con el mismo formato
+        if start:
+            conditions.append("g.created_at >= :start")
+            params["start"] = start if postgres else start.isoformat()
+        if end:
+            conditions.append("g.created_at < :end")
+            params["end"] = end + timedelta(days=1) if postgres else (end + timedelta(days=1)).isoformat()
+        if after:
+            conditions.append("(m.rank < :after_rank OR (m.rank = :after_rank AND m.id < :after_id))")
+            params.update(after_rank=after[0], after_id=after[1])
+
+        rows = db_session.execute(text(
+            f"SELECT m.rank, {_RESULT_COLUMNS} FROM ({matches}) AS m "
+            f"JOIN generations g ON g.id = m.id "
+            f"WHERE {' AND '.join(conditions)} "
+            f"ORDER BY m.rank DESC, m.id DESC LIMIT :limit"
+        ), params).all()
+
+        results = []
+        for row in rows:
+            item = dict(row._mapping)
+            created_at = item["created_at"]
+            if isinstance(created_at, str):
+                created_at = datetime.fromisoformat(created_at)
+            item["created_at"] = created_at.isoformat() if created_at else None
+            results.append(item)
+        return results
+
+    @staticmethod
+    def indexed_through(db_session) -> int:
+        """Id de la última generación indexada"""
+        state = db_session.get(JobState, JOB_NAME)
+        return state.watermark if state else 0
+
+    @staticmethod
+    def _check_dialect():
+        if engine.dialect.name not in ("postgresql", "sqlite"):
+            raise SearchUnavailableError(f"Búsqueda no disponible en {engine.dialect.name}")
+
+search_service = SearchService()
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Indexar las generaciones para la búsqueda de texto completo")
+    parser.add_argument("--rebuild", action="store_true", help="Vaciar el índice y reindexar desde cero")
+    parser.add_argument("--batch-size", type=int, default=settings.search_index_batch_size,
+                        help="Generaciones por transacción (SEARCH_INDEX_BATCH_SIZE)")
+    parser.add_argument("--lag", type=int, default=settings.search_index_lag,
+                        help="Ignorar las generaciones de los últimos N segundos (SEARCH_INDEX_LAG)")
+    args = parser.parse_args(argv)
+
+    from app.core.migrations import ensure_schema
+    if not ensure_schema():
+        return 1
+
+    if args.rebuild:
+        indexed = search_service.rebuild(args.batch_size, args.lag)
+    else:
+        indexed = search_service.catch_up(batch_size=args.batch_size, lag=args.lag)
+    print(f"✅ {indexed} generaciones indexadas")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,165 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from app.core.config import settings
+from app.core.redis_client import get_redis, mark_redis_unavailable
+
+logger = logging.getLogger(__name__)
+
+# Liberar el lock solo si sigue siendo nuestro
+_RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+class SingleFlight:
+    """
+    Coalescencia de llamadas idénticas en curso: las peticiones concurrentes
+    con la misma clave esperan a una única llamada al proveedor y comparten
+    su resultado. Dentro del worker se usa un Event por clave; entre workers,
+    con SINGLEFLIGHT_REDIS_ENABLED, un lock en Redis y el resultado publicado
+    en una clave de vida corta.
+    """
+
+    key_prefix = "gcai:sf:"
+
+    def __init__(self):
+        self._calls: Dict[str, _Call] = {}
+        self._async_calls: Dict[Tuple[int, str], "asyncio.Future"] = {}
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {"leaders": 0, "coalesced_local": 0, "coalesced_remote": 0}
+
+    def do(self, key: str, fn: Callable[[], Dict[str, Any]]) -> Tuple[Dict[str, Any], bool]:
+        """
+        Ejecutar `fn` una sola vez por clave entre las llamadas concurrentes.
+        Devuelve (resultado, coalesced) donde coalesced indica que el resultado
+        se obtuvo de la llamada de otro solicitante.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            self._count("coalesced_local")
+            if call.error is not None:
+                raise call.error
+            return dict(call.result), True
+
+        try:
+            call.result, coalesced = self._run_leader(key, fn)
+            return dict(call.result), coalesced
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    async def ado(self, key: str, fn: Callable[[], Awaitable[Dict[str, Any]]]) -> Tuple[Dict[str, Any], bool]:
+        """
+        Versión asíncrona de `do` para el modo ASGI: las corrutinas del mismo
+        event loop con la misma clave esperan un único Future. La coalescencia
+        es solo dentro del worker.
+        """
+        loop = asyncio.get_running_loop()
+        call_key = (id(loop), key)
+        future = self._async_calls.get(call_key)
+        if future is not None:
+            # shield: si este solicitante se cancela, el líder sigue adelante
+            result = await asyncio.shield(future)
+            self._count("coalesced_local")
+            return dict(result), True
+
+        future = loop.create_future()
+        self._async_calls[call_key] = future
+        self._count("leaders")
+        try:
+            result = await fn()
+            future.set_result(result)
+            return dict(result), False
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Evitar el aviso de excepción no recuperada si nadie esperaba
+            future.exception()
+            raise
+        finally:
+            self._async_calls.pop(call_key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["coalesced"] = stats["coalesced_local"] + stats["coalesced_remote"]
+        stats["in_flight"] = len(self._calls) + len(self._async_calls)
+        return stats
+
+    def _run_leader(self, key: str, fn: Callable[[], Dict[str, Any]]) -> Tuple[Dict[str, Any], bool]:
+        client = get_redis() if settings.singleflight_redis_enabled else None
+        if client is None:
+            self._count("leaders")
+            return fn(), False
+
+        lock_key = f"{self.key_prefix}lock:{key}"
+        result_key = f"{self.key_prefix}result:{key}"
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + settings.singleflight_lock_ttl
+
+        try:
+            # Si otro worker tiene el lock, esperar su resultado. El líder publica
+            # el resultado antes de liberar el lock, así que se consulta primero.
+            while not client.set(lock_key, token, nx=True, ex=settings.singleflight_lock_ttl):
+                if time.monotonic() > deadline:
+                    break
+                time.sleep(settings.singleflight_poll_interval)
+                raw = client.get(result_key)
+                if raw is not None:
+                    self._count("coalesced_remote")
+                    return json.loads(raw), True
+        except Exception as e:
+            mark_redis_unavailable(e)
+            self._count("leaders")
+            return fn(), False
+
+        self._count("leaders")
+        try:
+            result = fn()
+            try:
+                client.set(result_key, json.dumps(result), ex=settings.singleflight_result_ttl)
+            except Exception as e:
+                mark_redis_unavailable(e)
+            return result, False
+        finally:
+            try:
+                client.eval(_RELEASE_SCRIPT, 1, lock_key, token)
+            except Exception as e:
+                mark_redis_unavailable(e)
+
+    def _count(self, name: str):
+        with self._stats_lock:
+            self._stats[name] += 1
+
+singleflight = SingleFlight()
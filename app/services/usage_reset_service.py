@@ -0,0 +1,145 @@
+import argparse
+import calendar
+import logging
+import sys
+import time
+from datetime import date, datetime, timezone
+from typing import Any, Dict, Optional
+from sqlalchemy import or_, select, update
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.user import User
+
+logger = logging.getLogger(__name__)
+
+def billing_period_start(anchor_day: int, today: date) -> date:
+    """
+    Inicio del periodo de facturación que contiene `today` para un día de
+    corte (en meses más cortos, el corte es el último día del mes)
+    """
+    day = min(anchor_day, calendar.monthrange(today.year, today.month)[1])
+    if today.day >= day:
+        return today.replace(day=day)
+    year, month = (today.year, today.month - 1) if today.month > 1 else (today.year - 1, 12)
+    return date(year, month, min(anchor_day, calendar.monthrange(year, month)[1]))
+
+class UsageResetService:
+    """
+    Reinicio mensual del uso según el ciclo de facturación de cada usuario.
+
+    Para cada día de corte (billing_anchor_day) se ponen a cero, en bloques
+    de QUOTA_RESET_CHUNK_SIZE, los usuarios cuyo usage_period_start es
+    anterior al inicio de su periodo actual. Cada bloque es un único UPDATE
+    sobre un conjunto de ids que vuelve a comprobar esa condición y se
+    confirma por separado: repetir una ejecución no reinicia a nadie dos
+    veces y, si se interrumpe, la siguiente continúa con los pendientes.
+    Como los cortes se reparten por día, no hay un reinicio masivo a
+    principio de mes.
+    """
+
+    def run(self, today: Optional[date] = None, dry_run: bool = False,
+            chunk_size: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Reiniciar el uso de los usuarios con el periodo vencido. Con
+        `dry_run` solo se recorren los mismos bloques y se cuentan las filas.
+        """
+        today = today or datetime.now(timezone.utc).date()
+        chunk_size = chunk_size or settings.quota_reset_chunk_size
+        start = time.perf_counter()
+        total = 0
+        chunks = 0
+        by_anchor_day = {}
+
+        db_session = SessionLocal()
+        try:
+            for anchor_day in range(1, 32):
+                anchor_start = time.perf_counter()
+                period = billing_period_start(anchor_day, today)
+                due = (
+                    User.billing_anchor_day == anchor_day,
+                    or_(User.usage_period_start.is_(None), User.usage_period_start < period)
+                )
+                affected = 0
+                last_id = 0
+                while True:
+                    ids = db_session.execute(
+                        select(User.id).where(*due, User.id > last_id).order_by(User.id).limit(chunk_size)
+                    ).scalars().all()
+                    if not ids:
+                        break
+                    last_id = ids[-1]
+                    chunks += 1
+                    if dry_run:
+                        affected += len(ids)
+                    else:
+                        affected += self._reset_chunk(db_session, ids, due, period)
+                    if len(ids) < chunk_size:
+                        break
+
+                if affected:
+                    total += affected
+                    by_anchor_day[anchor_day] = {
+                        "period_start": period.isoformat(),
+                        "users": affected,
+                        "elapsed_ms": round((time.perf_counter() - anchor_start) * 1000, 1)
+                    }
+        finally:
+            db_session.rollback()
+            db_session.close()
+
+        report = {
+            "date": today.isoformat(),
+            "dry_run": dry_run,
+            "users": total,
+            "chunks": chunks,
+            "chunk_size": chunk_size,
+            "elapsed_ms": round((time.perf_counter() - start) * 1000, 1),
+            "by_anchor_day": by_anchor_day
+        }
+        if total and not dry_run:
+            logger.info(f"Uso mensual reiniciado para {total} usuarios en {chunks} bloques "
+                        f"({report['elapsed_ms']} ms)")
+        return report
+
+    @staticmethod
+    def _reset_chunk(db_session, ids, due, period: date) -> int:
+        from app.services.quota_service import quota_service
+
+        result = db_session.execute(
+            update(User)
+            .where(User.id.in_(ids), *due)
+            .values(monthly_generations_used=0, usage_period_start=period)
+            .execution_options(synchronize_session=False)
+        )
+        db_session.commit()
+        # Los contadores de Redis guardan el uso anterior
+        quota_service.invalidate_many(ids)
+        return result.rowcount
+
+usage_reset_service = UsageResetService()
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Reiniciar el uso mensual de los usuarios con el periodo vencido")
+    parser.add_argument("--dry-run", action="store_true", help="Contar los usuarios afectados sin modificarlos")
+    parser.add_argument("--date", type=date.fromisoformat,
+                        help="Fecha de referencia YYYY-MM-DD (solo con --dry-run; por defecto hoy en UTC)")
+    parser.add_argument("--chunk-size", type=int, default=settings.quota_reset_chunk_size,
+                        help="Usuarios por UPDATE (QUOTA_RESET_CHUNK_SIZE)")
+    args = parser.parse_args(argv)
+    if args.date and not args.dry_run:
+        parser.error("--date solo se admite con --dry-run")
+
+    from app.core.migrations import ensure_schema
+    if not ensure_schema():
+        return 1
+
+    report = usage_reset_service.run(args.date, args.dry_run, args.chunk_size)
+    for anchor_day, item in report["by_anchor_day"].items():
+        print(f"  día {anchor_day:>2} (periodo desde {item['period_start']}): "
+              f"{item['users']} usuarios, {item['elapsed_ms']} ms")
+    action = "se reiniciarían" if args.dry_run else "reiniciados"
+    print(f"✅ {report['users']} usuarios {action} en {report['chunks']} bloques ({report['elapsed_ms']} ms)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,137 @@
+import logging
+import threading
+from typing import Any, Dict, NamedTuple, Optional, Set
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from app.core import metrics
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.user import User
+from app.services.cache_service import LRUCache
+
+logger = logging.getLogger(__name__)
+
+# TTL de las búsquedas de usuarios inexistentes
+_NEGATIVE_TTL = 30
+_MISSING = object()
+
+# Columnas que se guardan en cache; un cambio en cualquiera invalida la entrada
+CACHED_FIELDS = (
+    "email", "username", "full_name", "is_active", "role", "monthly_generations_limit"
+)
+
+class CachedUser(NamedTuple):
+    """Datos del usuario que cambian poco (el uso mensual se consulta aparte)"""
+    id: int
+    email: str
+    username: str
+    full_name: Optional[str]
+    is_active: bool
+    role: Optional[str]
+    monthly_generations_limit: int
+
+class UserCache:
+    """
+    Cache TTL por worker de los usuarios autenticados. Las rutas que solo
+    necesitan el rol, el estado o el límite del plan no consultan la base de
+    datos en cada petición. Los cambios hechos a través del ORM invalidan la
+    entrada al confirmar la transacción; el resto de workers la descartan
+    como máximo tras USER_CACHE_TTL segundos.
+    """
+
+    def __init__(self):
+        self.cache = LRUCache(settings.user_cache_max_entries)
+        self._stats_lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    def get(self, user_id: Any) -> Optional[CachedUser]:
+        """Usuario por id, o None si no existe"""
+        try:
+            user_id = int(user_id)
+        except (TypeError, ValueError):
+            return None
+
+        user = self.cache.get(user_id)
+        if user is None:
+            self._count("misses")
+            user = self._load(user_id)
+        else:
+            self._count("hits")
+        return None if user is _MISSING else user
+
+    def invalidate(self, user_id: int):
+        self.cache.delete(user_id)
+        self._count("invalidations")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        return {**stats, "entries": len(self.cache), "ttl": settings.user_cache_ttl}
+
+    def _load(self, user_id: int):
+        db_session = SessionLocal()
+        try:
+            row = db_session.query(
+                User.id, *(getattr(User, field) for field in CACHED_FIELDS)
+            ).filter(User.id == user_id).first()
+        finally:
+            db_session.close()
+
+        if row is None:
+            self.cache.set(user_id, _MISSING, _NEGATIVE_TTL)
+            return _MISSING
+
+        values = dict(zip(("id",) + CACHED_FIELDS, row))
+        values["role"] = values["role"].value if values["role"] else None
+        values["is_active"] = bool(values["is_active"])
+        values["monthly_generations_limit"] = values["monthly_generations_limit"] or 0
+        user = CachedUser(**values)
+        self.cache.set(user_id, user, settings.user_cache_ttl)
+        return user
+
+    def _count(self, name: str):
+        with self._stats_lock:
+            self._stats[name] += 1
+        metrics.count_cache("users", name)
+
+user_cache = UserCache()
+
+def _changed_users(session: Session) -> Dict[int, Set[str]]:
+    return session.info.setdefault("user_cache_changes", {})
+
+@event.listens_for(Session, "after_flush")
+def _collect_user_changes(session, flush_context):
+    """Anotar los usuarios con columnas cacheadas modificadas o borrados"""
+    changes = _changed_users(session)
+    for obj in session.dirty:
+        if isinstance(obj, User) and obj.id is not None:
+            state = inspect(obj)
+            changed = {field for field in CACHED_FIELDS if state.attrs[field].history.has_changes()}
+            if changed:
+                changes.setdefault(obj.id, set()).update(changed)
+    for obj in session.deleted:
+        if isinstance(obj, User) and obj.id is not None:
+            changes.setdefault(obj.id, set()).update(CACHED_FIELDS)
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_user_changes(session):
+    """Invalidar tras el commit para no recargar en cache los valores antiguos"""
+    changes = session.info.pop("user_cache_changes", None)
+    if not changes:
+        return
+
+    from app.services.api_key_service import api_key_service
+    from app.services.quota_service import quota_service
+
+    for user_id, fields in changes.items():
+        user_cache.invalidate(user_id)
+        # Las identidades de API key guardan el rol y el estado del usuario
+        if fields & {"role", "is_active"}:
+            api_key_service.invalidate_user(user_id)
+        # El contador de Redis guarda el límite del plan
+        if "monthly_generations_limit" in fields:
+            quota_service.invalidate(user_id)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_user_changes(session):
+    session.info.pop("user_cache_changes", None)
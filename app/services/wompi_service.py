@@ -1,71 +1,199 @@
+import asyncio
 import httpx
 import logging
-from typing import Dict, Optional
+import os
+import random
+import threading
+import time
+from typing import Any, Dict, Optional
 from app.core.config import settings
 
 logger = logging.getLogger(__name__)
 
 class WompiService:
-    def __init__(self):
+    """
+    Cliente de Wompi con conexiones persistentes (keep-alive) compartidas por
+    el proceso, timeouts y límites configurables y reintentos acotados con
+    backoff. Ofrece métodos síncronos (`*_sync`) para Flask y asíncronos.
+    Se le puede inyectar un transporte de httpx (p. ej. httpx.MockTransport)
+    para probarlo sin red.
+    """
+
+    def __init__(self, transport: Optional[httpx.BaseTransport] = None,
+                 async_transport: Optional[httpx.AsyncBaseTransport] = None):
         self.base_url = "https://sandbox.wompi.co/v1" if settings.wompi_env == "staging" else "https://production.wompi.co/v1"
         self.app_id = settings.wompi_app_id
         self.api_secret = settings.wompi_api_secret
-    
+        self.max_retries = settings.wompi_max_retries
+        self.retry_backoff = settings.wompi_retry_backoff
+        self._transport = transport
+        self._async_transport = async_transport
+        self._client: Optional[httpx.Client] = None
+        self._client_pid = None
+        self._async_client: Optional[httpx.AsyncClient] = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self) -> httpx.Client:
+        """Cliente síncrono del proceso (se recrea tras un fork)"""
+        if self._client is None or self._client_pid != os.getpid():
+            with self._lock:
+                if self._client is None or self._client_pid != os.getpid():
+                    self._client = httpx.Client(transport=self._transport, **self._client_options())
+                    self._client_pid = os.getpid()
+        return self._client
+
+    @property
+    def async_client(self) -> httpx.AsyncClient:
+        """Cliente asíncrono compartido"""
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(transport=self._async_transport, **self._client_options())
+        return self._async_client
+
+    def create_payment_link_sync(self, amount: int, description: str, user_email: str) -> Optional[Dict]:
+        """
+        Crear enlace de pago en Wompi
+        """
+        try:
+            response = self._request_sync("POST", "/payment_links",
+                                          json=self._payment_link_payload(amount, description, user_email),
+                                          idempotent=False)
+            return self._handle_payment_link(response)
+        except Exception as e:
+            logger.error(f"Error en Wompi service: {str(e)}")
+            return None
+
+    def verify_payment_sync(self, payment_id: str) -> Optional[Dict]:
+        """
+        Verificar estado de un pago
+        """
+        try:
+            response = self._request_sync("GET", f"/transactions/{payment_id}")
+            return self._handle_verification(response)
+        except Exception as e:
+            logger.error(f"Error verificando pago en Wompi: {str(e)}")
+            return None
+
     async def create_payment_link(self, amount: int, description: str, user_email: str) -> Optional[Dict]:
         """
         Crear enlace de pago en Wompi
         """
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{self.base_url}/payment_links",
-                    headers={
-                        "Authorization": f"Bearer {self.api_secret}",
-                        "Content-Type": "application/json"
-                    },
-                    json={
-                        "name": description,
-                        "description": description,
-                        "amount_in_cents": amount,
-                        "currency": "COP",
-                        "accept_partial": False,
-                        "expires_at": None,
-                        "collect_shipping": False,
-                        "customer_email": user_email
-                    }
-                )
-                
-                if response.status_code == 201:
-                    return response.json()
-                else:
-                    logger.error(f"Error creando enlace de pago: {response.text}")
-                    return None
-                    
+            response = await self._request_async("POST", "/payment_links",
+                                                 json=self._payment_link_payload(amount, description, user_email),
+                                                 idempotent=False)
+            return self._handle_payment_link(response)
         except Exception as e:
             logger.error(f"Error en Wompi service: {str(e)}")
             return None
-    
+
     async def verify_payment(self, payment_id: str) -> Optional[Dict]:
         """
         Verificar estado de un pago
         """
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    f"{self.base_url}/transactions/{payment_id}",
-                    headers={
-                        "Authorization": f"Bearer {self.api_secret}"
-                    }
-                )
-                
-                if response.status_code == 200:
-                    return response.json()
-                else:
-                    logger.error(f"Error verificando pago: {response.text}")
-                    return None
-                    
+            response = await self._request_async("GET", f"/transactions/{payment_id}")
+            return self._handle_verification(response)
         except Exception as e:
             logger.error(f"Error verificando pago en Wompi: {str(e)}")
             return None
 
-wompi_service = WompiService() 
\ No newline at end of file
+    def close(self):
+        """Cerrar el cliente síncrono"""
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+    async def aclose(self):
+        """Cerrar el cliente asíncrono"""
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+
+    def _client_options(self) -> Dict[str, Any]:
+        return {
+            "base_url": self.base_url,
+            "headers": {"Authorization": f"Bearer {self.api_secret}"},
+            "timeout": httpx.Timeout(settings.wompi_timeout, connect=settings.wompi_connect_timeout),
+            "limits": httpx.Limits(
+                max_connections=settings.wompi_max_connections,
+                max_keepalive_connections=settings.wompi_max_keepalive_connections,
+                keepalive_expiry=settings.wompi_keepalive_expiry
+            )
+        }
+
+    def _request_sync(self, method: str, path: str, idempotent: bool = True, **kwargs) -> httpx.Response:
+        attempt = 0
+        while True:
+            try:
+                response = self.client.request(method, path, **kwargs)
+                if not self._should_retry_status(response, idempotent, attempt):
+                    return response
+            except httpx.TransportError as e:
+                if not self._should_retry_error(e, idempotent, attempt):
+                    raise
+            time.sleep(self._backoff(attempt))
+            attempt += 1
+
+    async def _request_async(self, method: str, path: str, idempotent: bool = True, **kwargs) -> httpx.Response:
+        attempt = 0
+        while True:
+            try:
+                response = await self.async_client.request(method, path, **kwargs)
+                if not self._should_retry_status(response, idempotent, attempt):
+                    return response
+            except httpx.TransportError as e:
+                if not self._should_retry_error(e, idempotent, attempt):
+                    raise
+            await asyncio.sleep(self._backoff(attempt))
+            attempt += 1
+
+    def _should_retry_status(self, response: httpx.Response, idempotent: bool, attempt: int) -> bool:
+        """Los 5xx solo se reintentan en peticiones idempotentes (un POST pudo haberse procesado)"""
+        if response.status_code < 500 or not idempotent or attempt >= self.max_retries:
+            return False
+        logger.warning(f"Wompi respondió {response.status_code}, reintento {attempt + 1}/{self.max_retries}")
+        return True
+
+    def _should_retry_error(self, error: httpx.TransportError, idempotent: bool, attempt: int) -> bool:
+        """Los errores de conexión siempre son seguros de reintentar; los timeouts solo si es idempotente"""
+        if attempt >= self.max_retries:
+            return False
+        if not idempotent and not isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout)):
+            return False
+        logger.warning(f"Error de red con Wompi ({type(error).__name__}), reintento {attempt + 1}/{self.max_retries}")
+        return True
+
+    def _backoff(self, attempt: int) -> float:
+        """Backoff exponencial con jitter"""
+        delay = self.retry_backoff * (2 ** attempt)
+        return delay + random.uniform(0, delay)
+
+    @staticmethod
+    def _payment_link_payload(amount: int, description: str, user_email: str) -> Dict[str, Any]:
+        return {
+            "name": description,
+            "description": description,
+            "amount_in_cents": amount,
+            "currency": "COP",
+            "accept_partial": False,
+            "expires_at": None,
+            "collect_shipping": False,
+            "customer_email": user_email
+        }
+
+    @staticmethod
+    def _handle_payment_link(response: httpx.Response) -> Optional[Dict]:
+        if response.status_code == 201:
+            return response.json()
+        logger.error(f"Error creando enlace de pago: {response.text}")
+        return None
+
+    @staticmethod
+    def _handle_verification(response: httpx.Response) -> Optional[Dict]:
+        if response.status_code == 200:
+            return response.json()
+        logger.error(f"Error verificando pago: {response.text}")
+        return None
+
+wompi_service = WompiService()
@@ -0,0 +1,183 @@
+import atexit
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict
+from sqlalchemy import bindparam, case, or_, text, update
+from app.core.config import settings
+from app.core.database import SessionLocal, engine
+from app.models.api_key import APIKey
+from app.models.user import User
+
+logger = logging.getLogger(__name__)
+
+class WriteBehindBuffer:
+    """
+    Buffer por worker para escrituras de alta frecuencia que no limitan nada
+    (APIKey.last_used). El uso mensual no pasa por aquí: las reservas y
+    devoluciones de cuota se aplican en el momento (quota_service).
+
+    Los eventos se acumulan en memoria y se vuelcan con un UPDATE masivo
+    (UPDATE ... FROM (VALUES ...)) cada WRITE_BEHIND_FLUSH_INTERVAL segundos,
+    al llegar a WRITE_BEHIND_MAX_EVENTS eventos o al apagar el proceso.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._last_used: Dict[int, datetime] = {}
+        self._events = 0
+        self._worker_pid = None
+        self._wakeup = threading.Event()
+        self._stats = {
+            "flushes": 0,
+            "flush_errors": 0,
+            "rows_flushed": 0,
+            "last_flush_ms": 0.0,
+            "max_flush_ms": 0.0,
+            "last_flush_at": None
+        }
+
+    def record_api_key_use(self, key_id: int, used_at: datetime = None):
+        """Registrar el uso de una API key"""
+        used_at = used_at or datetime.now(timezone.utc)
+        with self._lock:
+            previous = self._last_used.get(key_id)
+            if previous is None or used_at > previous:
+                self._last_used[key_id] = used_at
+            self._events += 1
+        self._after_event()
+
+    def flush(self) -> int:
+        """Volcar los eventos pendientes. Devuelve el número de filas actualizadas"""
+        with self._flush_lock:
+            with self._lock:
+                last_used, self._last_used = self._last_used, {}
+                self._events = 0
+
+            if not last_used:
+                return 0
+
+            start = time.perf_counter()
+            try:
+                apply_updates(last_used, {})
+            except Exception as e:
+                logger.error(f"Error en volcado write-behind: {str(e)}")
+                self._requeue(last_used)
+                self._stats["flush_errors"] += 1
+                return 0
+
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            rows = len(last_used)
+            self._stats["flushes"] += 1
+            self._stats["rows_flushed"] += rows
+            self._stats["last_flush_ms"] = round(elapsed_ms, 2)
+            self._stats["max_flush_ms"] = round(max(self._stats["max_flush_ms"], elapsed_ms), 2)
+            self._stats["last_flush_at"] = datetime.now(timezone.utc).isoformat()
+            return rows
+
+    def stats(self) -> Dict[str, Any]:
+        """Profundidad de la cola y latencias de volcado"""
+        with self._lock:
+            depth = {
+                "queued_events": self._events,
+                "pending_api_keys": len(self._last_used)
+            }
+        return {**depth, **self._stats}
+
+    def _requeue(self, last_used: Dict[int, datetime]):
+        """Devolver al buffer los eventos de un volcado fallido"""
+        with self._lock:
+            for key_id, used_at in last_used.items():
+                previous = self._last_used.get(key_id)
+                if previous is None or used_at > previous:
+                    self._last_used[key_id] = used_at
+            self._events += len(last_used)
+
+    def _after_event(self):
+        self._ensure_worker()
+        if self._events >= settings.write_behind_max_events:
+            self._wakeup.set()
+
+    def _ensure_worker(self):
+        """Arrancar el hilo de volcado en este proceso (una vez por worker)"""
+        if self._worker_pid == os.getpid():
+            return
+        with self._lock:
+            if self._worker_pid == os.getpid():
+                return
+            self._worker_pid = os.getpid()
+            self._wakeup = threading.Event()
+            thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+            thread.start()
+            atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(settings.write_behind_flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error en hilo write-behind: {str(e)}")
+
+def apply_updates(last_used: Dict[int, datetime], usage_deltas: Dict[int, int]):
+    """
+    Aplicar en una transacción los last_used de API keys y los deltas de uso
+    volcados desde los contadores de Redis (sin bajar de cero: una devolución puede llegar después del reinicio mensual).
+    En PostgreSQL cada tabla se actualiza con una sola sentencia
+    UPDATE ... FROM (VALUES ...); en otros motores se usa executemany.
+    """
+    db_session = SessionLocal()
+    try:
+        if engine.dialect.name == "postgresql":
+            if last_used:
+                values, params = _values_clause(last_used, "INTEGER", "TIMESTAMPTZ")
+                db_session.execute(text(
+                    f"UPDATE api_keys SET last_used = v.value FROM (VALUES {values}) AS v(id, value) "
+                    "WHERE api_keys.id = v.id AND (api_keys.last_used IS NULL OR api_keys.last_used < v.value)"
+                ), params)
+            if usage_deltas:
+                values, params = _values_clause(usage_deltas, "INTEGER", "INTEGER")
+                db_session.execute(text(
+                    f"UPDATE users SET monthly_generations_used = GREATEST(users.monthly_generations_used + v.value, 0) "
+                    f"FROM (VALUES {values}) AS v(id, value) WHERE users.id = v.id"
+                ), params)
+        else:
+            api_keys = APIKey.__table__
+            users = User.__table__
+            if last_used:
+                db_session.execute(
+                    update(api_keys)
+                    .where(api_keys.c.id == bindparam("key_id"))
+                    .where(or_(api_keys.c.last_used.is_(None), api_keys.c.last_used < bindparam("value")))
+                    .values(last_used=bindparam("value")),
+                    [{"key_id": key_id, "value": used_at} for key_id, used_at in last_used.items()]
+                )
+            if usage_deltas:
+                db_session.execute(
+                    update(users)
+                    .where(users.c.id == bindparam("user_id"))
+                    .values(monthly_generations_used=case(
+                        (users.c.monthly_generations_used + bindparam("value") < 0, 0),
+                        else_=users.c.monthly_generations_used + bindparam("value")
+                    )),
+                    [{"user_id": user_id, "value": delta} for user_id, delta in usage_deltas.items()]
+                )
+        db_session.commit()
+    finally:
+        db_session.close()
+
+def _values_clause(rows: Dict[int, Any], id_type: str, value_type: str):
+    """Construir la lista VALUES con parámetros enlazados"""
+    values = []
+    params = {}
+    for index, (row_id, value) in enumerate(rows.items()):
+        values.append(f"(CAST(:id_{index} AS {id_type}), CAST(:value_{index} AS {value_type}))")
+        params[f"id_{index}"] = row_id
+        params[f"value_{index}"] = value
+    return ", ".join(values), params
+
+write_behind = WriteBehindBuffer()
@@ -0,0 +1 @@
+# Tareas en segundo plano (Celery)
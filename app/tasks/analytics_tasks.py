@@ -0,0 +1,18 @@
+import logging
+from app.core.celery_app import celery_app
+from app.services.analytics_service import analytics_service
+
+logger = logging.getLogger(__name__)
+
+# Lotes por ejecución: una tarea no acapara el worker; la siguiente continúa
+_MAX_BATCHES_PER_RUN = 20
+
+@celery_app.task(name="analytics.rollup_usage")
+def rollup_usage_task():
+    """Sumar las generaciones nuevas a los rollups de uso (Celery beat)"""
+    try:
+        processed = analytics_service.catch_up(max_batches=_MAX_BATCHES_PER_RUN)
+        if processed:
+            logger.info(f"Rollups de uso: {processed} generaciones procesadas")
+    except Exception as e:
+        logger.error(f"Error actualizando rollups de uso: {str(e)}")
@@ -0,0 +1,152 @@
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from sqlalchemy import and_, or_, select, update
+from app.core.celery_app import celery_app
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.generation_job import GenerationJob, JobStatus
+from app.services.openai_service import get_openai_service
+from app.services.generation_service import build_generation, generation_params
+from app.services.quota_service import quota_service
+
+logger = logging.getLogger(__name__)
+
+# Margen sobre GENERATION_JOB_TIMEOUT antes de dar un job RUNNING por abandonado
+# (desfase de reloj entre workers y tiempo hasta que Celery mata la tarea)
+_STALE_GRACE = 30
+
+def _stale_before() -> datetime:
+    """Los jobs RUNNING que empezaron antes de este momento se consideran abandonados"""
+    return datetime.now(timezone.utc) - timedelta(seconds=settings.generation_job_timeout + _STALE_GRACE)
+
+@celery_app.task(name="generation.generate_content", time_limit=settings.generation_job_timeout)
+def generate_content_task(job_id: str):
+    """
+    Ejecutar un job de generación: llamar a OpenAI y guardar la Generation.
+    La cuota se reservó al encolar y se devuelve si el job falla.
+
+    Con task_acks_late el mensaje se vuelve a entregar si el worker muere:
+    el job se reclama con un UPDATE condicional, que también acepta un job
+    RUNNING abandonado (más antiguo que GENERATION_JOB_TIMEOUT).
+    """
+    db_session = SessionLocal()
+    started_at = None
+    try:
+        started_at = _claim(db_session, job_id)
+        if started_at is None:
+            logger.warning(f"Job {job_id} no encontrado o ya procesado")
+            return
+
+        job = db_session.get(GenerationJob, job_id)
+        user_id = job.user_id
+        data = job.request_data
+        try:
+            result = get_openai_service().generate_content(**generation_params(data))
+        except Exception as e:
+            logger.error(f"Error en job {job_id}: {str(e)}")
+            _fail(db_session, job_id, started_at, "Error al generar contenido")
+            return
+
+        generation = build_generation(user_id, data, result)
+        db_session.add(generation)
+        db_session.flush()
+        completed = db_session.execute(
+            _owned(job_id, started_at).values(
+                generation_id=generation.id,
+                status=JobStatus.COMPLETED,
+                finished_at=datetime.now(timezone.utc)
+            )
+        )
+        if completed.rowcount != 1:
+            # El reaper ya lo ha dado por fallido y ha devuelto la cuota
+            db_session.rollback()
+            logger.warning(f"Job {job_id} ya no pertenece a esta ejecución, se descarta el resultado")
+            return
+        db_session.commit()
+
+        if result["cached"] and not settings.cache_hits_count_against_quota:
+            quota_service.refund(user_id)
+
+    except Exception as e:
+        logger.error(f"Error procesando job {job_id}: {str(e)}")
+        db_session.rollback()
+        if started_at is not None:
+            _fail(db_session, job_id, started_at, "Error interno procesando el job")
+    finally:
+        db_session.close()
+
+@celery_app.task(name="generation.reap_stale_jobs")
+def reap_stale_jobs_task():
+    """Marcar como fallidos los jobs RUNNING abandonados y devolver su cuota (Celery beat)"""
+    try:
+        reaped = reap_stale_jobs()
+        if reaped:
+            logger.warning(f"{reaped} jobs de generación abandonados marcados como fallidos")
+    except Exception as e:
+        logger.error(f"Error revisando jobs abandonados: {str(e)}")
+
+def reap_stale_jobs() -> int:
+    """Fallar los jobs RUNNING más antiguos que GENERATION_JOB_TIMEOUT. Devuelve cuántos"""
+    db_session = SessionLocal()
+    try:
+        stale = db_session.execute(
+            select(GenerationJob.id, GenerationJob.started_at).where(
+                GenerationJob.status == JobStatus.RUNNING,
+                GenerationJob.started_at < _stale_before()
+            )
+        ).all()
+        reaped = 0
+        for job_id, started_at in stale:
+            # Uno a uno y condicional: si el job termina o se reclama a la vez, no se toca
+            if _fail(db_session, job_id, started_at, "El job no terminó a tiempo"):
+                reaped += 1
+        return reaped
+    finally:
+        db_session.close()
+
+def _claim(db_session, job_id: str) -> Optional[datetime]:
+    """
+    Pasar el job a RUNNING si está PENDING o abandonado. Devuelve el
+    started_at que identifica esta ejecución, o None si otra lo tiene.
+    """
+    started_at = datetime.now(timezone.utc)
+    claimed = db_session.execute(
+        update(GenerationJob)
+        .where(
+            GenerationJob.id == job_id,
+            or_(
+                GenerationJob.status == JobStatus.PENDING,
+                and_(GenerationJob.status == JobStatus.RUNNING, GenerationJob.started_at < _stale_before())
+            )
+        )
+        .values(status=JobStatus.RUNNING, started_at=started_at)
+        .execution_options(synchronize_session=False)
+    )
+    db_session.commit()
+    return started_at if claimed.rowcount == 1 else None
+
+def _owned(job_id: str, started_at: datetime):
+    """UPDATE del job solo si sigue RUNNING en esta ejecución"""
+    return (
+        update(GenerationJob)
+        .where(
+            GenerationJob.id == job_id,
+            GenerationJob.status == JobStatus.RUNNING,
+            GenerationJob.started_at == started_at
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+def _fail(db_session, job_id: str, started_at: datetime, error: str) -> bool:
+    """Marcar un job como fallido y devolver la cuota reservada (una sola vez)"""
+    failed = db_session.execute(
+        _owned(job_id, started_at)
+        .values(status=JobStatus.FAILED, error=error, finished_at=datetime.now(timezone.utc))
+        .returning(GenerationJob.user_id)
+    ).first()
+    db_session.commit()
+    if failed is None:
+        return False
+    quota_service.refund(failed.user_id)
+    return True
@@ -0,0 +1,14 @@
+import logging
+from app.core.celery_app import celery_app
+from app.services.usage_reset_service import usage_reset_service
+
+logger = logging.getLogger(__name__)
+
+@celery_app.task(name="quota.reset_monthly_usage")
+def reset_monthly_usage_task():
+    """Reiniciar el uso de los usuarios cuyo periodo de facturación ha vencido (Celery beat)"""
+    try:
+        usage_reset_service.run()
+    except Exception as e:
+        # Los bloques confirmados se conservan; la siguiente ejecución sigue con el resto
+        logger.error(f"Error en el reinicio mensual de uso: {str(e)}")
@@ -0,0 +1,18 @@
+import logging
+from app.core.celery_app import celery_app
+from app.services.search_service import search_service
+
+logger = logging.getLogger(__name__)
+
+# Lotes por ejecución: una tarea no acapara el worker; la siguiente continúa
+_MAX_BATCHES_PER_RUN = 20
+
+@celery_app.task(name="search.index_generations")
+def index_generations_task():
+    """Añadir las generaciones nuevas al índice de búsqueda (Celery beat)"""
+    try:
+        indexed = search_service.catch_up(max_batches=_MAX_BATCHES_PER_RUN)
+        if indexed:
+            logger.info(f"Índice de búsqueda: {indexed} generaciones indexadas")
+    except Exception as e:
+        logger.error(f"Error indexando generaciones: {str(e)}")
@@ -0,0 +1,5 @@
+# ASGI entry point (generación asíncrona)
+# gunicorn asgi:application -k uvicorn.workers.UvicornWorker -c gunicorn.conf.py
+from app.asgi import application
+
+__all__ = ["application"]
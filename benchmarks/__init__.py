@@ -0,0 +1 @@
+# Benchmarks de extremo a extremo de la API
@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+"""
+Benchmark de extremo a extremo de la API.
+
+Arranca `app.main:app` con gunicorn, el proveedor de IA simulado y una base
+de datos SQLite temporal, y lanza usuarios concurrentes contra login,
+generate, generations y me. Emite JSON con throughput y latencias p50/p95/p99
+por ruta, para comparar clases y número de workers de gunicorn.
+
+Ejemplos:
+    python -m benchmarks.run --duration 30 --concurrency 16
+    python -m benchmarks.run --matrix sync:1,sync:2,gthread:2 --output resultados.json
+    python -m benchmarks.run --matrix sync:1,uvicorn:1 --concurrency 64
+"""
+
+import argparse
+import json
+import os
+import random
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+PASSWORD = "benchmark-password"
+CONTENT_TYPES = ["post_social", "email", "description", "title", "blog_post"]
+LENGTHS = ["corta", "media", "larga"]
+DEFAULT_MIX = "login:1,generate:3,generations:3,me:3"
+
+def log(message: str):
+    """Mensajes de progreso por stderr para no mezclarlos con el JSON"""
+    print(message, file=sys.stderr, flush=True)
+
+def parse_mix(value: str) -> List[Tuple[str, int]]:
+    """Convertir "ruta:peso,ruta:peso" en una lista de pesos"""
+    mix = []
+    for item in value.split(","):
+        name, _, weight = item.partition(":")
+        if name.strip() not in ROUTES:
+            raise SystemExit(f"Ruta desconocida en --mix: {name}")
+        mix.append((name.strip(), int(weight or 1)))
+    return mix
+
+def parse_matrix(value: str) -> List[Tuple[str, int]]:
+    """Convertir "clase:workers,clase:workers" en configuraciones de gunicorn"""
+    configs = []
+    for item in value.split(","):
+        worker_class, _, workers = item.partition(":")
+        configs.append((worker_class.strip(), int(workers or 1)))
+    return configs
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Percentil por rango más cercano"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+class Server:
+    """Proceso gunicorn con base de datos temporal y proveedor simulado"""
+
+    def __init__(self, args, worker_class: str, workers: int):
+        self.args = args
+        self.worker_class = worker_class
+        self.workers = workers
+        self.port = free_port()
+        self.base_url = f"http://127.0.0.1:{self.port}"
+        self.tmpdir = tempfile.TemporaryDirectory(prefix="gcai-bench-")
+        self.db_path = os.path.join(self.tmpdir.name, "bench.db")
+        self.process = None
+
+    def env(self) -> Dict[str, str]:
+        env = dict(os.environ)
+        env.update({
+            "DATABASE_URL": f"sqlite:///{self.db_path}",
+            "AI_PROVIDERS": f"mock=mock:mock-model?latency_ms={self.args.mock_latency_ms}"
+                            f"&p95_ms={self.args.mock_p95_ms}&error_rate={self.args.mock_error_rate}",
+            "AI_ROUTES": "",
+            "CACHE_REDIS_ENABLED": "False",
+            "QUOTA_REDIS_ENABLED": "False",
+            "SINGLEFLIGHT_REDIS_ENABLED": "False",
+            "DEBUG": "False"
+        })
+        return env
+
+    def start(self):
+        # "uvicorn" sirve el punto de entrada ASGI (asgi.py) con workers asíncronos
+        asgi = self.worker_class == "uvicorn"
+        command = [
+            sys.executable, "-m", "gunicorn", "asgi:application" if asgi else "app.main:app",
+            "-c", str(ROOT / "gunicorn.conf.py"),
+            "--bind", f"127.0.0.1:{self.port}",
+            "--workers", str(self.workers),
+            "--worker-class", "uvicorn.workers.UvicornWorker" if asgi else self.worker_class,
+            "--threads", str(self.args.threads),
+            "--access-logfile", "/dev/null",
+            "--log-level", "warning"
+        ]
+        log(f"Arrancando gunicorn ({self.worker_class}, {self.workers} workers) en {self.base_url}")
+        self.process = subprocess.Popen(command, cwd=ROOT, env=self.env(),
+                                        stdout=subprocess.DEVNULL, stderr=sys.stderr)
+        deadline = time.monotonic() + self.args.startup_timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise SystemExit("gunicorn terminó durante el arranque")
+            try:
+                if httpx.get(f"{self.base_url}/health", timeout=1).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.2)
+        self.stop()
+        raise SystemExit("gunicorn no respondió a /health a tiempo")
+
+    def stop(self):
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        self.tmpdir.cleanup()
+
+    def raise_quotas(self):
+        """Quitar el límite del plan gratuito a los usuarios del benchmark"""
+        with sqlite3.connect(self.db_path) as connection:
+            connection.execute("UPDATE users SET monthly_generations_limit = 1000000000")
+
+class VirtualUser:
+    """Un cliente con su propia conexión keep-alive y su token JWT"""
+
+    def __init__(self, base_url: str, index: int, args, rng: random.Random):
+        self.client = httpx.Client(base_url=base_url, timeout=args.request_timeout)
+        self.email = f"bench{index}@example.com"
+        self.index = index
+        self.args = args
+        self.rng = rng
+        self.token = None
+        self.counter = 0
+
+    def register(self):
+        response = self.client.post("/api/v1/auth/register", json={
+            "email": self.email, "username": f"bench{self.index}", "password": PASSWORD
+        })
+        if response.status_code not in (200, 201, 400):
+            raise SystemExit(f"No se pudo registrar el usuario de benchmark: {response.status_code} {response.text}")
+
+    def headers(self) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {self.token}"} if self.token else {}
+
+    def close(self):
+        self.client.close()
+
+def route_login(user: VirtualUser) -> httpx.Response:
+    response = user.client.post("/api/v1/auth/login", json={"email": user.email, "password": PASSWORD})
+    if response.status_code == 200:
+        user.token = response.json()["access_token"]
+    return response
+
+def route_generate(user: VirtualUser) -> httpx.Response:
+    user.counter += 1
+    if user.args.topic_pool:
+        topic = f"Tema {user.rng.randrange(user.args.topic_pool)}"
+    else:
+        topic = f"Tema {user.index}-{user.counter}"
+    return user.client.post("/api/v1/generate", headers=user.headers(), json={
+        "content_type": user.rng.choice(CONTENT_TYPES),
+        "topic": topic,
+        "tone": "profesional",
+        "length": user.rng.choice(LENGTHS)
+    })
+
+def route_generations(user: VirtualUser) -> httpx.Response:
+    return user.client.get("/api/v1/generations", headers=user.headers(), params={"limit": 10})
+
+def route_me(user: VirtualUser) -> httpx.Response:
+    return user.client.get("/api/v1/auth/me", headers=user.headers())
+
+ROUTES = {
+    "login": route_login,
+    "generate": route_generate,
+    "generations": route_generations,
+    "me": route_me
+}
+
+class Recorder:
+    """Latencias y errores por ruta, compartido entre hilos"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies: Dict[str, List[float]] = {name: [] for name in ROUTES}
+        self.errors: Dict[str, int] = {name: 0 for name in ROUTES}
+        self.statuses: Dict[str, Dict[str, int]] = {name: {} for name in ROUTES}
+
+    def record(self, route: str, latency_ms: float, status: Optional[int]):
+        ok = status is not None and status < 400
+        key = str(status) if status is not None else "error"
+        with self._lock:
+            if ok:
+                self.latencies[route].append(latency_ms)
+            else:
+                self.errors[route] += 1
+            self.statuses[route][key] = self.statuses[route].get(key, 0) + 1
+
+    def summary(self, duration: float) -> Dict[str, Any]:
+        routes = {}
+        all_latencies = []
+        total_errors = 0
+        for route, latencies in self.latencies.items():
+            values = sorted(latencies)
+            all_latencies.extend(values)
+            total_errors += self.errors[route]
+            if not values and not self.errors[route]:
+                continue
+            routes[route] = self._stats(values, self.errors[route], duration)
+            routes[route]["status_codes"] = self.statuses[route]
+        return {"routes": routes, "total": self._stats(sorted(all_latencies), total_errors, duration)}
+
+    @staticmethod
+    def _stats(values: List[float], errors: int, duration: float) -> Dict[str, Any]:
+        count = len(values) + errors
+        return {
+            "requests": count,
+            "errors": errors,
+            "error_rate": round(errors / count, 4) if count else 0.0,
+            "throughput_rps": round(len(values) / duration, 2) if duration else 0.0,
+            "mean_ms": round(sum(values) / len(values), 2) if values else 0.0,
+            "p50_ms": round(percentile(values, 0.50), 2),
+            "p95_ms": round(percentile(values, 0.95), 2),
+            "p99_ms": round(percentile(values, 0.99), 2),
+            "max_ms": round(values[-1], 2) if values else 0.0
+        }
+
+def drive(user: VirtualUser, mix: List[Tuple[str, int]], recorder: Optional[Recorder],
+          stop_at: float, stop_event: threading.Event):
+    """Bucle de un usuario virtual hasta `stop_at`"""
+    names = [name for name, _ in mix]
+    weights = [weight for _, weight in mix]
+    while time.monotonic() < stop_at and not stop_event.is_set():
+        route = "login" if user.token is None else user.rng.choices(names, weights)[0]
+        start = time.perf_counter()
+        try:
+            status = ROUTES[route](user).status_code
+        except httpx.HTTPError:
+            status = None
+        if recorder is not None:
+            recorder.record(route, (time.perf_counter() - start) * 1000, status)
+
+def run_phase(users: List[VirtualUser], mix, seconds: float, recorder: Optional[Recorder]) -> float:
+    stop_event = threading.Event()
+    stop_at = time.monotonic() + seconds
+    threads = [threading.Thread(target=drive, args=(user, mix, recorder, stop_at, stop_event), daemon=True)
+               for user in users]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    try:
+        for thread in threads:
+            thread.join()
+    except KeyboardInterrupt:
+        stop_event.set()
+        raise
+    return time.perf_counter() - start
+
+def run_config(args, worker_class: str, workers: int) -> Dict[str, Any]:
+    server = Server(args, worker_class, workers)
+    server.start()
+    users = []
+    try:
+        users = [VirtualUser(server.base_url, index, args, random.Random(f"{args.seed}:{index}"))
+                 for index in range(args.concurrency)]
+        for user in users:
+            user.register()
+        server.raise_quotas()
+
+        mix = parse_mix(args.mix)
+        if args.warmup:
+            log(f"Calentamiento {args.warmup}s")
+            run_phase(users, mix, args.warmup, None)
+
+        log(f"Midiendo {args.duration}s con {args.concurrency} usuarios concurrentes")
+        recorder = Recorder()
+        elapsed = run_phase(users, mix, args.duration, recorder)
+        return {
+            "config": {
+                "worker_class": worker_class,
+                "workers": workers,
+                "threads": args.threads,
+                "concurrency": args.concurrency,
+                "duration_s": args.duration,
+                "warmup_s": args.warmup,
+                "mix": args.mix,
+                "topic_pool": args.topic_pool,
+                "mock_latency_ms": args.mock_latency_ms,
+                "mock_p95_ms": args.mock_p95_ms,
+                "mock_error_rate": args.mock_error_rate
+            },
+            "elapsed_s": round(elapsed, 3),
+            **recorder.summary(elapsed)
+        }
+    finally:
+        for user in users:
+            user.close()
+        server.stop()
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Benchmark de extremo a extremo de la API")
+    parser.add_argument("--matrix", default="gthread:1",
+                        help="Configuraciones de gunicorn 'clase:workers' separadas por comas; "
+                             "la clase 'uvicorn' usa asgi.py (default: gthread:1)")
+    parser.add_argument("--threads", type=int, default=4, help="Hilos por worker (clase gthread)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Usuarios virtuales concurrentes")
+    parser.add_argument("--duration", type=float, default=20.0, help="Segundos de medición por configuración")
+    parser.add_argument("--warmup", type=float, default=3.0, help="Segundos de calentamiento sin medir")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Peso de cada ruta (default: {DEFAULT_MIX})")
+    parser.add_argument("--topic-pool", type=int, default=0,
+                        help="Número de temas distintos a generar (0 = siempre distintos, sin aciertos de cache)")
+    parser.add_argument("--mock-latency-ms", type=float, default=300.0, help="Mediana de latencia del proveedor simulado")
+    parser.add_argument("--mock-p95-ms", type=float, default=800.0, help="p95 de latencia del proveedor simulado")
+    parser.add_argument("--mock-error-rate", type=float, default=0.0, help="Tasa de error del proveedor simulado")
+    parser.add_argument("--request-timeout", type=float, default=60.0, help="Timeout por petición (segundos)")
+    parser.add_argument("--startup-timeout", type=float, default=60.0, help="Espera máxima al arranque de gunicorn")
+    parser.add_argument("--seed", default="42", help="Semilla de la carga de trabajo")
+    parser.add_argument("--output", help="Fichero donde escribir el JSON (por defecto, stdout)")
+    return parser
+
+def main(argv: Optional[List[str]] = None):
+    args = build_parser().parse_args(argv)
+    parse_mix(args.mix)
+    started_at = datetime.now(timezone.utc).isoformat()
+
+    results = []
+    for worker_class, workers in parse_matrix(args.matrix):
+        results.append(run_config(args, worker_class, workers))
+        total = results[-1]["total"]
+        log(f"{worker_class}/{workers}: {total['throughput_rps']} req/s, "
+            f"p50 {total['p50_ms']} ms, p95 {total['p95_ms']} ms, p99 {total['p99_ms']} ms")
+
+    report = {
+        "benchmark": "api-e2e",
+        "started_at": started_at,
+        "git_commit": git_commit(),
+        "python": sys.version.split()[0],
+        "results": results
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + "\n")
+        log(f"Resultados escritos en {args.output}")
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
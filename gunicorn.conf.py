@@ -1,7 +1,15 @@
 # Configuración de Gunicorn para optimizar el inicio
+import glob
+import os
+import shutil
+import tempfile
+from decouple import config as _config
+
 bind = "0.0.0.0:8000"
 workers = 1
-worker_class = "sync"
+# Hilos por worker: una petición que espera (hash de contraseña, IA) no bloquea al resto
+worker_class = "gthread"
+threads = _config("GUNICORN_THREADS", default=4, cast=int)
 worker_connections = 1000
 timeout = 30
 keepalive = 2
@@ -11,4 +19,46 @@ preload_app = True
 reload = False
 accesslog = "-"
 errorlog = "-"
-loglevel = "info" 
\ No newline at end of file
+loglevel = "info" 
+
+# Métricas de Prometheus compartidas entre workers. Tiene que estar en el
+# entorno antes de cargar la app (preload_app) y empezar vacío en cada arranque
+_metrics_dir = _config("PROMETHEUS_MULTIPROC_DIR", default="")
+_own_metrics_dir = not _metrics_dir
+if _own_metrics_dir:
+    _metrics_dir = os.path.join(tempfile.gettempdir(), f"gcai-metrics-{os.getpid()}")
+os.environ["PROMETHEUS_MULTIPROC_DIR"] = _metrics_dir
+os.makedirs(_metrics_dir, exist_ok=True)
+for _path in glob.glob(os.path.join(_metrics_dir, "*.db")):
+    os.remove(_path)
+
+def when_ready(server):
+    """Cargar en el máster las dependencias pesadas: los workers las heredan al hacer fork"""
+    from app.core.metrics import mark_process_dead
+    from app.core.startup import warm_up
+    server.log.info(f"Dependencias precargadas (ms): {warm_up()}")
+    # El máster no atiende peticiones: sus gauges (pool de la comprobación del esquema) no cuentan
+    mark_process_dead(os.getpid())
+
+def post_fork(server, worker):
+    """No reutilizar en el worker las conexiones abiertas por el máster (comprobación del esquema)"""
+    from app.core import metrics
+    from app.core.database import engine
+    engine.dispose(close=False)
+    metrics.observe_pool(engine.pool)
+
+def child_exit(server, worker):
+    """Descartar en /metrics los gauges del worker que ha terminado"""
+    from app.core.metrics import mark_process_dead
+    mark_process_dead(worker.pid)
+
+def worker_exit(server, worker):
+    """Volcar el buffer write-behind y cerrar el pool de hashing antes de que el worker termine"""
+    from app.services.password_service import password_hasher
+    from app.services.write_behind import write_behind
+    write_behind.flush()
+    password_hasher.shutdown()
+
+def on_exit(server):
+    if _own_metrics_dir:
+        shutil.rmtree(_metrics_dir, ignore_errors=True)